@@ -0,0 +1,57 @@
+##################################################################################
+# Bulk building benchmark
+##################################################################################
+
+# Compares building a map, an ordered map and a vector from a list with a loop
+# of puts and with a single into, which fills a transient in place. Both
+# versions first build the same list of elements. The table shows the best
+# time of each version and the speedup of into.
+#
+# usage: python benchmarks/bulk.py [-n RUNS] [-s SIZE] [engine ...]
+
+from engines import RUNNERS, best_time
+
+import argparse
+
+ELEMENTS = """(mut l []); (mut i 0);
+(while (< i %(n)d) (set l (push [(%% (* i 7919) %(n)d) i] l)); (set i (+ i 1)));
+"""
+
+PUTS = {
+    "map": """(mut m {}); (mut r l);
+(while r (set m (put m (head (head r)) (head (tail (head r))))); (set r (tail r)));
+(get m 0)""",
+    "ordered": """(mut m (ordered {})); (mut r l);
+(while r (set m (put m (head (head r)) (head (tail (head r))))); (set r (tail r)));
+(get m 0)""",
+    "vector": """(mut v (vec [])); (mut r l); (set i 0);
+(while r (set v (put v i (head r))); (set i (+ i 1)); (set r (tail r)));
+(get v 0)""",
+}
+
+INTO = {
+    "map": """(get (into {} l) 0)""",
+    "ordered": """(get (into (ordered {}) l) 0)""",
+    "vector": """(get (into (vec []) l) 0)""",
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per program and engine")
+    parser.add_argument("-s", dest="size", type=int, default=2000,
+                        help="number of elements per program")
+    parser.add_argument(dest="engines", nargs="*", default=list(RUNNERS),
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-8s %-8s %12s %12s %10s" % ("program", "engine", "put", "into", "speedup")
+    print(header)
+    print("-" * len(header))
+    for name in PUTS:
+        puts = (ELEMENTS + PUTS[name]) % {"n": args.size}
+        into = (ELEMENTS + INTO[name]) % {"n": args.size}
+        for e in args.engines:
+            p = best_time(RUNNERS[e], puts, args.runs)
+            t = best_time(RUNNERS[e], into, args.runs)
+            print("%-8s %-8s %11.3fs %11.3fs %9.1fx" % (name, e, p, t, p / t))
@@ -0,0 +1,59 @@
+##################################################################################
+# Call overhead benchmark
+##################################################################################
+
+# Measures the cost of a swim call on the evaluator. The program declares a
+# number of unrelated variables and then runs a deep, non-tail recursion, so a
+# call whose cost grows with the size of the enclosing environment shows up as
+# a slowdown in the larger environments. The variables are declared at the
+# top level, or as locals of a function that defines the recursive function as
+# a closure over one of them.
+#
+# usage: python benchmarks/calls.py [-n RUNS] [-d DEPTH] [engine ...]
+
+from engines import RUNNERS, best_time
+
+import argparse
+
+ENV_SIZES = [0, 10, 100, 1000]
+
+SRC = {
+    "top": """%s
+(fun depth n: (if (== n 0) 0 (+ 1 (depth (- n 1)))));
+(depth %d)
+""",
+    "local": """(fun outer:
+(let base 0);
+%s
+(fun depth n: (if (== n 0) base (+ 1 (depth (- n 1)))));
+(depth %d));
+(outer)
+""",
+}
+
+
+def program(scope, env_size, depth):
+    lets = "".join("(let v%d %d);\n" % (i, i) for i in range(env_size))
+    return SRC[scope] % (lets, depth)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per environment size and engine")
+    parser.add_argument("-d", dest="depth", type=int, default=5000,
+                        help="recursion depth")
+    parser.add_argument(dest="engines", nargs="*", default=["eval"],
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-8s%-10s" % ("scope", "env size") + "".join("%16s" % e for e in args.engines)
+    print(header)
+    print("-" * len(header))
+    for scope in SRC:
+        for size in ENV_SIZES:
+            src = program(scope, size, args.depth)
+            row = "%-8s%-10d" % (scope, size)
+            for e in args.engines:
+                elapsed = best_time(RUNNERS[e], src, args.runs)
+                row += "%11.2fus/call" % (elapsed / args.depth * 1e6)
+            print(row)
@@ -0,0 +1,83 @@
+##################################################################################
+# Engine benchmark
+##################################################################################
+
+# Runs every program in examples/ on each execution engine and reports the best
+# wall clock time of several runs. Program output is discarded.
+#
+# usage: python benchmarks/engines.py [-n RUNS] [engine ...]
+
+from swimlang.tokenizer import Tokenizer
+from swimlang.parser import Parser
+from swimlang.evaluator import Evaluator
+from swimlang.stack_evaluator import StackEvaluator
+from swimlang.compiler import Compiler
+from swimlang.vm import VM
+from swimlang.closure_compiler import ClosureCompiler
+from swimlang.codegen import Codegen
+from swimlang.util import deep_call
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+
+EXAMPLES = os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), "..", "examples")
+
+RUNNERS = {
+    "eval": lambda ast: Evaluator()(ast),
+    "stack": lambda ast: StackEvaluator()(ast),
+    "vm": lambda ast: VM()(Compiler()(ast)),
+    "closure": lambda ast: ClosureCompiler()(ast)(),
+    "python": lambda ast: (Codegen()(ast) or ClosureCompiler()(ast))(),
+}
+
+
+def best_time(runner, src, runs):
+    # Deep programs run on a large stack, as with swim.
+    return deep_call(best_run, runner, src, runs)
+
+
+def best_run(runner, src, runs):
+    best = None
+    for _ in range(runs):
+        ast = Parser(Tokenizer(src).tokenize()).parse()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            runner(ast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per program and engine")
+    parser.add_argument(dest="engines", nargs="*", default=list(RUNNERS),
+                        help="engines to compare against eval")
+    args = parser.parse_args()
+    engines = ["eval"] + [e for e in args.engines if e != "eval"]
+    header = "%-22s" % "program" + "".join("%14s" % e for e in engines)
+    print(header)
+    print("-" * len(header))
+    totals = {e: 0.0 for e in engines}
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.sl"))):
+        with open(path) as f:
+            src = f.read()
+        times = {e: best_time(RUNNERS[e], src, args.runs) for e in engines}
+        row = "%-22s" % os.path.basename(path)
+        for e in engines:
+            totals[e] += times[e]
+            row += "%9.2fms" % (times[e] * 1000)
+            row += "    " if e == "eval" else " %3.1fx" % (times["eval"] / times[e])
+        print(row)
+    print("-" * len(header))
+    row = "%-22s" % "total"
+    for e in engines:
+        row += "%9.2fms" % (totals[e] * 1000)
+        row += "    " if e == "eval" else " %3.1fx" % (totals["eval"] / totals[e])
+    print(row)
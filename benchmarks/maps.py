@@ -0,0 +1,64 @@
+##################################################################################
+# Map benchmark
+##################################################################################
+
+# Runs programs that build large maps with put and read them back with get on
+# each engine and reports the best wall clock time of several runs: with
+# sequential int keys, with string keys, counting the words of a list the way
+# examples/map_reduce.sl does, reading the first keys of a map, and on an
+# ordered map, putting, removing and reading keys in ranges with between.
+#
+# usage: python benchmarks/maps.py [-n RUNS] [-s SIZE] [engine ...]
+
+from engines import RUNNERS, best_time
+
+import argparse
+
+PROGRAMS = {
+    "ints": """(mut m {}); (mut i 0);
+(while (< i %(n)d) (set m (put m i i)); (set i (+ i 1)));
+(mut s 0); (set i 0);
+(while (< i %(n)d) (set s (+ s (get m i))); (set i (+ i 1)));
+s""",
+    "strings": """(mut m {}); (mut k ""); (mut i 0);
+(while (< i %(n)d) (set k (+ k "x")); (set m (put m k i)); (set i (+ i 1)));
+(mut s 0); (set k ""); (set i 0);
+(while (< i %(n)d) (set k (+ k "x")); (set s (+ s (get m k))); (set i (+ i 1)));
+s""",
+    "count": """(mut words []); (mut i 0);
+(while (< i %(n)d) (set words (push (%% (* i 7) 101) words)); (set i (+ i 1)));
+(fun count l m: (if l (count (tail l) (put m (head l) (+ 1 (get m (head l))))) m));
+(mut zeros {}); (set i 0);
+(while (< i 101) (set zeros (put zeros i 0)); (set i (+ i 1)));
+(get (count words zeros) 0)""",
+    "keys": """(mut m {}); (mut i 0);
+(while (< i %(n)d) (set m (put m i i)); (set i (+ i 1)));
+(mut s 0); (set i 0);
+(while (< i %(n)d) (set s (+ s (head (tail (keys m))))); (set i (+ i 1)));
+s""",
+    "ordered": """(mut m (ordered {})); (mut i 0);
+(while (< i %(n)d) (set m (put m (%% (* i 7919) %(n)d) i)); (set i (+ i 1)));
+(set i 0);
+(while (< i %(n)d) (set m (remove m i)); (set i (+ i 2)));
+(mut s 0); (set i 0);
+(while (< i %(n)d) (set s (+ s (head (between m i (+ i 10))))); (set i (+ i 10)));
+s""",
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per program and engine")
+    parser.add_argument("-s", dest="size", type=int, default=2000,
+                        help="number of puts per program")
+    parser.add_argument(dest="engines", nargs="*", default=list(RUNNERS),
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-8s" % "program" + "".join(["%10s" % e for e in args.engines])
+    print(header)
+    print("-" * len(header))
+    for name, src in PROGRAMS.items():
+        src = src % {"n": args.size}
+        times = [best_time(RUNNERS[e], src, args.runs) for e in args.engines]
+        print("%-8s" % name + "".join(["%9.3fs" % t for t in times]))
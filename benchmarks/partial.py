@@ -0,0 +1,53 @@
+##################################################################################
+# Partial application benchmark
+##################################################################################
+
+# Measures the cost of currying: a four-parameter function is applied one
+# argument at a time in a loop, so every iteration makes three partial
+# applications and one saturating call. The function declares a number of
+# locals in a branch that is never taken, so they only enlarge its frame,
+# which a partial application that copies the frame pays for on every
+# application.
+#
+# usage: python benchmarks/partial.py [-n RUNS] [-i ITERATIONS] [engine ...]
+
+from engines import RUNNERS, best_time
+
+import argparse
+
+LOCALS = [0, 10, 100]
+
+SRC = """(fun add4 a b c d: (if False (%s) 0); (+ a (+ b (+ c d))));
+(mut i 0);
+(mut s 0);
+(while (< i %d)
+  (set s (+ s ((((add4 i) 1) 2) 3)));
+  (set i (+ i 1)));
+s
+"""
+
+
+def program(nlocals, iterations):
+    lets = "; ".join("(let v%d %d)" % (i, i) for i in range(nlocals)) or "0"
+    return SRC % (lets, iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per number of locals and engine")
+    parser.add_argument("-i", dest="iterations", type=int, default=5000,
+                        help="loop iterations")
+    parser.add_argument(dest="engines", nargs="*", default=["eval"],
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-10s" % "locals" + "".join("%16s" % e for e in args.engines)
+    print(header)
+    print("-" * len(header))
+    for n in LOCALS:
+        src = program(n, args.iterations)
+        row = "%-10d" % n
+        for e in args.engines:
+            elapsed = best_time(RUNNERS[e], src, args.runs)
+            row += "%11.2fus/iter" % (elapsed / args.iterations * 1e6)
+        print(row)
@@ -0,0 +1,64 @@
+##################################################################################
+# Step budget benchmark
+##################################################################################
+
+# Measures the overhead of counting steps against a budget: each program runs
+# on each engine without a budget and with a budget too large to be exceeded,
+# and the table shows the best time of both and the relative difference. The
+# python engine runs budgeted programs on the closure compiler, so it is not
+# measured.
+#
+# usage: python benchmarks/steps.py [-n RUNS] [engine ...]
+
+from engines import best_time
+from swimlang.evaluator import Evaluator
+from swimlang.stack_evaluator import StackEvaluator
+from swimlang.compiler import Compiler
+from swimlang.vm import VM
+from swimlang.closure_compiler import ClosureCompiler
+
+import argparse
+
+MAX_STEPS = 10**15
+
+RUNNERS = {
+    "eval": lambda steps: lambda ast: Evaluator(max_steps=steps)(ast),
+    "stack": lambda steps: lambda ast: StackEvaluator(max_steps=steps)(ast),
+    "vm": lambda steps: lambda ast: VM(max_steps=steps)(Compiler()(ast)),
+    "closure": lambda steps: lambda ast: ClosureCompiler(max_steps=steps)(ast)(),
+}
+
+PROGRAMS = {
+    "loops": """(mut i 0); (mut j 0); (mut s 0);
+(while (< i 100)
+  (set j 0);
+  (while (< j 1000) (set s (+ s j)); (set j (+ j 1)));
+  (set i (+ i 1)));
+s""",
+    "calls": """(fun fib n: (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))));
+(fib 18)""",
+    "mixed": """(fun step x: (if (% x 2) (+ (* 3 x) 1) (/ x 2)));
+(fun steps x: (mut n 0); (mut y x); (while (!= y 1) (set y (step y)); (set n (+ n 1))); n);
+(mut i 1); (mut s 0);
+(while (< i 300) (set s (+ s (steps i))); (set i (+ i 1)));
+s""",
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per program, engine and budget")
+    parser.add_argument(dest="engines", nargs="*", default=list(RUNNERS),
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-8s %-8s %12s %12s %10s" % ("program", "engine", "unbudgeted", "budgeted",
+                                           "overhead")
+    print(header)
+    print("-" * len(header))
+    for name, src in PROGRAMS.items():
+        for e in args.engines:
+            plain = best_time(RUNNERS[e](None), src, args.runs)
+            counted = best_time(RUNNERS[e](MAX_STEPS), src, args.runs)
+            print("%-8s %-8s %11.3fs %11.3fs %+9.1f%%" % (name, e, plain, counted,
+                                                        (counted / plain - 1) * 100))
@@ -0,0 +1,61 @@
+##################################################################################
+# Vector benchmark
+##################################################################################
+
+# Compares lists and vectors on programs that index into them and update them
+# by position. The list versions walk to an index with repeated tail and copy
+# the elements before it to update it, the vector versions use get and put.
+# The table shows the best time of each version and the speedup of vectors.
+#
+# usage: python benchmarks/vectors.py [-n RUNS] [engine ...]
+
+from engines import RUNNERS, best_time
+
+import argparse
+
+N = 300
+
+LISTS = {
+    "index": """(fun nth l i: (if (== i 0) (head l) (nth (tail l) (- i 1))));
+(fun range n: (mut l []); (mut i n); (while (> i 0) (set i (- i 1)); (set l (push i l))); l);
+(let l (range %d));
+(mut i 0); (mut s 0);
+(while (< i %d) (set s (+ s (nth l i))); (set i (+ i 1)));
+s""" % (N, N),
+    "update": """(fun assoc l i v: (if (== i 0) (push v (tail l)) (push (head l) (assoc (tail l) (- i 1) v))));
+(fun range n: (mut l []); (mut i n); (while (> i 0) (set i (- i 1)); (set l (push i l))); l);
+(mut l (range %d));
+(mut i 0);
+(while (< i %d) (set l (assoc l (%% (* i 7) %d) i)); (set i (+ i 1)));
+(head l)""" % (N, N, N),
+}
+
+VECTORS = {
+    "index": """(fun range n: (mut l (vec [])); (mut i 0); (while (< i n) (set l (put l i i)); (set i (+ i 1))); l);
+(let l (range %d));
+(mut i 0); (mut s 0);
+(while (< i %d) (set s (+ s (get l i))); (set i (+ i 1)));
+s""" % (N, N),
+    "update": """(fun range n: (mut l (vec [])); (mut i 0); (while (< i n) (set l (put l i i)); (set i (+ i 1))); l);
+(mut l (range %d));
+(mut i 0);
+(while (< i %d) (set l (put l (%% (* i 7) %d) i)); (set i (+ i 1)));
+(head l)""" % (N, N, N),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=5,
+                        help="runs per program and engine")
+    parser.add_argument(dest="engines", nargs="*", default=list(RUNNERS),
+                        help="engines to measure")
+    args = parser.parse_args()
+    header = "%-8s %-8s %12s %12s %10s" % ("program", "engine", "list", "vector", "speedup")
+    print(header)
+    print("-" * len(header))
+    for name in LISTS:
+        for e in args.engines:
+            l = best_time(RUNNERS[e], LISTS[name], args.runs)
+            v = best_time(RUNNERS[e], VECTORS[name], args.runs)
+            print("%-8s %-8s %11.3fs %11.3fs %9.1fx" % (name, e, l, v, l / v))
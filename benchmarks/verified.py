@@ -0,0 +1,106 @@
+##################################################################################
+# Verified mode benchmark
+##################################################################################
+
+# Runs every program in examples/, and a loop that makes a closure, a list and
+# a map on every iteration, with the usual checks and in verified mode
+# (swim -O), and reports the best wall clock time of several runs of each
+# step. Building the tree is timed from the tokens and includes the
+# optimization passes; in verified mode it is done without the node
+# constructor checks and includes checking the tree once with verify. Running
+# the tree is timed separately; in verified mode the lists, maps and closures
+# it makes are built without the constructor checks too. Program output is
+# discarded.
+#
+# usage: python benchmarks/verified.py [-n RUNS] [eval|stack]
+
+from engines import EXAMPLES
+from swimlang.tokenizer import Tokenizer
+from swimlang.parser import Parser
+from swimlang.optimizer import Optimizer
+from swimlang.inliner import Inliner
+from swimlang.cse import CSE
+from swimlang.evaluator import Evaluator
+from swimlang.stack_evaluator import StackEvaluator
+from swimlang.verifier import verify
+from swimlang.util import deep_call
+import swimlang.ast as nodes
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+
+# Makes a partial application, a list and a map on every iteration
+CLOSURES = """(fun add3 a b c: (+ a (* b c))); (mut i 0); (mut l []); (mut m {});
+(while (< i 5000) (set l (push (((add3 i) 2) 3) l)); (set m (put m (% i 97) i));
+(set i (+ i 1))); (head l)"""
+
+ENGINES = {
+    "eval": Evaluator,
+    "stack": StackEvaluator,
+}
+
+
+def best_times(engine, src, verified, runs):
+    # Returns the best times of building and of running the tree of src, on a large stack.
+    return deep_call(best_runs, engine, src, verified, runs)
+
+
+def best_runs(engine, src, verified, runs):
+    tokens = Tokenizer(src).tokenize()
+    best_build = best_run = None
+    nodes.CHECKS = not verified
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            tree = CSE()(Inliner()(Optimizer()(Parser(tokens).parse())))
+            if verified:
+                verify(tree)
+            built = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                engine()(tree)
+            done = time.perf_counter()
+            best_build = built - start if best_build is None else min(best_build, built - start)
+            best_run = done - built if best_run is None else min(best_run, done - built)
+    finally:
+        nodes.CHECKS = True
+    return best_build, best_run
+
+
+def saved(plain, fast):
+    return "%8.1f%%" % ((1 - fast / plain) * 100)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", dest="runs", type=int, default=10,
+                        help="runs per program and mode")
+    parser.add_argument(dest="engine", nargs="?", choices=list(ENGINES), default="eval",
+                        help="evaluator to measure")
+    args = parser.parse_args()
+    engine = ENGINES[args.engine]
+    header = "%-22s%12s%12s%9s%12s%12s%9s" % ("program", "build", "build -O", "saved",
+                                              "run", "run -O", "saved")
+    print(header)
+    print("-" * len(header))
+    totals = [0.0] * 4
+    programs = []
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.sl"))):
+        with open(path) as f:
+            programs.append((os.path.basename(path), f.read()))
+    programs.append(("closures", CLOSURES))
+    for name, src in programs:
+        times = best_times(engine, src, False, args.runs) + \
+            best_times(engine, src, True, args.runs)
+        b, r, vb, vr = times
+        totals = [t + x for t, x in zip(totals, times)]
+        print("%-22s%10.2fms%10.2fms%s%10.2fms%10.2fms%s" % (
+            name, b * 1000, vb * 1000, saved(b, vb),
+            r * 1000, vr * 1000, saved(r, vr)))
+    print("-" * len(header))
+    b, r, vb, vr = totals
+    print("%-22s%10.2fms%10.2fms%s%10.2fms%10.2fms%s" % (
+        "total", b * 1000, vb * 1000, saved(b, vb), r * 1000, vr * 1000, saved(r, vr)))
@@ -2,30 +2,18 @@
 # AST types
 ##################################################################################
 
+import json
+import sys
 from swimlang.util import valid_var
 from swimlang.pdstruct import *
-from swimlang.tokenizer import TokenType
+from swimlang.tokenizer import TokenType, QUOTE
 
+# Whether node constructors check their arguments. Runs in verified mode turn the checks off
+# and check the whole tree once with verify, see verifier.py.
+CHECKS = True
 
-class Node(object):
-    @staticmethod
-    def wrap(e):
-        if type(e) is int:
-            return Int(e)
-        elif type(e) is bool:
-            return Bool(e)
-        elif type(e) is str:
-            return Str(e)
-        else:
-            return e
-
-    @staticmethod
-    def unwrap(e):
-        if type(e) in [Int, Bool, Str]:
-            return e.val
-        else:
-            return e
 
+class Node(object):
     def accept(self, visitor):
         pass
 
@@ -38,13 +26,17 @@ class Exit(UOp):
         return visitor.visit_exit(self)
 
 class BinOp(Node):
+    # Specialized evaluation installed by the Evaluator, see quicken and counted in
+    # evaluator.py.
+    quick = None
+
     def accept(self, visitor):
         pass
 
 
 class Int(Node):
     def __init__(self, val):
-        if not type(val) is int:
+        if CHECKS and not type(val) is int:
             raise TypeError
         self.val = val
 
@@ -60,7 +52,7 @@ class Int(Node):
 
 class Add(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -71,7 +63,7 @@ class Add(BinOp):
 
 class Sub(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -82,7 +74,7 @@ class Sub(BinOp):
 
 class Mul(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -93,7 +85,7 @@ class Mul(BinOp):
 
 class Div(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -104,7 +96,7 @@ class Div(BinOp):
 
 class Mod(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -115,7 +107,7 @@ class Mod(BinOp):
 
 class Eq(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -126,7 +118,7 @@ class Eq(BinOp):
 
 class NotEq(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -137,7 +129,7 @@ class NotEq(BinOp):
 
 class Lt(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -148,7 +140,7 @@ class Lt(BinOp):
 
 class Lte(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -159,7 +151,7 @@ class Lte(BinOp):
 
 class Gt(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -170,7 +162,7 @@ class Gt(BinOp):
 
 class Gte(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -181,7 +173,7 @@ class Gte(BinOp):
 
 class Bool(Node):
     def __init__(self, val):
-        if not type(val) is bool:
+        if CHECKS and not type(val) is bool:
             raise TypeError
         self.val = val
 
@@ -197,7 +189,7 @@ class Bool(Node):
 
 class And(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -208,7 +200,7 @@ class And(BinOp):
 
 class Or(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -219,7 +211,7 @@ class Or(BinOp):
 
 class Not(Node):
     def __init__(self, arg):
-        if not issubclass(type(arg), Node):
+        if CHECKS and not issubclass(type(arg), Node):
             raise TypeError
         self.arg = arg
 
@@ -229,9 +221,18 @@ class Not(Node):
 
 class Str(Node):
     def __init__(self, val):
-        if not type(val) is str:
+        if CHECKS and not type(val) is str:
             raise TypeError
         self.val = val
+        # Escape sequences are decoded once, and equal literals share one interned string.
+        # An invalid literal decodes to None and raises when it is evaluated.
+        try:
+            self.decoded = sys.intern(self.decode())
+        except ValueError:
+            self.decoded = None
+
+    def decode(self):
+        return json.loads('%s%s%s' % (QUOTE, self.val, QUOTE))
 
     def __hash__(self):
         return self.val.__hash__()
@@ -245,7 +246,7 @@ class Str(Node):
 
 class If(Node):
     def __init__(self, cond, first, second):
-        if not (issubclass(type(cond), Node) and issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(cond), Node) and issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.cond = cond
         self.first = first
@@ -257,7 +258,7 @@ class If(Node):
 
 class While(BinOp):
     def __init__(self, cond, body):
-        if not (issubclass(type(cond), Node) and issubclass(type(body), Node)):
+        if CHECKS and not (issubclass(type(cond), Node) and issubclass(type(body), Node)):
             raise TypeError
         self.cond = cond
         self.body = body
@@ -268,10 +269,11 @@ class While(BinOp):
 
 class Let(Node):
     def __init__(self, var, expr):
-        if not type(var) is Var:
-            raise TypeError
-        if not issubclass(type(expr), Node):
-            raise TypeError
+        if CHECKS:
+            if not type(var) is Var:
+                raise TypeError
+            if not issubclass(type(expr), Node):
+                raise TypeError
         self.var = var
         self.expr = expr
 
@@ -281,10 +283,11 @@ class Let(Node):
 
 class Mut(Node):
     def __init__(self, var, expr):
-        if not type(var) is Var:
-            raise TypeError
-        if not issubclass(type(expr), Node):
-            raise TypeError
+        if CHECKS:
+            if not type(var) is Var:
+                raise TypeError
+            if not issubclass(type(expr), Node):
+                raise TypeError
         self.var = var
         self.expr = expr
 
@@ -294,10 +297,11 @@ class Mut(Node):
 
 class Set(Node):
     def __init__(self, var, expr):
-        if not type(var) is Var:
-            raise TypeError
-        if not issubclass(type(expr), Node):
-            raise TypeError
+        if CHECKS:
+            if not type(var) is Var:
+                raise TypeError
+            if not issubclass(type(expr), Node):
+                raise TypeError
         self.var = var
         self.expr = expr
 
@@ -307,10 +311,11 @@ class Set(Node):
 
 class Var(Node):
     def __init__(self, val):
-        if not type(val) is str:
-            raise TypeError
-        if not valid_var(val):
-            raise TypeError
+        if CHECKS:
+            if not type(val) is str:
+                raise TypeError
+            if not valid_var(val):
+                raise TypeError
         self.val = val
 
     def accept(self, visitor):
@@ -319,7 +324,7 @@ class Var(Node):
 
 class Seq(BinOp):
     def __init__(self, first, second):
-        if not (issubclass(type(first), Node) and issubclass(type(second), Node)):
+        if CHECKS and not (issubclass(type(first), Node) and issubclass(type(second), Node)):
             raise TypeError
         self.first = first
         self.second = second
@@ -329,20 +334,24 @@ class Seq(BinOp):
 
 
 class Fun(Node):
+    # The cache of a function value made by memo
+    memo = None
+
     def __init__(self, name, params, body, lexical_scope):
-        if not (type(name) is str or name is None):
-            raise TypeError
-        if not type(params) is list:
-            raise TypeError
-        for p in params:
-            if not type(p) is str:
+        if CHECKS:
+            if not (type(name) is str or name is None):
+                raise TypeError
+            if not type(params) is list:
+                raise TypeError
+            for p in params:
+                if not type(p) is str:
+                    raise TypeError
+                if p == name:
+                    raise ValueError
+            if not issubclass(type(body), Node):
+                raise TypeError
+            if not (type(lexical_scope) is Fun or lexical_scope is None):
                 raise TypeError
-            if p == name:
-                raise ValueError
-        if not issubclass(type(body), Node):
-            raise TypeError
-        if not (type(lexical_scope) is Fun or lexical_scope is None):
-            raise TypeError
         self.name = name
         self.params = params
         self.body = body
@@ -355,13 +364,14 @@ class Fun(Node):
 
 class Call(Node):
     def __init__(self, fun, args):
-        if not issubclass(type(fun), Node):
-            raise TypeError
-        if not type(args) is list:
-            raise TypeError
-        for a in args:
-            if not issubclass(type(a), Node):
+        if CHECKS:
+            if not issubclass(type(fun), Node):
+                raise TypeError
+            if not type(args) is list:
                 raise TypeError
+            for a in args:
+                if not issubclass(type(a), Node):
+                    raise TypeError
         self.fun = fun
         self.args = args
 
@@ -371,13 +381,16 @@ class Call(Node):
 
 class Map(Node):
     # FixMe: don't expose P_Tree internals?
+    # A map literal is built from a dict of nodes, a map value from a P_Tree or, for an
+    # ordered map, a P_SortedMap of values.
     def __init__(self, mappings):
         if type(mappings) is dict:
-            for k, v in mappings.items():
-                if not (issubclass(type(k), Node) and issubclass(type(v), Node)):
-                    raise TypeError
+            if CHECKS:
+                for k, v in mappings.items():
+                    if not (issubclass(type(k), Node) and issubclass(type(v), Node)):
+                        raise TypeError
             self.mappings = P_Tree(init_mappings=mappings)
-        elif type(mappings) is P_Tree:
+        elif type(mappings) is P_Tree or type(mappings) is P_SortedMap:
             self.mappings = mappings
         else:
             raise TypeError
@@ -388,7 +401,7 @@ class Map(Node):
     def __str__(self):
         # FixMe: don't use Printer() here...
         from swimlang.printer import Printer
-        return Printer()(self)
+        return Printer().value(self)
 
     def __bool__(self):
         return len(self.mappings) != 0
@@ -396,7 +409,7 @@ class Map(Node):
 
 class Get(Node):
     def __init__(self, m, k):
-        if not (issubclass(type(m), Node) and issubclass(type(k), Node)):
+        if CHECKS and not (issubclass(type(m), Node) and issubclass(type(k), Node)):
             raise TypeError
         self.m = m
         self.k = k
@@ -407,7 +420,7 @@ class Get(Node):
 
 class Put(Node):
     def __init__(self, m, k, v):
-        if not (issubclass(type(m), Node) and issubclass(type(k), Node) and issubclass(type(v), Node)):
+        if CHECKS and not (issubclass(type(m), Node) and issubclass(type(k), Node) and issubclass(type(v), Node)):
             raise TypeError
         self.m = m
         self.k = k
@@ -417,9 +430,43 @@ class Put(Node):
         return visitor.visit_put(self)
 
 
+class Remove(Node):
+    def __init__(self, m, k):
+        if CHECKS and not (issubclass(type(m), Node) and issubclass(type(k), Node)):
+            raise TypeError
+        self.m = m
+        self.k = k
+
+    def accept(self, visitor):
+        return visitor.visit_remove(self)
+
+
+class Into(Node):
+    def __init__(self, c, l):
+        if CHECKS and not (issubclass(type(c), Node) and issubclass(type(l), Node)):
+            raise TypeError
+        self.c = c
+        self.l = l
+
+    def accept(self, visitor):
+        return visitor.visit_into(self)
+
+
+class Between(Node):
+    def __init__(self, m, lo, hi):
+        if CHECKS and not (issubclass(type(m), Node) and issubclass(type(lo), Node) and issubclass(type(hi), Node)):
+            raise TypeError
+        self.m = m
+        self.lo = lo
+        self.hi = hi
+
+    def accept(self, visitor):
+        return visitor.visit_between(self)
+
+
 class Keys(Node):
     def __init__(self, m):
-        if not issubclass(type(m), Node):
+        if CHECKS and not issubclass(type(m), Node):
             raise TypeError
         self.m = m
 
@@ -429,7 +476,7 @@ class Keys(Node):
 
 class Type(Node):
     def __init__(self, arg):
-        if not issubclass(type(arg), Node):
+        if CHECKS and not issubclass(type(arg), Node):
             raise TypeError
         self.arg = arg
 
@@ -439,13 +486,16 @@ class Type(Node):
 
 class List(Node):
     # FixMe: don't expose P_List internals?
+    # A list literal is built from a list of nodes, a list value from a P_List or, for a
+    # vector, a P_Vector of values.
     def __init__(self, elements):
         if type(elements) is list:
-            for e in elements:
-                if not issubclass(type(e), Node):
-                    raise TypeError
+            if CHECKS:
+                for e in elements:
+                    if not issubclass(type(e), Node):
+                        raise TypeError
             self.elements = P_List(initial=elements)
-        elif type(elements) is P_List:
+        elif type(elements) is P_List or type(elements) is P_Vector:
             self.elements = elements
         else:
             raise TypeError
@@ -456,7 +506,7 @@ class List(Node):
     def __str__(self):
         # FixMe: don't use Printer() here...
         from swimlang.printer import Printer
-        return Printer()(self)
+        return Printer().value(self)
 
     def __bool__(self):
         return len(self.elements) != 0
@@ -464,7 +514,7 @@ class List(Node):
 
 class Head(Node):
     def __init__(self, arg):
-        if not issubclass(type(arg), Node):
+        if CHECKS and not issubclass(type(arg), Node):
             raise TypeError
         self.arg = arg
 
@@ -474,7 +524,7 @@ class Head(Node):
 
 class Tail(Node):
     def __init__(self, arg):
-        if not issubclass(type(arg), Node):
+        if CHECKS and not issubclass(type(arg), Node):
             raise TypeError
         self.arg = arg
 
@@ -484,7 +534,7 @@ class Tail(Node):
 
 class Push(BinOp):
     def __init__(self, head, tail):
-        if not (issubclass(type(head), Node) and issubclass(type(tail), Node)):
+        if CHECKS and not (issubclass(type(head), Node) and issubclass(type(tail), Node)):
             raise TypeError
         self.head = head
         self.tail = tail
@@ -495,7 +545,7 @@ class Push(BinOp):
 
 class Print(Node):
     def __init__(self, arg):
-        if not issubclass(type(arg), Node):
+        if CHECKS and not issubclass(type(arg), Node):
             raise TypeError
         self.arg = arg
 
@@ -503,6 +553,36 @@ class Print(Node):
         return visitor.visit_print(self)
 
 
+class Memo(Node):
+    def __init__(self, arg):
+        if CHECKS and not issubclass(type(arg), Node):
+            raise TypeError
+        self.arg = arg
+
+    def accept(self, visitor):
+        return visitor.visit_memo(self)
+
+
+class Vec(Node):
+    def __init__(self, arg):
+        if CHECKS and not issubclass(type(arg), Node):
+            raise TypeError
+        self.arg = arg
+
+    def accept(self, visitor):
+        return visitor.visit_vec(self)
+
+
+class Ordered(Node):
+    def __init__(self, arg):
+        if CHECKS and not issubclass(type(arg), Node):
+            raise TypeError
+        self.arg = arg
+
+    def accept(self, visitor):
+        return visitor.visit_ordered(self)
+
+
 class Nil(Node):
     __instance__ = None
 
@@ -527,5 +607,58 @@ class Nil(Node):
     def __bool__(self):
         return False
 
+    def __deepcopy__(self, memo):
+        return self
+
     def accept(self, visitor):
         return visitor.visit_nil(self)
+
+
+def children(node):
+    # The child nodes of node in evaluation order. Map literals list each value before its key.
+    t = type(node)
+    if t in [Int, Bool, Str, Var, Nil, Exit]:
+        return []
+    if t in [Not, Head, Tail, Print, Type, Memo, Vec, Ordered]:
+        return [node.arg]
+    if t is If:
+        return [node.cond, node.first, node.second]
+    if t is While:
+        return [node.cond, node.body]
+    if t in [Let, Mut, Set]:
+        return [node.expr]
+    if t is Fun:
+        return [node.body]
+    if t is Call:
+        return [node.fun] + list(node.args)
+    if t is Map:
+        out = []
+        for k, v in node.mappings.items():
+            out += [v, k]
+        return out
+    if t is List:
+        return list(node.elements)
+    if t is Get:
+        return [node.m, node.k]
+    if t is Put:
+        return [node.m, node.k, node.v]
+    if t is Remove:
+        return [node.m, node.k]
+    if t is Into:
+        return [node.c, node.l]
+    if t is Between:
+        return [node.m, node.lo, node.hi]
+    if t is Keys:
+        return [node.m]
+    if t is Push:
+        return [node.tail, node.head]
+    return [node.first, node.second]
+
+
+def size(node):
+    # The number of nodes of node.
+    out, todo = 0, [node]
+    while todo:
+        out += 1
+        todo += children(todo.pop())
+    return out
@@ -0,0 +1,522 @@
+##################################################################################
+# Closure compiler
+##################################################################################
+
+# Compiles every AST node once into a python closure that takes the current
+# Frame and returns the node's value. Running a program is a call of the root
+# closure, so node dispatch and the evaluator's type checks happen at compile
+# time rather than on every evaluation. With a step budget, loops and function
+# bodies compile to closures that count their iterations and calls, and with a
+# memory quota, operators that allocate compile to closures that count the
+# allocations.
+
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.resolver import Resolver
+from swimlang.runtime import UNBOUND, Frame, LET, MUT
+import swimlang.runtime as rt
+
+
+def call(frame, fun, args):
+    if not type(fun) is Fun:
+        # Non-functions are callable in that they take no arguments and return themselves.
+        if len(args) == 0:
+            return fun
+        # Non-functions cannot take arguments.
+        raise TypeError
+    nparams = len(fun.params)
+    if nparams < len(args):
+        # Too many arguments supplied
+        raise ValueError
+    if nparams > len(args):
+        # Not all params available - return a closure
+        return rt.partial(fun, args)
+    if fun.memo is not None:
+        return call_memo(frame, fun, args)
+    return fun.code(Frame(fun.scope, fun, rt.bind(fun, args), list(fun.kinds), frame))
+
+
+def call_memo(frame, fun, args):
+    memo = fun.memo
+    key = memo.key(fun, args)
+    out = memo.get(key)
+    if out is rt.MISSING:
+        out = fun.code(Frame(fun.scope, fun, rt.bind(fun, args), list(fun.kinds), frame))
+        memo.put(key, out)
+    return out
+
+
+class ClosureCompiler(Visitor):
+    def __init__(self, memo_size=rt.MEMO_SIZE, max_steps=None, max_memory=None):
+        self.scope = None
+        self.memos = rt.Memos(memo_size)
+        self.budget = None if max_steps is None else rt.Budget(max_steps)
+        self.quota = None if max_memory is None else rt.Quota(max_memory)
+
+    def __call__(self, node):
+        if self.scope is not None:
+            return node.accept(self)
+        scope = Resolver()(node)
+        self.scope = scope
+        try:
+            body = node.accept(self)
+        finally:
+            self.scope = None
+
+        def run():
+            size = scope.size()
+            return body(Frame(scope, None, [UNBOUND] * size, [None] * size, None))
+        return run
+
+    def const(self, val):
+        return lambda f: val
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return self.const(node.val)
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        quota = self.quota
+        if quota is not None:
+            return lambda f: quota.string(f.fun, first(f) + second(f))
+        return lambda f: first(f) + second(f)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) - second(f)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        quota = self.quota
+        if quota is not None:
+            return lambda f: quota.string(f.fun, first(f) * second(f))
+        return lambda f: first(f) * second(f)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: int(first(f) / second(f))
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) % second(f)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) == second(f)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return lambda f: rt.exit()
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) != second(f)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) < second(f)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) <= second(f)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) > second(f)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) >= second(f)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return self.const(node.val)
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) and second(f)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        first, second = self(node.first), self(node.second)
+        return lambda f: first(f) or second(f)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        arg = self(node.arg)
+        return lambda f: not arg(f)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        if node.decoded is None:
+            return lambda f: rt.decode(node)
+        return self.const(node.decoded)
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        cond, first, second = self(node.cond), self(node.first), self(node.second)
+        return lambda f: first(f) if cond(f) else second(f)
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        cond, body = self(node.cond), self(node.body)
+        budget = self.budget
+        if budget is not None:
+            cost = budget.loop_cost(node)
+
+            def counted_loop(f):
+                out = False
+                while cond(f):
+                    out = body(f)
+                    budget.loop(cost)
+                return out
+            return counted_loop
+
+        def loop(f):
+            out = False
+            while cond(f):
+                out = body(f)
+            return out
+        return loop
+
+    def declarator(self, slot):
+        return rt.declare_cell if slot in self.scope.cells else rt.declare
+
+    def declaration(self, name, kind, expr):
+        names = self.scope.names
+        slot = self.scope.slots[name]
+        declare = self.declarator(slot)
+        return lambda f: declare(names, f.vals, f.kinds, slot, kind, expr(f))
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        return self.declaration(node.var.val, LET, self(node.expr))
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        return self.declaration(node.var.val, MUT, self(node.expr))
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        name = node.var.val
+        names = self.scope.names
+        slot = self.scope.slots[name]
+        expr = self(node.expr)
+        cell = slot in self.scope.cells
+
+        def assign(f):
+            kinds = f.kinds
+            if kinds[slot] is None:
+                raise ValueError
+            val = expr(f)
+            rt.check_set(names, kinds, slot)
+            if cell:
+                f.vals[slot].val = val
+            else:
+                f.vals[slot] = val
+            return val
+        return assign
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        names = self.scope.names
+        slot = self.scope.slots[node.val]
+        if slot in self.scope.cells:
+            return lambda f: rt.load_cell(names, f.vals, slot)
+
+        def load(f):
+            v = f.vals[slot]
+            if v is UNBOUND:
+                rt.load_error(names, slot)
+            return v
+        return load
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        # Flatten right-nested sequences into a single closure.
+        exprs = []
+        while type(node) is Seq:
+            exprs.append(self(node.first))
+            node = node.second
+        last = self(node)
+        if len(exprs) == 1:
+            first = exprs[0]
+
+            def seq2(f):
+                first(f)
+                return last(f)
+            return seq2
+        exprs = tuple(exprs)
+
+        def seq(f):
+            for e in exprs:
+                e(f)
+            return last(f)
+        return seq
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        scope = node.scope
+        outer = self.scope
+        self.scope = scope
+        try:
+            body = self(node.body)
+        finally:
+            self.scope = outer
+        if self.budget is not None:
+            body = self.counted_body(body, self.budget.call_cost(node.body))
+        if node.name is None:
+            return lambda f: rt.new_closure(node, scope, body, f.fun, f.vals, f.kinds)
+        names = outer.names
+        slot = outer.slots[node.name]
+        declare = self.declarator(slot)
+
+        def declare_fun(f):
+            out = rt.new_closure(node, scope, body, f.fun, f.vals, f.kinds)
+            return declare(names, f.vals, f.kinds, slot, LET, out)
+        return declare_fun
+
+    def counted_body(self, body, cost):
+        budget = self.budget
+
+        def counted(f):
+            budget.call(cost)
+            return body(f)
+        return counted
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        fun = self(node.fun)
+        args = [self(a) for a in node.args]
+        if len(args) == 0:
+            return lambda f: call(f, fun(f), [])
+        if len(args) == 1:
+            arg = args[0]
+            return lambda f: call(f, fun(f), [arg(f)])
+        return lambda f: call(f, fun(f), [a(f) for a in args])
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        mappings = []
+        for k, v in node.mappings.items():
+            v = self(v)
+            mappings.append((self(k), v))
+
+        def pairs(f):
+            # Each value is evaluated before its key, as by the Evaluator.
+            out = []
+            for k, v in mappings:
+                v = v(f)
+                out.append((k(f), v))
+            return out
+        quota = self.quota
+        if quota is not None:
+            def counted_map(f):
+                out = rt.make_map(pairs(f))
+                quota.map(f.fun, len(out.mappings))
+                return out
+            return counted_map
+        return lambda f: rt.make_map(pairs(f))
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        m, k = self(node.m), self(node.k)
+        return lambda f: rt.get(rt.check_collection(m(f)), k(f))
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        m, k, v = self(node.m), self(node.k), self(node.v)
+        quota = self.quota
+        if quota is not None:
+            def counted_put(f):
+                mv = rt.check_collection(m(f))
+                kv, vv = k(f), v(f)
+                quota.put(f.fun, mv, kv)
+                return rt.put(mv, kv, vv)
+            return counted_put
+        return lambda f: rt.put(rt.check_collection(m(f)), k(f), v(f))
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        m, k = self(node.m), self(node.k)
+        quota = self.quota
+        if quota is not None:
+            def counted_remove(f):
+                mv = rt.check_map(m(f))
+                kv = k(f)
+                quota.remove(f.fun, mv, kv)
+                return rt.remove(mv, kv)
+            return counted_remove
+        return lambda f: rt.remove(rt.check_map(m(f)), k(f))
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        c, l = self(node.c), self(node.l)
+        quota = self.quota
+        if quota is not None:
+            def counted_into(f):
+                cv = c(f)
+                out, nodes = rt.build_into(cv, l(f))
+                quota.into(f.fun, out, nodes)
+                return out
+            return counted_into
+        return lambda f: rt.into(c(f), l(f))
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        m, lo, hi = self(node.m), self(node.lo), self(node.hi)
+        quota = self.quota
+        if quota is not None:
+            def counted_between(f):
+                out = rt.between(rt.check_ordered(m(f)), lo(f), hi(f))
+                quota.list(f.fun, len(out.elements))
+                return out
+            return counted_between
+        return lambda f: rt.between(rt.check_ordered(m(f)), lo(f), hi(f))
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        m = self(node.m)
+        quota = self.quota
+        if quota is not None:
+            def counted_keys(f):
+                out = rt.keys(m(f))
+                quota.list(f.fun, len(out.elements))
+                return out
+            return counted_keys
+        return lambda f: rt.keys(m(f))
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        elements = [self(e) for e in node.elements]
+        quota = self.quota
+        if quota is not None:
+            def counted_list(f):
+                out = rt.make_list([e(f) for e in elements])
+                quota.list(f.fun, len(elements))
+                return out
+            return counted_list
+        return lambda f: rt.make_list([e(f) for e in elements])
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        arg = self(node.arg)
+        return lambda f: rt.head(arg(f))
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        arg = self(node.arg)
+        return lambda f: rt.tail(arg(f))
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        head, tail = self(node.head), self(node.tail)
+        quota = self.quota
+
+        def push(f):
+            l = rt.check_list(tail(f))
+            h = head(f)
+            if quota is not None:
+                quota.push(f.fun, l)
+            return rt.push(h, l)
+        return push
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        arg = self(node.arg)
+        return lambda f: rt.print_value(arg(f))
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        arg = self(node.arg)
+        return lambda f: rt.type_of(arg(f))
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        memos, arg = self.memos, self(node.arg)
+        return lambda f: memos.memoize(arg(f))
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        arg = self(node.arg)
+        quota = self.quota
+        if quota is not None:
+            def counted_ordered(f):
+                m = arg(f)
+                quota.ordered(f.fun, m)
+                return rt.make_ordered(m)
+            return counted_ordered
+        return lambda f: rt.make_ordered(arg(f))
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        arg = self(node.arg)
+        quota = self.quota
+        if quota is not None:
+            def counted_vec(f):
+                l = arg(f)
+                quota.vec(f.fun, l)
+                return rt.make_vector(l)
+            return counted_vec
+        return lambda f: rt.make_vector(arg(f))
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return self.const(node)
@@ -0,0 +1,879 @@
+##################################################################################
+# Python code generator
+##################################################################################
+
+# Translates a swim AST into python source, compiles it and runs it natively:
+# swim functions become python functions, while loops become python while
+# loops and arithmetic uses the python operators directly. Calls of functions
+# that are statically known (a function calling itself or a function declared
+# with fun in an enclosing scope) are plain python calls.
+#
+# Swim variables are python locals named v_<name>. A closure receives the
+# values it captures as default arguments. Variables in cell slots (see
+# resolver.py) hold an rt.Cell, which the closure shares with the enclosing
+# function. Programs that depend on binding information the generated code
+# does not track raise Unsupported at generation time, in which case the
+# Interpreter falls back to the ClosureCompiler:
+#   * a name declared more than once in a scope, or declared in a while loop
+#   * a set of a captured variable that the function may have redeclared
+#   * an invalid string literal, which raises only if it is evaluated
+#
+# Compiled programs are cached on disk, keyed by a hash of the tree they are
+# generated from, i.e. of the program after the optimization passes. Storing a
+# program removes the entries of other versions of the generated code or of
+# python, and the least recently used entries beyond CACHE_SIZE.
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import re
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.resolver import Resolver
+from swimlang.runtime import UNBOUND, Binding, Scope, Decl
+import swimlang.runtime as rt
+
+# Bump whenever the generated code changes to invalidate cached programs.
+VERSION = 11
+
+# The number of compiled programs kept in the disk cache
+CACHE_SIZE = 256
+
+# Statement target for the value of a function body.
+RETURN = object()
+
+
+class Unsupported(Exception):
+    pass
+
+
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "swimlang")
+
+
+def cache_prefix():
+    # The names of the cache entries of this version of the generated code and of python.
+    return "%s-%d-" % (importlib.util.MAGIC_NUMBER.hex(), VERSION)
+
+
+def tree_key(node):
+    # A description of node that differs for any two trees that translate differently: the
+    # type, the fields that are not child nodes and the number of children of each node, in
+    # preorder.
+    out = []
+    todo = [node]
+    while todo:
+        n = todo.pop()
+        t = type(n)
+        cs = children(n)
+        if t is Int or t is Bool or t is Str or t is Var:
+            data = n.val
+        elif t is Let or t is Mut or t is Set:
+            data = n.var.val
+        elif t is Fun:
+            data = (n.name, n.params)
+        else:
+            data = None
+        out.append(repr((t.__name__, data, len(cs))))
+        todo += reversed(cs)
+    return "\n".join(out)
+
+
+def closure(node, py):
+    out = Fun(None, node.params, node.body, None)
+    out.env = {node.name: Binding(Scope.PARAM, Decl.LET, out)}
+    out.py = py
+    out.args = ()
+    py.swim = out
+    return out
+
+
+def call(fun, *args):
+    if not type(fun) is Fun:
+        # Non-functions are callable in that they take no arguments and return themselves.
+        if len(args) == 0:
+            return fun
+        # Non-functions cannot take arguments.
+        raise TypeError
+    nparams = len(fun.params)
+    if nparams < len(args):
+        # Too many arguments supplied
+        raise ValueError
+    if nparams > len(args):
+        # Not all params available - return a closure
+        return rt.partial(fun, args)
+    if fun.args:
+        return fun.py(*fun.args, *args)
+    return fun.py(*args)
+
+
+def cons(l, h):
+    return rt.push(h, l)
+
+
+def value_map(pairs):
+    # The map of (value, key) pairs, whose values are evaluated before their keys
+    return rt.make_map([(k, v) for v, k in pairs])
+
+
+def unbound(name):
+    raise ValueError("unbound variable %s" % name)
+
+
+def fail(msg):
+    raise ValueError(msg)
+
+
+def store(cell, val):
+    cell.val = val
+    return val
+
+
+NAMESPACE = {
+    "UNBOUND": UNBOUND,
+    "_nil": Nil.instance(),
+    "_call": call,
+    "_closure": closure,
+    "_cons": cons,
+    "_unbound": unbound,
+    "_fail": fail,
+    "_cell": rt.Cell,
+    "_store": store,
+    "_div": rt.div,
+    "_list": rt.make_list,
+    "_vec": rt.make_vector,
+    "_ordered": rt.make_ordered,
+    "_map": value_map,
+    "_check_collection": rt.check_collection,
+    "_check_list": rt.check_list,
+    "_check_map": rt.check_map,
+    "_check_ordered": rt.check_ordered,
+    "_get": rt.get,
+    "_put": rt.put,
+    "_remove": rt.remove,
+    "_into": rt.into,
+    "_between": rt.between,
+    "_keys": rt.keys,
+    "_head": rt.head,
+    "_tail": rt.tail,
+    "_print": rt.print_value,
+    "_type": rt.type_of,
+    "_exit": rt.exit,
+}
+
+
+def var(name):
+    return "v_" + name
+
+
+class Block(object):
+    # Generation state for the python function of one swim scope.
+    def __init__(self, scope, known, pyname):
+        self.scope = scope
+        self.pyname = pyname
+        self.lines = []
+        self.depth = 1
+        self.ntemps = 0
+        self.self_name = None
+        self.self_used = False
+        if scope.self_slot is not None:
+            self.self_name = scope.names[scope.self_slot]
+        # Names that definitely hold a value at the current point.
+        self.bound = scope.bound() | known
+        # Statically known functions: name -> (python name, number of params).
+        self.funs = {}
+        self.inherited = set(scope.names[s] for (_, s) in scope.captures)
+        self.cells = set(scope.names[s] for s in scope.cells)
+        # Locals captured by a nested function start out as UNBOUND so that a
+        # closure created before their declaration captures UNBOUND.
+        self.unset = set()
+        for c in scope.children:
+            for (outer, _) in c.captures:
+                name = scope.names[outer]
+                if name not in scope.bound() and name not in self.inherited:
+                    self.unset.add(name)
+        # Names that may hold UNBOUND rather than be unassigned python locals.
+        self.guarded = self.inherited | self.unset
+
+    def emit(self, line):
+        self.lines.append("    " * self.depth + line)
+
+    def temp(self):
+        self.ntemps += 1
+        return "_t%d" % self.ntemps
+
+    def prologue(self):
+        out = []
+        if self.self_used:
+            out.append("%s = %s.swim" % (var(self.self_name), self.pyname))
+        for name in sorted(self.unset):
+            out.append("%s = UNBOUND" % var(name))
+        return out
+
+
+class Codegen(Visitor):
+    binops = {
+        Add: "+", Sub: "-", Mul: "*", Mod: "%", Eq: "==", NotEq: "!=",
+        Lt: "<", Lte: "<=", Gt: ">", Gte: ">="
+    }
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.block = None
+        self.spill = False
+        self.simple_nodes = {}
+        self.fun_index = {}
+
+    def __call__(self, node):
+        if self.block is not None:
+            return self.expr(node)
+        scope = Resolver()(node)
+        funs = []
+        self.index(scope, funs)
+        path = self.cache_path(node)
+        code = self.load(path)
+        if code is None:
+            try:
+                code = compile(self.generate(node, scope), "<swim>", "exec")
+            except (Unsupported, SyntaxError, RecursionError):
+                return None
+            self.store(path, code)
+        return self.program(code, funs)
+
+    def index(self, scope, funs):
+        # Functions are numbered in resolver order so that a cached program
+        # refers to the same Fun nodes as a freshly generated one.
+        for c in scope.children:
+            self.fun_index[id(c.fun)] = len(funs)
+            funs.append(c.fun)
+            self.index(c, funs)
+
+    def program(self, code, funs):
+        namespace = dict(NAMESPACE)
+        namespace["_funs"] = funs
+        exec(code, namespace)
+        main = namespace["main"]
+
+        def run():
+            try:
+                return main()
+            except NameError as e:
+                # Read of a local that was never assigned.
+                match = re.search(r"'v_(\w+)'", str(e))
+                unbound(match.group(1) if match else "")
+        return run
+
+    def generate(self, node, scope):
+        self.block = Block(scope, set(), None)
+        try:
+            self.stmt(node, RETURN)
+            block = self.block
+            lines = ["    " + l for l in block.prologue()] + block.lines
+        finally:
+            self.block = None
+        return "def main():\n" + "\n".join(lines) + "\n"
+
+    # Disk cache
+
+    def cache_path(self, node):
+        # The program generated from node depends on nothing but the tree, which the passes
+        # before code generation, such as inlining, may have changed.
+        if self.cache_dir is None:
+            return None
+        h = hashlib.sha256(tree_key(node).encode())
+        return os.path.join(self.cache_dir, cache_prefix() + h.hexdigest() + ".swimc")
+
+    def load(self, path):
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                code = marshal.load(f)
+            # The modification time orders the entries by last use for prune.
+            os.utime(path)
+            return code
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def store(self, path, code):
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = "%s.%d.tmp" % (path, os.getpid())
+            with open(tmp, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp, path)
+            self.prune()
+        except OSError:
+            pass
+
+    def prune(self):
+        prefix = cache_prefix()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".swimc"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.startswith(prefix):
+                    entries.append((os.path.getmtime(path), path))
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - CACHE_SIZE)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # Static checks
+
+    def simple(self, node):
+        # A node is simple if it translates to a single python expression,
+        # i.e. it contains neither a while loop nor a function.
+        key = id(node)
+        if key not in self.simple_nodes:
+            t = type(node)
+            out = not (t is While or t is Fun)
+            for c in children(node):
+                out = self.simple(c) and out
+            self.simple_nodes[key] = out
+        return self.simple_nodes[key]
+
+    def read(self, name):
+        block = self.block
+        if name == block.self_name:
+            block.self_used = True
+        v = var(name)
+        val = v + ".val" if name in block.cells else v
+        if name in block.guarded and name not in block.bound:
+            return "(%s if %s is not UNBOUND else _unbound(%r))" % (val, v, name)
+        return val
+
+    def check_decl(self, name):
+        scope = self.block.scope
+        if name in scope.bound():
+            return "re-declaration of param %s" % name
+        if len(scope.decl_sites[name]) > 1 or name in scope.loop_decls:
+            raise Unsupported("%s is declared more than once" % name)
+        return None
+
+    def check_set(self, name):
+        block = self.block
+        scope = block.scope
+        if name in scope.bound():
+            return "cannot rebind non-mutable %s" % name
+        if name in block.inherited and not (name in scope.decls and name in block.bound):
+            if name in scope.decls:
+                raise Unsupported("set of captured variable %s" % name)
+            if name not in block.cells:
+                return "cannot rebind non-mutable %s" % name
+            return None
+        if name not in scope.decls:
+            return "unbound variable %s" % name
+        if len(scope.decl_sites[name]) > 1 or name in scope.loop_decls:
+            raise Unsupported("%s is declared more than once" % name)
+        if scope.decl_sites[name][0] is not Mut:
+            return "cannot rebind non-mutable %s" % name
+        return None
+
+    def declare(self, name, expr):
+        if name in self.block.cells:
+            expr = "_cell(%s)" % expr
+        self.block.emit("%s = %s" % (var(name), expr))
+
+    def declared(self, name, fun=None):
+        block = self.block
+        block.bound.add(name)
+        block.funs.pop(name, None)
+        if fun is not None:
+            block.funs[name] = fun
+
+    def save(self):
+        return (set(self.block.bound), dict(self.block.funs))
+
+    def restore(self, state):
+        self.block.bound, self.block.funs = set(state[0]), dict(state[1])
+
+    def join(self, first, second):
+        self.block.bound = first[0] & second[0]
+        self.block.funs = {k: v for k, v in first[1].items()
+                           if second[1].get(k) == v}
+
+    # Expressions
+
+    def expr(self, node):
+        if not self.simple(node) and type(node) in [Seq, If, While, Let, Mut, Set, Fun, And, Or]:
+            t = self.block.temp()
+            self.stmt(node, t)
+            return t
+        spill = self.spill
+        self.spill = not self.simple(node)
+        try:
+            return node.accept(self)
+        finally:
+            self.spill = spill
+
+    def sub(self, node):
+        # Operands of an expression that contains statements are evaluated
+        # into temporaries to keep the evaluation order.
+        if self.spill:
+            t = self.block.temp()
+            self.stmt(node, t)
+            return t
+        return self.expr(node)
+
+    def checked(self, node, check):
+        # An operand checked by the runtime function named check before the operands after it
+        # are evaluated
+        out = self.sub(node)
+        if self.spill:
+            self.block.emit("%s(%s)" % (check, out))
+            return out
+        return "%s(%s)" % (check, out)
+
+    def visit_binop(self, node):
+        first = self.sub(node.first)
+        second = self.sub(node.second)
+        return "(%s %s %s)" % (first, self.binops[type(node)], second)
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return "(%r)" % node.val
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        first = self.sub(node.first)
+        second = self.sub(node.second)
+        return "_div(%s, %s)" % (first, second)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return "_exit()"
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return repr(node.val)
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        first = self.expr(node.first)
+        state = self.save()
+        second = self.expr(node.second)
+        self.restore(state)
+        return "(%s and %s)" % (first, second)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        first = self.expr(node.first)
+        state = self.save()
+        second = self.expr(node.second)
+        self.restore(state)
+        return "(%s or %s)" % (first, second)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        return "(not %s)" % self.sub(node.arg)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        if node.decoded is None:
+            # An invalid literal raises when it is evaluated, which the closure engine does.
+            raise Unsupported("invalid string literal")
+        return repr(node.decoded)
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        cond = self.expr(node.cond)
+        state = self.save()
+        first = self.expr(node.first)
+        after_first = self.save()
+        self.restore(state)
+        second = self.expr(node.second)
+        self.join(after_first, self.save())
+        return "(%s if %s else %s)" % (first, cond, second)
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        t = self.block.temp()
+        self.stmt(node, t)
+        return t
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        return self.declaration(node)
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        return self.declaration(node)
+
+    def declaration(self, node):
+        name = node.var.val
+        error = self.check_decl(name)
+        expr = self.expr(node.expr)
+        if error is not None:
+            return "(%s, _fail(%r))[1]" % (expr, error)
+        self.declared(name)
+        if name in self.block.cells:
+            return "(%s := _cell(%s)).val" % (var(name), expr)
+        return "(%s := %s)" % (var(name), expr)
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        name = node.var.val
+        error = self.check_set(name)
+        out = []
+        if name not in self.block.bound:
+            out.append(self.read(name))
+        expr = self.expr(node.expr)
+        if error is not None:
+            out += [expr, "_fail(%r)" % error]
+        elif name in self.block.cells:
+            out.append("_store(%s, %s)" % (var(name), expr))
+        else:
+            out.append("(%s := %s)" % (var(name), expr))
+        if len(out) == 1:
+            return out[0]
+        return "(%s)[-1]" % ", ".join(out)
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        return self.read(node.val)
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        return "(%s, %s)[1]" % (self.expr(node.first), self.expr(node.second))
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        t = self.block.temp()
+        self.stmt(node, t)
+        return t
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        fun = node.fun
+        if type(fun) is Var and fun.val in self.block.funs:
+            pyname, nparams = self.block.funs[fun.val]
+            if nparams == len(node.args):
+                args = [self.sub(a) for a in node.args]
+                return "%s(%s)" % (pyname, ", ".join(args))
+        out = [self.sub(fun)] + [self.sub(a) for a in node.args]
+        return "_call(%s)" % ", ".join(out)
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        out = []
+        for k, v in node.mappings.items():
+            out.append("(%s, %s)" % (self.sub(v), self.sub(k)))
+        return "_map([%s])" % ", ".join(out)
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        m = self.checked(node.m, "_check_collection")
+        return "_get(%s, %s)" % (m, self.sub(node.k))
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        m = self.checked(node.m, "_check_collection")
+        return "_put(%s, %s, %s)" % (m, self.sub(node.k), self.sub(node.v))
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        m = self.checked(node.m, "_check_map")
+        return "_remove(%s, %s)" % (m, self.sub(node.k))
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        return "_into(%s, %s)" % (self.sub(node.c), self.sub(node.l))
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        m = self.checked(node.m, "_check_ordered")
+        return "_between(%s, %s, %s)" % (m, self.sub(node.lo), self.sub(node.hi))
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        return "_keys(%s)" % self.sub(node.m)
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        return "_list([%s])" % ", ".join([self.sub(e) for e in node.elements])
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        return "_head(%s)" % self.sub(node.arg)
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        return "_tail(%s)" % self.sub(node.arg)
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        # The tail is evaluated and checked before the head.
+        tail = self.checked(node.tail, "_check_list")
+        return "_cons(%s, %s)" % (tail, self.sub(node.head))
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        return "_print(%s)" % self.sub(node.arg)
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        return "_type(%s)" % self.sub(node.arg)
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        raise Unsupported("memo")
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        return "_vec(%s)" % self.sub(node.arg)
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        return "_ordered(%s)" % self.sub(node.arg)
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return "_nil"
+
+    # Statements
+
+    def assign(self, target, expr):
+        if target is RETURN:
+            self.block.emit("return " + expr)
+        elif target is not None:
+            self.block.emit("%s = %s" % (target, expr))
+        elif not re.fullmatch(r"_t\d+", expr):
+            self.block.emit(expr)
+
+    def suite(self, node, target):
+        block = self.block
+        block.depth += 1
+        start = len(block.lines)
+        self.stmt(node, target)
+        if len(block.lines) == start:
+            block.emit("pass")
+        block.depth -= 1
+
+    def stmt(self, node, target):
+        t = type(node)
+        if t is Seq:
+            self.stmt(node.first, None)
+            self.stmt(node.second, target)
+        elif t is If:
+            self.stmt_if(node, target)
+        elif t is While:
+            self.stmt_while(node, target)
+        elif t is Let or t is Mut:
+            self.stmt_declaration(node, target)
+        elif t is Set:
+            self.stmt_set(node, target)
+        elif t is Fun:
+            self.stmt_fun(node, target)
+        elif (t is And or t is Or) and not self.simple(node):
+            result = self.block.temp()
+            self.stmt(node.first, result)
+            self.block.emit(("if %s:" if t is And else "if not %s:") % result)
+            state = self.save()
+            self.suite(node.second, result)
+            self.restore(state)
+            self.assign(target, result)
+        else:
+            self.assign(target, self.expr(node))
+
+    def stmt_if(self, node, target):
+        self.block.emit("if %s:" % self.expr(node.cond))
+        state = self.save()
+        self.suite(node.first, target)
+        after_first = self.save()
+        self.restore(state)
+        self.block.emit("else:")
+        self.suite(node.second, target)
+        self.join(after_first, self.save())
+
+    def stmt_while(self, node, target):
+        block = self.block
+        result = None
+        if target is not None:
+            result = block.temp()
+            block.emit("%s = False" % result)
+        state = self.save()
+        if self.simple(node.cond):
+            block.emit("while %s:" % self.expr(node.cond))
+        else:
+            block.emit("while True:")
+            block.depth += 1
+            block.emit("if not %s:" % self.expr(node.cond))
+            block.emit("    break")
+            block.depth -= 1
+        self.suite(node.body, result)
+        self.restore(state)
+        if target is not None:
+            self.assign(target, result)
+
+    def stmt_declaration(self, node, target):
+        name = node.var.val
+        error = self.check_decl(name)
+        expr = self.expr(node.expr)
+        if error is not None:
+            self.assign(None, expr)
+            self.block.emit("_fail(%r)" % error)
+            return
+        self.declare(name, expr)
+        self.declared(name)
+        self.assign(target, self.read(name))
+
+    def stmt_set(self, node, target):
+        name = node.var.val
+        error = self.check_set(name)
+        if name not in self.block.bound:
+            self.block.emit(self.read(name))
+        expr = self.expr(node.expr)
+        if error is not None:
+            self.assign(None, expr)
+            self.block.emit("_fail(%r)" % error)
+            return
+        if name in self.block.cells:
+            self.block.emit("%s.val = %s" % (var(name), expr))
+        else:
+            self.block.emit("%s = %s" % (var(name), expr))
+        self.assign(target, self.read(name))
+
+    def stmt_fun(self, node, target):
+        parent = self.block
+        scope = node.scope
+        error = None
+        if node.name is not None:
+            error = self.check_decl(node.name)
+        idx = self.fun_index[id(node)]
+        pyname = "f%d_%s" % (idx, node.name or "")
+        # Captured values are passed as default arguments. Names that are
+        # definitely bound here are definitely bound in the function too.
+        known = set()
+        params = [var(p) for p in node.params]
+        for (outer, inner) in scope.captures:
+            name = scope.names[inner]
+            if name == parent.self_name:
+                parent.self_used = True
+            params.append("%s=%s" % (var(name), var(name)))
+            if name in parent.bound:
+                known.add(name)
+        child = Block(scope, known, pyname)
+        for name in known:
+            if name in parent.funs:
+                child.funs[name] = parent.funs[name]
+        if node.name is not None:
+            child.funs[node.name] = (pyname, len(node.params))
+        child.depth = parent.depth + 1
+        self.block = child
+        try:
+            self.stmt(node.body, RETURN)
+        finally:
+            self.block = parent
+        parent.emit("def %s(%s):" % (pyname, ", ".join(params)))
+        for line in child.prologue():
+            parent.emit("    " + line)
+        parent.lines.extend(child.lines)
+        out = "_closure(_funs[%d], %s)" % (idx, pyname)
+        if node.name is None:
+            self.assign(target, out)
+            return
+        if error is not None:
+            parent.emit(out)
+            parent.emit("_fail(%r)" % error)
+            return
+        self.declare(node.name, out)
+        self.declared(node.name, (pyname, len(node.params)))
+        self.assign(target, self.read(node.name))
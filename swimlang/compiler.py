@@ -0,0 +1,457 @@
+##################################################################################
+# Bytecode compiler
+##################################################################################
+
+# Lowers a parsed AST to flat bytecode for the stack VM in vm.py. Each function
+# body (and the top level) becomes a Code object holding a list of
+# (opcode, argument) pairs, flattened into a single list, plus a constants
+# pool. Variables are addressed by the frame slots assigned by the Resolver.
+# Cell slots are accessed with the *_CELL variants of the variable opcodes.
+# The backward jump of a while loop is a LOOP, so that the VM can count the
+# loop's iterations against a step budget, see Budget in runtime.py.
+# Operands are evaluated in the order of the Evaluator: a map literal evaluates
+# each value before its key, and a CHECK of the first operand of get, put, push,
+# remove and between fails before their other operands are evaluated. A set
+# checks that its variable is declared before it evaluates its value.
+
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.resolver import Resolver
+import swimlang.runtime as rt
+
+# Opcodes
+CONST = 0
+LOAD = 1
+LET = 2
+MUT = 3
+SET = 4
+POP = 5
+JUMP = 6
+JUMP_IF_FALSE = 7
+JUMP_IF_FALSE_OR_POP = 8
+JUMP_IF_TRUE_OR_POP = 9
+CALL = 10
+RETURN = 11
+CLOSURE = 12
+ADD = 13
+SUB = 14
+MUL = 15
+DIV = 16
+MOD = 17
+EQ = 18
+NOT_EQ = 19
+LT = 20
+LTE = 21
+GT = 22
+GTE = 23
+NOT = 24
+LIST = 25
+MAP = 26
+GET = 27
+PUT = 28
+KEYS = 29
+HEAD = 30
+TAIL = 31
+PUSH = 32
+PRINT = 33
+TYPE = 34
+EXIT = 35
+LOAD_CELL = 36
+LET_CELL = 37
+MUT_CELL = 38
+SET_CELL = 39
+MEMO = 40
+LOOP = 41
+VEC = 42
+ORDERED = 43
+REMOVE = 44
+BETWEEN = 45
+INTO = 46
+CHECK = 47
+DECODE = 48
+DECLARED = 49
+
+OPNAMES = {v: k for k, v in list(globals().items())
+           if type(v) is int and k.isupper()}
+
+
+class Code(object):
+    def __init__(self, scope):
+        self.scope = scope
+        self.names = scope.names
+        self.ops = []
+        self.consts = []
+        self.const_idx = {}
+        # pc of a LOOP -> cost of an iteration of its loop
+        self.costs = {}
+        # The cost of a call that runs the code of a function body
+        self.cost = None
+
+    def const(self, val):
+        key = (type(val), val)
+        if key not in self.const_idx:
+            self.const_idx[key] = len(self.consts)
+            self.consts.append(val)
+        return self.const_idx[key]
+
+    def emit(self, op, arg=0):
+        self.ops.append(op)
+        self.ops.append(arg)
+        return len(self.ops) - 2
+
+    def label(self):
+        return len(self.ops)
+
+    def patch(self, idx, target):
+        self.ops[idx + 1] = target
+
+    def __str__(self):
+        out = []
+        for pc in range(0, len(self.ops), 2):
+            op, arg = self.ops[pc], self.ops[pc + 1]
+            if op == CONST:
+                desc = repr(self.consts[arg])
+            elif op == CHECK:
+                desc = self.consts[arg].__name__
+            elif op in [LOAD, LET, MUT, SET, LOAD_CELL, LET_CELL, MUT_CELL, SET_CELL]:
+                desc = self.names[arg]
+            else:
+                desc = str(arg)
+            out.append("%4d %-22s %s" % (pc, OPNAMES[op], desc))
+        return "\n".join(out)
+
+
+class Compiler(Visitor):
+    binops = {
+        Add: ADD, Sub: SUB, Mul: MUL, Div: DIV, Mod: MOD, Eq: EQ,
+        NotEq: NOT_EQ, Lt: LT, Lte: LTE, Gt: GT, Gte: GTE
+    }
+
+    def __init__(self):
+        self.code = None
+
+    def __call__(self, node):
+        if self.code is not None:
+            return node.accept(self)
+        scope = Resolver()(node)
+        self.code = Code(scope)
+        try:
+            node.accept(self)
+            self.code.emit(RETURN)
+            return self.code
+        finally:
+            self.code = None
+
+    def check(self, fun):
+        # Emits a check of the value on top of the stack with the runtime function fun
+        self.code.emit(CHECK, self.code.const(fun))
+
+    def slot(self, name):
+        return self.code.scope.slots[name]
+
+    def emit_var(self, op, cell_op, name):
+        slot = self.slot(name)
+        self.code.emit(cell_op if slot in self.code.scope.cells else op, slot)
+
+    def visit_binop(self, node):
+        self(node.first)
+        self(node.second)
+        self.code.emit(self.binops[type(node)])
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        self.code.emit(CONST, self.code.const(node.val))
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        self.code.emit(EXIT)
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        self.code.emit(CONST, self.code.const(node.val))
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        self(node.first)
+        jump = self.code.emit(JUMP_IF_FALSE_OR_POP)
+        self(node.second)
+        self.code.patch(jump, self.code.label())
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        self(node.first)
+        jump = self.code.emit(JUMP_IF_TRUE_OR_POP)
+        self(node.second)
+        self.code.patch(jump, self.code.label())
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(NOT)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        if node.decoded is None:
+            self.code.emit(CONST, self.code.const(node))
+            self.code.emit(DECODE)
+        else:
+            self.code.emit(CONST, self.code.const(node.decoded))
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        self(node.cond)
+        jump_second = self.code.emit(JUMP_IF_FALSE)
+        self(node.first)
+        jump_end = self.code.emit(JUMP)
+        self.code.patch(jump_second, self.code.label())
+        self(node.second)
+        self.code.patch(jump_end, self.code.label())
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        self.code.emit(CONST, self.code.const(False))
+        start = self.code.label()
+        self(node.cond)
+        jump_end = self.code.emit(JUMP_IF_FALSE)
+        self.code.emit(POP)
+        self(node.body)
+        loop = self.code.emit(LOOP, start)
+        self.code.costs[loop] = size(node) - 1
+        self.code.patch(jump_end, self.code.label())
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        self(node.expr)
+        self.emit_var(LET, LET_CELL, node.var.val)
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        self(node.expr)
+        self.emit_var(MUT, MUT_CELL, node.var.val)
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        # A set of an undeclared variable fails before its value is evaluated.
+        self.code.emit(DECLARED, self.slot(node.var.val))
+        self(node.expr)
+        self.emit_var(SET, SET_CELL, node.var.val)
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        self.emit_var(LOAD, LOAD_CELL, node.val)
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        self(node.first)
+        self.code.emit(POP)
+        self(node.second)
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        outer = self.code
+        self.code = Code(node.scope)
+        try:
+            self(node.body)
+            self.code.emit(RETURN)
+            code = self.code
+            code.cost = size(node.body) + 1
+        finally:
+            self.code = outer
+        self.code.emit(CLOSURE, self.code.const((node, code)))
+        if node.name is not None:
+            self.emit_var(LET, LET_CELL, node.name)
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        self(node.fun)
+        for a in node.args:
+            self(a)
+        self.code.emit(CALL, len(node.args))
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        for k, v in node.mappings.items():
+            self(v)
+            self(k)
+        self.code.emit(MAP, len(node.mappings))
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        self(node.m)
+        self.check(rt.check_collection)
+        self(node.k)
+        self.code.emit(GET)
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        self(node.m)
+        self.check(rt.check_collection)
+        self(node.k)
+        self(node.v)
+        self.code.emit(PUT)
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        self(node.m)
+        self.check(rt.check_map)
+        self(node.k)
+        self.code.emit(REMOVE)
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        self(node.c)
+        self(node.l)
+        self.code.emit(INTO)
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        self(node.m)
+        self.check(rt.check_ordered)
+        self(node.lo)
+        self(node.hi)
+        self.code.emit(BETWEEN)
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        self(node.m)
+        self.code.emit(KEYS)
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        for e in node.elements:
+            self(e)
+        self.code.emit(LIST, len(node.elements))
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(HEAD)
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(TAIL)
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        self(node.tail)
+        self.check(rt.check_list)
+        self(node.head)
+        self.code.emit(PUSH)
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(PRINT)
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(TYPE)
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(MEMO)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(VEC)
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        self(node.arg)
+        self.code.emit(ORDERED)
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        self.code.emit(CONST, self.code.const(node))
@@ -0,0 +1,547 @@
+##################################################################################
+# Common-subexpression elimination and loop-invariant hoisting
+##################################################################################
+
+# Rewrites an AST so that repeated pure expressions are evaluated once. An
+# expression qualifies if it is built from arithmetic, comparisons, && || !,
+# get, head and type over literals and variables that are never set. Its value
+# then only depends on the bindings of those variables, and it is never a newly
+# allocated list or map, whose identity == could tell apart from a recomputed
+# one.
+#
+# Within a function body (or the top level), the first evaluation of an
+# expression that occurs more than once is bound to a fresh variable with let,
+# and later evaluations that are certain to happen after it read the variable
+# instead. Lets are never introduced inside a while loop, where they would be
+# re-declared on the next iteration.
+#
+# An expression in a while loop whose variables are bound before the loop and
+# not declared in it is hoisted in front of the loop if every iteration
+# evaluates it before anything that may fail or have an effect. An expression
+# of the loop body is only evaluated in front of the loop if the condition, which
+# must be pure, holds. The program therefore prints, fails and returns exactly
+# as before.
+
+import copy
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.effects import Effects, nodes, pure_functions
+
+OPS = frozenset([Add, Sub, Mul, Div, Mod, Eq, NotEq, Lt, Lte, Gt, Gte, And, Or, Not, Get, Head,
+                 Type])
+
+
+def local_nodes(node):
+    # Like nodes, but does not descend into the bodies of functions.
+    yield node
+    if type(node) is not Fun:
+        for c in children(node):
+            yield from local_nodes(c)
+
+
+def key_vars(key):
+    if key[0] is Var:
+        return {key[1]}
+    out = set()
+    for k in key[1:]:
+        if type(k) is tuple:
+            out |= key_vars(k)
+    return out
+
+
+def declared_names(node):
+    out = set()
+    for n in local_nodes(node):
+        if type(n) is Let or type(n) is Mut:
+            out.add(n.var.val)
+        elif type(n) is Fun and n.name is not None:
+            out.add(n.name)
+    return out
+
+
+class CSE(Visitor):
+    # Variables are named prefix followed by a number. The numbering continues across
+    # programs, so that programs run against the same top-level scope, e.g. in the repl, do
+    # not declare the same variable twice.
+    def __init__(self, prefix="_cse"):
+        self.prefix = prefix
+        self.next = 0
+        self.names = None
+
+    def __call__(self, node):
+        if self.names is not None:
+            return node.accept(self)
+        self.names = set()
+        self.assigned = set()
+        for n in nodes(node):
+            if type(n) is Var:
+                self.names.add(n.val)
+            elif type(n) is Fun:
+                self.names.update(n.params)
+                if n.name is not None:
+                    self.names.add(n.name)
+            elif type(n) is Let or type(n) is Mut or type(n) is Set:
+                self.names.add(n.var.val)
+                if type(n) is Set:
+                    self.assigned.add(n.var.val)
+        self.effects = Effects(pure_functions(node))
+        self.keys = {}
+        self.enter(node, set())
+        try:
+            return node.accept(self)
+        finally:
+            self.names = None
+
+    def enter(self, body, bound):
+        # available expression key -> variable holding its value
+        self.avail = {}
+        self.declared = bound
+        self.loops = 0
+        self.counts = {}
+        for n in local_nodes(body):
+            if type(n) in OPS:
+                k = self.key(n)
+                if k is not None:
+                    self.counts[k] = self.counts.get(k, 0) + 1
+
+    def key(self, node):
+        # Returns a hashable description of the value of a qualifying expression, else None.
+        if node in self.keys:
+            return self.keys[node]
+        t = type(node)
+        out = None
+        if t is Int or t is Bool:
+            out = (t, node.val)
+        elif t is Str:
+            out = None if node.decoded is None else (t, node.val)
+        elif t is Nil:
+            out = (t,)
+        elif t is Var:
+            out = None if node.val in self.assigned else (t, node.val)
+        elif t in OPS:
+            subs = [self.key(c) for c in children(node)]
+            out = None if None in subs else (t,) + tuple(subs)
+        self.keys[node] = out
+        return out
+
+    def temp(self):
+        while True:
+            name = "%s%d" % (self.prefix, self.next)
+            self.next += 1
+            if name not in self.names:
+                return name
+
+    def bind(self, k, node):
+        name = self.temp()
+        self.avail[k] = name
+        self.declared.add(name)
+        return Let(Var(name), node)
+
+    def kill(self, avail, names):
+        # Drops the expressions reading names, which were declared anew and may now refer to a
+        # different variable.
+        for k in list(avail):
+            if key_vars(k) & names:
+                del avail[k]
+
+    def declare(self, name):
+        self.kill(self.avail, {name})
+        self.declared.add(name)
+
+    def branch(self, node):
+        # Code that may not run makes no expression available afterwards.
+        avail, declared = self.avail, self.declared
+        self.avail, self.declared = dict(avail), set(declared)
+        out = self(node)
+        self.kill(avail, self.declared - declared)
+        self.avail, self.declared = avail, declared
+        return out
+
+    def op(self, node, operands):
+        k = self.key(node)
+        if k is None:
+            operands(node)
+            return node
+        # occurrences of the expression after this one
+        self.counts[k] = left = self.counts.get(k, 0) - 1
+        if k in self.avail:
+            return Var(self.avail[k])
+        operands(node)
+        if self.loops == 0 and left > 0:
+            return self.bind(k, node)
+        return node
+
+    def invariant(self, node, loop_decls):
+        if not type(node) in OPS:
+            return False
+        k = self.key(node)
+        if k is None:
+            return False
+        names = key_vars(k)
+        return names <= self.declared and not (names & loop_decls)
+
+    def scan(self, node, out, loop_decls):
+        # Appends to out the invariant expressions that evaluating node evaluates before
+        # anything that may fail or have an effect. Returns False once it reaches such a node.
+        t = type(node)
+        if self.invariant(node, loop_decls):
+            out.append(node)
+            return True
+        if t is Int or t is Bool or t is Nil or (t is Str and node.decoded is not None):
+            return True
+        if t is Var:
+            return node.val in self.declared and node.val not in loop_decls
+        if t is Seq:
+            return self.scan(node.first, out, loop_decls) and self.scan(node.second, out, loop_decls)
+        if t is List:
+            return all(self.scan(e, out, loop_decls) for e in node.elements)
+        if t is Map or t is Fun:
+            return False
+        if t is If or t is While:
+            self.scan(node.cond, out, loop_decls)
+            return False
+        if t is And or t is Or:
+            self.scan(node.first, out, loop_decls)
+            return False
+        if t is Call:
+            self.scan(node.fun, out, loop_decls)
+            return False
+        for c in children(node):
+            if not self.scan(c, out, loop_decls):
+                return False
+        return False
+
+    def hoist(self, node):
+        # Returns the declarations of the invariant expressions of the while loop node, which
+        # become available, and the keys of those only valid if the loop body runs.
+        if self.effects(node.cond) or any(type(n) is Fun for n in local_nodes(node.cond)):
+            return [], []
+        loop_decls = declared_names(node)
+        found_cond, found_body = [], []
+        self.scan(node.cond, found_cond, loop_decls)
+        self.scan(node.body, found_body, loop_decls)
+        out, guarded = [], []
+        for e in found_cond:
+            k = self.key(e)
+            if k in self.avail:
+                continue
+            e = self(e)
+            out.append(e if k in self.avail else self.bind(k, e))
+        cond = None
+        for e in found_body:
+            k = self.key(e)
+            if k in self.avail:
+                continue
+            if cond is None:
+                cond = self.branch(copy.deepcopy(node.cond))
+            out.append(self.bind(k, If(cond, self.branch(e), Nil.instance())))
+            guarded.append(k)
+        return out, guarded
+
+    def visit_binop(self, node):
+        node.first = self(node.first)
+        node.second = self(node.second)
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return node
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return node
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.op(node, self.visit_binop)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return node
+
+    def short_circuit(self, node):
+        node.first = self(node.first)
+        node.second = self.branch(node.second)
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        return self.op(node, self.short_circuit)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        return self.op(node, self.short_circuit)
+
+    def unop(self, node):
+        node.arg = self(node.arg)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        return self.op(node, self.unop)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        return node
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        node.cond = self(node.cond)
+        avail, declared = self.avail, self.declared
+        self.avail, self.declared = dict(avail), set(declared)
+        node.first = self(node.first)
+        first = self.declared
+        self.avail, self.declared = dict(avail), set(declared)
+        node.second = self(node.second)
+        second = self.declared
+        self.kill(avail, (first | second) - declared)
+        self.avail, self.declared = avail, first & second
+        return node
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        # A declaration in the loop may change what a name refers to on the next iteration.
+        self.kill(self.avail, declared_names(node))
+        prologue, guarded = self.hoist(node) if self.loops == 0 else ([], [])
+        avail, declared = self.avail, self.declared
+        self.avail, self.declared = dict(avail), set(declared)
+        self.loops += 1
+        try:
+            node.cond = self(node.cond)
+            cond_declared = set(self.declared)
+            node.body = self(node.body)
+        finally:
+            self.loops -= 1
+        self.kill(avail, self.declared - declared)
+        for k in guarded:
+            avail.pop(k, None)
+        self.avail, self.declared = avail, cond_declared
+        out = node
+        for decl in reversed(prologue):
+            out = Seq(decl, out)
+        return out
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        node.expr = self(node.expr)
+        self.declare(node.var.val)
+        return node
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        node.expr = self(node.expr)
+        self.declare(node.var.val)
+        return node
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        node.expr = self(node.expr)
+        return node
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        return node
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        self.visit_binop(node)
+        return node
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        outer = (self.avail, self.declared, self.loops, self.counts)
+        bound = set(node.params)
+        if node.name is not None:
+            bound.add(node.name)
+        self.enter(node.body, bound)
+        try:
+            node.body = self(node.body)
+        finally:
+            self.avail, self.declared, self.loops, self.counts = outer
+        if node.name is not None:
+            self.declare(node.name)
+        return node
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        node.fun = self(node.fun)
+        node.args = [self(a) for a in node.args]
+        return node
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        # Keys are left as they are: the literal orders its entries by the hashes of the key
+        # nodes.
+        pairs = []
+        for k, v in node.mappings.items():
+            pairs.append((k, self.branch(v)))
+        node.mappings = P_Tree(init_mappings=pairs)
+        return node
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+
+        def operands(node):
+            node.m = self(node.m)
+            node.k = self(node.k)
+        return self.op(node, operands)
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        node.v = self(node.v)
+        return node
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        return node
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        node.c = self(node.c)
+        node.l = self(node.l)
+        return node
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        node.m = self(node.m)
+        node.lo = self(node.lo)
+        node.hi = self(node.hi)
+        return node
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        node.m = self(node.m)
+        return node
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        return self.op(node, self.unop)
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        node.elements = P_List(initial=[self(e) for e in node.elements])
+        return node
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        return self.op(node, self.unop)
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        node.tail = self(node.tail)
+        node.head = self(node.head)
+        return node
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return node
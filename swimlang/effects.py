@@ -0,0 +1,282 @@
+##################################################################################
+# Effect analysis
+##################################################################################
+
+# Classifies AST subtrees as pure or effectful. Evaluating an effectful node may
+# do more than compute a value or fail: print, exit, set or declare a variable,
+# or call a function. A call is pure only if its callee is known: a name that
+# is bound to the same named function everywhere in the program, whose body is
+# pure assuming the same of the known functions it calls. Reading a variable,
+# creating a closure and not terminating are not effects.
+
+from swimlang.ast import *
+from swimlang.visitor import *
+
+
+def nodes(node):
+    yield node
+    for c in children(node):
+        yield from nodes(c)
+
+
+def known_functions(node):
+    # Returns name -> Fun for the names that are declared exactly once, by a fun declaration,
+    # and are never a param or the target of a set.
+    funs = {}
+    others = set()
+    for n in nodes(node):
+        t = type(n)
+        if t is Fun:
+            others.update(n.params)
+            if n.name is not None:
+                funs.setdefault(n.name, []).append(n)
+        elif t is Let or t is Mut or t is Set:
+            others.add(n.var.val)
+    return {name: f[0] for name, f in funs.items() if len(f) == 1 and name not in others}
+
+
+def pure_functions(node):
+    # Returns the names of the known functions whose calls are pure.
+    funs = known_functions(node)
+    pure = set(funs)
+    changed = True
+    while changed:
+        changed = False
+        for name in sorted(pure):
+            if Effects(pure)(funs[name].body):
+                pure.discard(name)
+                changed = True
+    return frozenset(pure)
+
+
+class Effects(Visitor):
+    # Returns True if evaluating a node may have an effect. pure_funs holds the names of the
+    # functions whose calls are pure.
+    def __init__(self, pure_funs=frozenset()):
+        self.pure_funs = pure_funs
+
+    def visit_binop(self, node):
+        return self(node.first) or self(node.second)
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return False
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return True
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return False
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        return False
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        return self(node.cond) or self(node.first) or self(node.second)
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        return self(node.cond) or self(node.body)
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        return True
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        return True
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        return True
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        return False
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        # A declaration binds the name of the function.
+        return node.name is not None
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        if not (type(node.fun) is Var and node.fun.val in self.pure_funs):
+            return True
+        return any(self(a) for a in node.args)
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        return any(self(k) or self(v) for k, v in node.mappings.items())
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        return self(node.m) or self(node.k)
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        return self(node.m) or self(node.k) or self(node.v)
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        return self(node.m) or self(node.k)
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        return self(node.c) or self(node.l)
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        return self(node.m) or self(node.lo) or self(node.hi)
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        return self(node.m)
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        return any(self(e) for e in node.elements)
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        return self(node.tail) or self(node.head)
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        return True
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        return self(node.arg)
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return False
@@ -2,135 +2,244 @@
 # AST evaluator
 ##################################################################################
 
-# FixMe: evaluations should always result in an instance of Node, never
-# a python int, str, etc. This way, we won't have to worry about
-# wrapping/unwrapping in an ad hoc way.
-
-import enum
-import json
+import operator
 import sys
 from swimlang.ast import *
 from swimlang.visitor import *
-from swimlang.tokenizer import QUOTE
-
-
-@enum.unique
-class Scope(enum.Enum):
-    PARAM = enum.auto()
-    LOCAL = enum.auto()
-    INHERITED = enum.auto()
-
-
-@enum.unique
-class Decl(enum.Enum):
-    LET = enum.auto()
-    MUT = enum.auto()
-    NONE = enum.auto()  # used for set <var> <val>
-
-
-class Binding(object):
-    def __init__(self, scope, decl, val):
-        if type(scope) is not Scope:
-            raise TypeError
-        if type(decl) is not Decl:
-            raise TypeError
-        self.scope = scope
-        self.decl = decl
-        self.val = val
-
-
-class Frame(object):
-    def __init__(self, fun, env):
-        if not (type(fun) is Fun or fun is None):
+from swimlang.resolver import FunScope, Resolver
+from swimlang.runtime import Frame, Cell, UNBOUND, LET, MUT
+import swimlang.runtime as rt
+
+# Variables live in fixed-size frames. The Resolver assigns every Var, Let, Mut, Set and
+# declared Fun node the slot of its name in the enclosing function's frame, and a closure
+# copies only the slots its body refers to. A call therefore allocates two lists of the size
+# of the callee's frame, independent of the size of the environment it was declared in. Mut
+# variables captured by a closure are held in a Cell shared with the closure, so a set is a
+# single store.
+#
+# Arithmetic and comparison nodes specialize themselves. After its first evaluation, a node
+# whose operands are variables or literals and whose operand values were both ints, or
+# both strs, gets node.quick: a function of the frame's values that loads the operands
+# directly, without visiting them, and applies the operator if the guard on their types
+# holds. When the guard fails the node is deoptimized for good and evaluated generically.
+#
+# Likewise a while loop that counts a mut variable up or down to a bound, see counted, keeps
+# the counter in a python int and does not evaluate the condition or the set of the
+# counter. It continues as a general loop if the counter or the bound stops being an int.
+
+DEOPT = object()
+
+# Operators specialized for strs
+STR_OPS = frozenset([operator.add, operator.eq, operator.ne,
+                     operator.lt, operator.le, operator.gt, operator.ge])
+
+
+def operand(node):
+    # Returns (slot, None) for a variable, (None, value) for a literal, and None otherwise.
+    if type(node) is Var:
+        return (node.slot, None)
+    if type(node) is Int or (type(node) is Str and node.decoded is not None):
+        return (None, node.val if type(node) is Int else node.decoded)
+    return None
+
+
+def quicken(node, op, a, b):
+    t = type(a)
+    if not (type(b) is t and (t is int or (t is str and op in STR_OPS))):
+        return False
+    first, second = operand(node.first), operand(node.second)
+    if first is None or second is None:
+        return False
+    (s1, c1), (s2, c2) = first, second
+    if s1 is not None and s2 is not None:
+        def quick(vals):
+            a = vals[s1]
+            b = vals[s2]
+            if type(a) is t and type(b) is t:
+                return op(a, b)
+            return DEOPT
+    elif s1 is not None:
+        def quick(vals):
+            a = vals[s1]
+            if type(a) is t:
+                return op(a, c2)
+            return DEOPT
+    elif s2 is not None:
+        def quick(vals):
+            b = vals[s2]
+            if type(b) is t:
+                return op(c1, b)
+            return DEOPT
+    else:
+        return False
+    return quick
+
+
+# Comparisons of a counted loop, and the same comparisons with their operands swapped
+COUNTED_OPS = {Lt: operator.lt, Lte: operator.le, Gt: operator.gt, Gte: operator.ge,
+               NotEq: operator.ne}
+SWAPPED_OPS = {Lt: operator.gt, Lte: operator.ge, Gt: operator.lt, Gte: operator.le,
+               NotEq: operator.ne}
+
+
+def local_nodes(node):
+    # Yields the nodes of node that run in the same frame.
+    yield node
+    if type(node) is not Fun:
+        for c in children(node):
+            yield from local_nodes(c)
+
+
+def step(node, slot):
+    # Returns c if node is (set i (+ i c)), (set i (+ c i)) or (set i (- i c)) for an int
+    # literal c and the variable i in slot, else None.
+    if type(node) is not Set or node.slot != slot:
+        return None
+    e = node.expr
+    if type(e) is Add or type(e) is Sub:
+        if type(e.first) is Var and e.first.slot == slot and type(e.second) is Int:
+            return e.second.val if type(e) is Add else -e.second.val
+        if type(e) is Add and type(e.first) is Int and type(e.second) is Var and \
+                e.second.slot == slot:
+            return e.first.val
+    return None
+
+
+def counted(node):
+    # Recognizes a loop (while (< i n) ... (set i (+ i 1)) ...) that compares a variable i
+    # with a variable or int literal n, and whose body sets i once, in one of its top-level
+    # statements, by adding or subtracting an int literal. No other code of the frame may
+    # declare or set i. Returns (comparison of i and n, slot of i, slot of n or None, n if a
+    # literal, statements of the body, index of the set, step), else False.
+    cond = node.cond
+    if type(cond) not in COUNTED_OPS:
+        return False
+    first, second = operand(cond.first), operand(cond.second)
+    if first is None or second is None:
+        return False
+    stmts = []
+    body = node.body
+    while type(body) is Seq:
+        stmts.append(body.first)
+        body = body.second
+    stmts.append(body)
+    for (counter, _), (bound, n), ops in [(first, second, COUNTED_OPS),
+                                          (second, first, SWAPPED_OPS)]:
+        if counter is None or counter == bound or not (bound is not None or type(n) is int):
+            continue
+        sets = [i for i, s in enumerate(stmts) if step(s, counter) is not None]
+        if len(sets) != 1:
+            continue
+        index = sets[0]
+        others = [x for i, s in enumerate(stmts) if i != index for x in local_nodes(s)]
+        others += list(local_nodes(stmts[index].expr))
+        if any(type(x) in [Let, Mut, Set, Fun] and x.slot == counter for x in others):
+            continue
+        return (ops[type(cond)], counter, bound, n, stmts, index, step(stmts[index], counter))
+    return False
+
+
+class TailCall(object):
+    def __init__(self, fun, vals):
+        if not type(fun) is Fun:
             raise TypeError
-        if not type(env) is dict:
+        if not type(vals) is list:
             raise TypeError
         self.fun = fun
-        self.env = env
+        self.vals = vals
 
 
 class Evaluator(Visitor):
-    def __init__(self):
-        self.stack = [Frame(None, {})]
+    def __init__(self, memo_size=rt.MEMO_SIZE, max_steps=None, max_memory=None):
+        # The top-level scope and frame persist across programs, e.g. in the repl.
+        self.scope = FunScope(None, None)
+        self.top = Frame(self.scope, None, [], [], None)
+        self.frame = None
+        # Caches of the functions memoized by the programs run so far
+        self.memos = rt.Memos(memo_size)
+        # Counts the steps of the programs run so far if their number is limited
+        self.budget = None if max_steps is None else rt.Budget(max_steps)
+        # Counts the memory the programs run so far allocate if it is limited
+        self.quota = None if max_memory is None else rt.Quota(max_memory)
+
+    def __call__(self, node):
+        if self.frame is not None:
+            return node.accept(self)
+        self.enter(node)
+        try:
+            return node.accept(self)
+        finally:
+            self.frame = None
+
+    def enter(self, node):
+        # Resolves a program against the top-level scope and makes the top-level frame current.
+        Resolver(self.scope)(node)
+        grow = self.scope.size() - len(self.top.vals)
+        self.top.vals += [UNBOUND] * grow
+        self.top.kinds += [None] * grow
+        # Variables declared by earlier programs may now be captured by a closure.
+        for slot in self.scope.cells:
+            val = self.top.vals[slot]
+            if not (val is UNBOUND or type(val) is Cell):
+                self.top.vals[slot] = Cell(val)
+        self.frame = self.top
 
     def current_frame(self):
-        return self.stack[-1]
-
-    def read(self, name, frame=None):
-        if type(name) is not str:
-            raise TypeError
-        frame = self.current_frame() if frame is None else frame
-        if name in frame.env:
-            return frame.env[name]
-        return None
-
-    def write(self, name, binding, frame=None):
-        if type(name) is not str:
-            raise TypeError
-        frame = self.current_frame() if frame is None else frame
-        current_binding = frame.env.get(name, None)
-        if current_binding is None:
-            frame.env[name] = binding
-        elif current_binding.scope == Scope.LOCAL:
-            if binding.decl in [Decl.LET, Decl.MUT]:
-                raise ValueError(
-                    "re-declaration of %s inside local scope" % name)
-            elif current_binding.decl == Decl.LET:
-                raise ValueError("cannot rebind non-mutable %s" % name)
-            else:
-                frame.env[name] = binding
-        elif current_binding.scope == Scope.INHERITED:
-            if binding.decl in [Decl.LET, Decl.MUT]:
-                frame.env[name] = binding
-            elif current_binding.decl == Decl.LET:
-                raise ValueError("cannot rebind non-mutable %s" % name)
-            else:
-                frame.env[name] = binding
-        elif current_binding.scope == Scope.PARAM:
-            if binding.decl in [Decl.LET, Decl.MUT]:
-                raise ValueError("re-declaration of param %s" % name)
-            elif current_binding.decl == Decl.LET:
-                raise ValueError("cannot rebind non-mutable %s" % name)
-            else:
-                raise AssertionError("found mutable param %s" % name)
-        else:
-            raise AssertionError("unknown scope type %s" %
-                                 str(current_binding.scope))
+        return self.frame
 
     def visit_int(self, node):
         if not type(node) is Int:
             raise TypeError
         return node.val
 
+    def binop(self, node, op):
+        quick = node.quick
+        if quick:
+            out = quick(self.frame.vals)
+            if out is not DEOPT:
+                return out
+            node.quick = False
+        a = self(node.first)
+        b = self(node.second)
+        if quick is None:
+            node.quick = quicken(node, op, a, b)
+        return op(a, b)
+
     def visit_add(self, node):
         if not type(node) is Add:
             raise TypeError
-        return self(node.first) + self(node.second)
+        out = self.binop(node, operator.add)
+        if self.quota is not None:
+            self.quota.string(self.frame.fun, out)
+        return out
 
     def visit_sub(self, node):
         if not type(node) is Sub:
             raise TypeError
-        return self(node.first) - self(node.second)
+        return self.binop(node, operator.sub)
 
     def visit_mul(self, node):
         if not type(node) is Mul:
             raise TypeError
-        return self(node.first) * self(node.second)
+        out = self.binop(node, operator.mul)
+        if self.quota is not None:
+            self.quota.string(self.frame.fun, out)
+        return out
 
     def visit_div(self, node):
         if not type(node) is Div:
             raise TypeError
-        return int(self(node.first) / self(node.second))
+        return self.binop(node, rt.div)
 
     def visit_mod(self, node):
         if not type(node) is Mod:
             raise TypeError
-        return self(node.first) % self(node.second)
+        return self.binop(node, operator.mod)
 
     def visit_eq(self, node):
         if not type(node) is Eq:
             raise TypeError
-        return self(node.first) == self(node.second)
+        return self.binop(node, operator.eq)
 
     def visit_exit(self, node):
         if not type(node) is Exit:
@@ -140,27 +249,27 @@ class Evaluator(Visitor):
     def visit_not_eq(self, node):
         if not type(node) is NotEq:
             raise TypeError
-        return self(node.first) != self(node.second)
+        return self.binop(node, operator.ne)
 
     def visit_lt(self, node):
         if not type(node) is Lt:
             raise TypeError
-        return self(node.first) < self(node.second)
+        return self.binop(node, operator.lt)
 
     def visit_lte(self, node):
         if not type(node) is Lte:
             raise TypeError
-        return self(node.first) <= self(node.second)
+        return self.binop(node, operator.le)
 
     def visit_gt(self, node):
         if not type(node) is Gt:
             raise TypeError
-        return self(node.first) > self(node.second)
+        return self.binop(node, operator.gt)
 
     def visit_gte(self, node):
         if not type(node) is Gte:
             raise TypeError
-        return self(node.first) >= self(node.second)
+        return self.binop(node, operator.ge)
 
     def visit_bool(self, node):
         if not type(node) is Bool:
@@ -185,7 +294,9 @@ class Evaluator(Visitor):
     def visit_str(self, node):
         if not type(node) is Str:
             raise TypeError
-        return json.loads('%s%s%s' % (QUOTE, node.val, QUOTE))
+        if node.decoded is None:
+            node.decode()
+        return node.decoded
 
     def visit_if(self, node):
         if not type(node) is If:
@@ -195,57 +306,89 @@ class Evaluator(Visitor):
     def visit_while(self, node):
         if not type(node) is While:
             raise TypeError
+        if node.quick is None:
+            node.quick = counted(node)
         out = False
+        if node.quick:
+            done, out = self.counted_while(node, out)
+            if done:
+                return out
+        budget = self.budget
         while(self(node.cond)):
             out = self(node.body)
+            if budget is not None:
+                budget.loop(budget.loop_cost(node))
         return out
 
+    def counted_while(self, node, out):
+        # Runs the iterations of a counted loop while its counter and bound are ints. Returns
+        # whether the loop has finished, and the value of the last iteration.
+        op, slot, bound, n, stmts, index, step = node.quick
+        budget = self.budget
+        cost = None if budget is None else budget.loop_cost(node)
+        frame = self.frame
+        vals = frame.vals
+        if frame.kinds[slot] is not MUT:
+            return False, out
+        before, after = stmts[:index], stmts[index + 1:]
+        while True:
+            i = vals[slot]
+            if bound is not None:
+                n = vals[bound]
+            if not (type(i) is int and type(n) is int):
+                return False, out
+            if not op(i, n):
+                return True, out
+            for s in before:
+                out = self(s)
+            vals[slot] = out = i + step
+            for s in after:
+                out = self(s)
+            if budget is not None:
+                budget.loop(cost)
+
     def visit_let(self, node):
         if not type(node) is Let:
             raise TypeError
-        val = self(node.expr)
-        binding = Binding(Scope.LOCAL, Decl.LET, val)
-        self.write(node.var.val, binding)
-        return val
+        return self.declare(node.slot, LET, self(node.expr))
 
     def visit_mut(self, node):
         if not type(node) is Mut:
             raise TypeError
-        val = self(node.expr)
-        binding = Binding(Scope.LOCAL, Decl.MUT, val)
-        self.write(node.var.val, binding)
-        return val
+        return self.declare(node.slot, MUT, self(node.expr))
+
+    def declare(self, slot, kind, val):
+        frame = self.frame
+        if slot in frame.scope.cells:
+            return rt.declare_cell(frame.scope.names, frame.vals, frame.kinds, slot, kind, val)
+        return rt.declare(frame.scope.names, frame.vals, frame.kinds, slot, kind, val)
 
     def visit_set(self, node):
         if not type(node) is Set:
             raise TypeError
-        binding = self.read(node.var.val)
-        if binding is None:
+        if self.frame.kinds[node.slot] is None:
             raise ValueError
-        val = self(node.expr)
-        binding = Binding(binding.scope, Decl.NONE, val)
-        self.write(node.var.val, binding)
-        # Propagate write up call stack as long as the calling context is the same as the lexical
-        # scope, as is the case when nested functions are called within their enclosing lexical
-        # scope. Note that the lexical scope can be different from the calling context, e.g.
-        # when a nested function is returned and subsequently called outside of its lexical scope;
-        # in this case, no propagation is necessary.
-        fun = self.current_frame().fun
-        idx = -2  # index for previous stack frame
-        while binding.scope == Scope.INHERITED and fun and fun.lexical_scope == self.stack[idx].fun:
-            binding = self.read(node.var.val, self.stack[idx])
-            binding.val = val
-            fun = fun.lexical_scope
-            idx -= 1
+        return self.rebind(node, self(node.expr))
+
+    def rebind(self, node, val):
+        frame = self.frame
+        rt.check_set(frame.scope.names, frame.kinds, node.slot)
+        cell = frame.vals[node.slot]
+        if type(cell) is Cell:
+            cell.val = val
+        else:
+            frame.vals[node.slot] = val
         return val
 
     def visit_var(self, node):
         if not type(node) is Var:
             raise TypeError
-        binding = self.read(node.val)
-        if binding is None:
-            raise ValueError
-        return binding.val
+        val = self.frame.vals[node.slot]
+        if type(val) is Cell:
+            return val.val
+        if val is UNBOUND:
+            rt.load_error(self.frame.scope.names, node.slot)
+        return val
 
     def visit_seq(self, node):
         if not type(node) is Seq:
@@ -264,18 +407,16 @@ class Evaluator(Visitor):
         # Function delcaration case.
         # Make an anonymous copy of the function which will be returned.
         # This is important to prevent re-declarations and to support closures.
-        out = Fun(None, node.params, node.body, self.current_frame().fun)
-        out.env = {}
-        for name, binding in self.current_frame().env.items():
-            out.env[name] = Binding(Scope.INHERITED, binding.decl, binding.val)
-        out.env[node.name] = Binding(Scope.PARAM, Decl.LET, out)
-        self.write(node.name, Binding(Scope.LOCAL, Decl.LET, out))
-        return out
+        frame = self.frame
+        out = rt.new_closure(node, node.scope, node.body, frame.fun, frame.vals, frame.kinds)
+        return self.declare(node.slot, LET, out)
 
     def visit_call(self, node):
         if not type(node) is Call:
             raise TypeError
-        fun = self(node.fun)
+        return self.call(node, self(node.fun))
+
+    def call(self, node, fun):
         if not type(fun) is Fun:
             # Non-functions are callable in that they take no arguments and return themselves.
             if len(node.args) == 0:
@@ -285,59 +426,118 @@ class Evaluator(Visitor):
         if len(fun.params) < len(node.args):
             # Too many arguments supplied
             raise ValueError
-        if len(fun.params) == len(node.args):
-            # All params available - evaluate the function
-            env = {}
-            for name, binding in fun.env.items():
-                env[name] = Binding(binding.scope, binding.decl, binding.val)
-            for i, a in enumerate(node.args):
-                name = fun.params[i]
-                env[name] = Binding(Scope.PARAM, Decl.LET, self(a))
-            self.stack.append(Frame(fun, env))
-            out = self(fun.body)
-            self.stack.pop()
-        else:
+        args = [self(a) for a in node.args]
+        if len(fun.params) > len(args):
             # Not all params available - return a closure
-            params = [p for p in fun.params[len(node.args):]]
-            out = Fun(None, params, fun.body, fun.lexical_scope)
-            for name, binding in fun.env.items():
-                out.env[name] = Binding(
-                    binding.scope, binding.decl, binding.val)
-            for i, a in enumerate(node.args):
-                name = fun.params[i]
-                out.env[name] = Binding(Scope.PARAM, Decl.LET, self(a))
-        return out
+            return rt.partial(fun, args)
+        memo = fun.memo
+        if memo is not None:
+            key = memo.key(fun, args)
+            out = memo.get(key)
+            if out is not rt.MISSING:
+                return out
+        # All params available - evaluate the function. Calls in tail position of the body
+        # return a TailCall rather than recursing, and the callee replaces the current frame.
+        back = self.frame
+        frame = Frame(fun.scope, fun, rt.bind(fun, args), list(fun.kinds), back)
+        budget = self.budget
+        while True:
+            if budget is not None:
+                budget.call(budget.call_cost(fun.body))
+            self.frame = frame
+            out = self.eval_body(fun.body)
+            if not type(out) is TailCall:
+                self.frame = back
+                if memo is not None:
+                    memo.put(key, out)
+                return out
+            fun = out.fun
+            frame = Frame(fun.scope, fun, out.vals, list(fun.kinds), back)
+
+    def eval_body(self, node):
+        # Evaluates a function body, following the tail positions of sequences and ifs. A call
+        # in tail position is returned as a TailCall, unless the callee is memoized.
+        while True:
+            if type(node) is Seq:
+                self(node.first)
+                node = node.second
+            elif type(node) is If:
+                node = node.first if self(node.cond) else node.second
+            else:
+                break
+        if not type(node) is Call:
+            return self(node)
+        fun = self(node.fun)
+        if not type(fun) is Fun or len(fun.params) != len(node.args) or fun.memo is not None:
+            return self.call(node, fun)
+        return TailCall(fun, rt.bind(fun, [self(a) for a in node.args]))
 
     def visit_map(self, node):
         if not type(node) is Map:
             raise TypeError
-        mappings = {}
+        pairs = []
         for k, v in node.mappings.items():
-            mappings[Node.wrap(self(k))] = Node.wrap(self(v))
-        return Map(mappings)
+            v = self(v)
+            pairs.append((self(k), v))
+        out = rt.make_map(pairs)
+        if self.quota is not None:
+            self.quota.map(self.frame.fun, len(out.mappings))
+        return out
 
     def visit_get(self, node):
         if not type(node) is Get:
             raise TypeError
         m = self(node.m)
+        if type(m) is List:
+            return rt.nth(m, self(node.k))
         if not type(m) is Map:
             raise TypeError
-        k = Node.wrap(self(node.k))
-        if k not in m.mappings:
-            raise KeyError
-        v = m.mappings[k]
-        return self(v)
+        return m.mappings.get(self(node.k))
 
     def visit_put(self, node):
         if not type(node) is Put:
             raise TypeError
         m = self(node.m)
+        if not (type(m) is Map or type(m) is List):
+            raise TypeError
+        k = self(node.k)
+        v = self(node.v)
+        if self.quota is not None:
+            self.quota.put(self.frame.fun, m, k)
+        if type(m) is List:
+            return rt.assoc(m, k, v)
+        return Map(m.mappings.put(k, v))
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        m = self(node.m)
         if not type(m) is Map:
             raise TypeError
-        k = Node.wrap(self(node.k))
-        v = Node.wrap(self(node.v))
-        new_mappings = m.mappings.put(k, v)
-        return Map(new_mappings)
+        k = self(node.k)
+        if self.quota is not None:
+            self.quota.remove(self.frame.fun, m, k)
+        return Map(m.mappings.remove(k))
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        c = self(node.c)
+        out, nodes = rt.build_into(c, self(node.l))
+        if self.quota is not None:
+            self.quota.into(self.frame.fun, out, nodes)
+        return out
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        m = self(node.m)
+        if not (type(m) is Map and type(m.mappings) is P_SortedMap):
+            raise TypeError
+        out = rt.between(m, self(node.lo), self(node.hi))
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(out.elements))
+        return out
 
     def visit_keys(self, node):
         if not type(node) is Keys:
@@ -346,12 +546,17 @@ class Evaluator(Visitor):
         if not type(m) is Map:
             raise TypeError
         keys = List(m.mappings.keys())
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(keys.elements))
         return keys
 
     def visit_list(self, node):
         if not type(node) is List:
             raise TypeError
-        return List([Node.wrap(self(e)) for e in node.elements])
+        out = rt.make_list([self(e) for e in node.elements])
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(out.elements))
+        return out
 
     def visit_head(self, node):
         if not type(node) is Head:
@@ -361,8 +566,7 @@ class Evaluator(Visitor):
             raise TypeError
         if len(l.elements) <= 0:
             raise ValueError
-        head = l.elements.head()
-        return self(head)
+        return l.elements.head()
 
     def visit_tail(self, node):
         if not type(node) is Tail:
@@ -381,9 +585,10 @@ class Evaluator(Visitor):
         l = self(node.tail)
         if not type(l) is List:
             raise TypeError
-        tail = l.elements
-        head = Node.wrap(self(node.head))
-        return List(tail.push(head))
+        h = self(node.head)
+        if self.quota is not None:
+            self.quota.push(self.frame.fun, l)
+        return List(l.elements.push(h))
 
     def visit_print(self, node):
         if not type(node) is Print:
@@ -394,9 +599,31 @@ class Evaluator(Visitor):
     def visit_type(self, node):
         if not type(node) is Type:
             raise TypeError
-        return type(Node.wrap(self(node.arg)))
+        return rt.type_of(self(node.arg))
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        return self.memos.memoize(self(node.arg))
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        m = self(node.arg)
+        if self.quota is not None:
+            self.quota.ordered(self.frame.fun, m)
+        return rt.make_ordered(m)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        l = self(node.arg)
+        if self.quota is not None:
+            self.quota.vec(self.frame.fun, l)
+        return rt.make_vector(l)
 
     def visit_nil(self, node):
         if not type(node) is Nil:
             raise TypeError
         return node
+
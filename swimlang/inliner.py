@@ -0,0 +1,527 @@
+##################################################################################
+# Function inlining
+##################################################################################
+
+# Replaces the calls of small functions by their bodies, which saves creating a
+# frame for every call. A function declared by a top-level statement is
+# inlined if it is declared only once, does not call itself, is only ever
+# called with all of its arguments rather than passed around as a value, and
+# its body has at most size nodes. The names it refers to other than its own
+# must be declared once in the program, by earlier top-level lets or funs, so
+# that they refer to the same values at every call site.
+#
+# Only the calls in later top-level statements are inlined: they run after the
+# function is declared. The arguments are evaluated in order and bound to
+# fresh variables with let, followed by the body with its parameters and local
+# declarations renamed to fresh variables. An argument that is a variable is
+# used in place of the parameter instead if it is certainly declared and cannot
+# change before the body reads it. Inside a while loop, where a let would be
+# re-declared on the next iteration, only functions that declare nothing are
+# inlined, and their parameters are declared in front of the outermost loop:
+# with let if the argument is a literal, else with mut and set at the call
+# site.
+
+import copy
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.effects import nodes, known_functions
+from swimlang.cse import declared_names
+from swimlang.resolver import Resolver
+
+INLINE_SIZE = 40
+
+
+def statements(node):
+    # Returns the statements of a sequence in order.
+    out, todo = [], [node]
+    while todo:
+        n = todo.pop()
+        if type(n) is Seq:
+            todo.append(n.second)
+            todo.append(n.first)
+        else:
+            out.append(n)
+    return out
+
+
+class Inliner(Visitor):
+    # Variables are named prefix followed by a number, which continues across programs as in
+    # CSE.
+    def __init__(self, size=INLINE_SIZE, prefix="_inl"):
+        self.size = size
+        self.prefix = prefix
+        self.next = 0
+        # name -> [body size, number of calls inlined]
+        self.inlined = {}
+        self.funs = None
+
+    def __call__(self, node):
+        if self.funs is not None:
+            return node.accept(self)
+        self.names = set()
+        self.assigned = set()
+        for n in nodes(node):
+            if type(n) is Var:
+                self.names.add(n.val)
+            elif type(n) is Fun:
+                self.names.update(n.params)
+                self.names.add(n.name)
+            elif type(n) is Let or type(n) is Mut or type(n) is Set:
+                self.names.add(n.var.val)
+                if type(n) is Set:
+                    self.assigned.add(n.var.val)
+        self.funs = self.candidates(node) if self.size > 0 else {}
+        self.loops = 0
+        self.prelude = None
+        # names definitely declared in the current function at the current point
+        self.declared = set()
+        try:
+            stmts = statements(node)
+            for i, s in enumerate(stmts):
+                self.stmt = i
+                stmts[i] = self(s)
+            out = stmts.pop()
+            for s in reversed(stmts):
+                out = Seq(s, out)
+            return out
+        finally:
+            self.funs = None
+
+    def report(self):
+        # Returns (name, body size, number of calls inlined) for every function inlined so far.
+        return [(name, size, calls) for name, (size, calls) in self.inlined.items() if calls]
+
+    def candidates(self, node):
+        # Returns name -> (Fun, index of its statement) for the functions that may be inlined.
+        Resolver()(node)
+        stmts = statements(node)
+        top = {}
+        for i, s in enumerate(stmts):
+            if type(s) is Let:
+                top.setdefault(s.var.val, i)
+            elif type(s) is Fun:
+                top.setdefault(s.name, i)
+        decls, uses, calls = {}, {}, {}
+        for n in nodes(node):
+            t = type(n)
+            if t is Fun:
+                for name in n.params + [n.name]:
+                    decls[name] = decls.get(name, 0) + 1
+            elif t is Let or t is Mut:
+                decls[n.var.val] = decls.get(n.var.val, 0) + 1
+            elif t is Var:
+                uses[n.val] = uses.get(n.val, 0) + 1
+            elif t is Call and type(n.fun) is Var:
+                calls.setdefault(n.fun.val, []).append(len(n.args))
+        known = known_functions(node)
+        out = {}
+        for name, fun in known.items():
+            i = top.get(name)
+            if i is None or stmts[i] is not fun:
+                continue
+            # Passing the function, or calling it with too few or too many arguments
+            if calls.get(name, []) != [len(fun.params)] * uses.get(name, 0):
+                continue
+            if any(type(n) is Var and n.val == name for n in nodes(fun.body)):
+                continue
+            if not all(decls.get(v) == 1 and top.get(v, i) < i for v in fun.scope.free):
+                continue
+            # A nested function must not declare a name that is renamed.
+            renamed = set(fun.params) | fun.scope.decls
+            if any(type(n) is Fun and n is not fun and
+                   (set(n.params) | n.scope.decls) & renamed for n in nodes(fun)):
+                continue
+            # A body that re-declares a name or sets one that is not mut fails, and the
+            # error would name the renamed variable.
+            if not self.renamable(fun):
+                continue
+            out[name] = (fun, i)
+        return out
+
+    def renamable(self, fun):
+        # Whether the parameters and locals of fun are each declared once, outside of loops,
+        # and only those declared with mut are set.
+        decls = dict((p, 1) for p in fun.params)
+        muts = set()
+        sets = set()
+        for n in nodes(fun.body):
+            t = type(n)
+            if t is Let or t is Mut:
+                decls[n.var.val] = decls.get(n.var.val, 0) + 1
+                if t is Mut:
+                    muts.add(n.var.val)
+            elif t is Fun and n.name is not None:
+                decls[n.name] = decls.get(n.name, 0) + 1
+            elif t is Set:
+                sets.add(n.var.val)
+            elif t is While and any(type(d) is Let or type(d) is Mut or
+                                    (type(d) is Fun and d.name is not None) for d in nodes(n)):
+                return False
+        return all(c == 1 for c in decls.values()) and sets & set(decls) <= muts
+
+    def temp(self):
+        while True:
+            name = "%s%d" % (self.prefix, self.next)
+            self.next += 1
+            if name not in self.names:
+                return name
+
+    def branch(self, node):
+        # Declarations in code that may not run do not count as definite.
+        declared = set(self.declared)
+        out = self(node)
+        self.declared = declared
+        return out
+
+    def substitutes(self, fun, args):
+        # Returns the variable arguments that can be used in place of their parameters.
+        out = {}
+        for i, (p, a) in enumerate(zip(fun.params, args)):
+            if type(a) is not Var or a.val not in self.declared:
+                continue
+            # Later arguments and the body may set the variable, and a closure created by the
+            # body would capture the variable rather than its current value.
+            later = [n for e in args[i + 1:] + [fun.body] for n in nodes(e)]
+            if a.val not in self.assigned or not any(type(n) in [Call, Set, Fun] for n in later):
+                out[p] = a.val
+        return out
+
+    def inline(self, fun, args):
+        # Nested functions keep the scopes the resolver gave them, which engines replace.
+        scopes = dict((id(n.scope), n.scope) for n in nodes(fun.body) if type(n) is Fun)
+        body = copy.deepcopy(fun.body, scopes)
+        # The locals include the variables of the calls inlined into the body.
+        names = self.substitutes(fun, args)
+        for name in fun.params + sorted(declared_names(fun.body)):
+            if name not in names:
+                names[name] = self.temp()
+        for n in nodes(body):
+            t = type(n)
+            if t is Var and n.val in names:
+                n.val = names[n.val]
+            elif (t is Let or t is Mut or t is Set) and n.var.val in names:
+                n.var = Var(names[n.var.val])
+            elif t is Fun and n.name in names:
+                n.name = names[n.name]
+        out = body
+        for p, a in reversed(list(zip(fun.params, args))):
+            if type(a) is Var and names[p] == a.val:
+                continue
+            if not self.loops:
+                out = Seq(Let(Var(names[p]), a), out)
+            elif type(a) in [Int, Bool, Nil] or (type(a) is Str and a.decoded is not None):
+                self.prelude.append(Let(Var(names[p]), a))
+            else:
+                self.prelude.append(Mut(Var(names[p]), Nil.instance()))
+                out = Seq(Set(Var(names[p]), a), out)
+        self.inlined[fun.name][1] += 1
+        return out
+
+    def visit_binop(self, node):
+        node.first = self(node.first)
+        node.second = self(node.second)
+        return node
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return node
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return node
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return node
+
+    def short_circuit(self, node):
+        node.first = self(node.first)
+        node.second = self.branch(node.second)
+        return node
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        return self.short_circuit(node)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        return self.short_circuit(node)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        return node
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        node.cond = self(node.cond)
+        declared = set(self.declared)
+        node.first = self(node.first)
+        first, self.declared = self.declared, declared
+        node.second = self(node.second)
+        self.declared &= first
+        return node
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        outer = self.prelude
+        if self.loops == 0:
+            self.prelude = []
+        self.loops += 1
+        try:
+            node.cond = self(node.cond)
+            node.body = self.branch(node.body)
+        finally:
+            self.loops -= 1
+        if self.loops > 0:
+            return node
+        out = node
+        for decl in reversed(self.prelude):
+            out = Seq(decl, out)
+        self.prelude = outer
+        return out
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        node.expr = self(node.expr)
+        self.declared.add(node.var.val)
+        return node
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        node.expr = self(node.expr)
+        self.declared.add(node.var.val)
+        return node
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        node.expr = self(node.expr)
+        return node
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        return node
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        outer = (self.loops, self.prelude, self.declared)
+        self.loops, self.prelude, self.declared = 0, None, set(node.params + [node.name])
+        try:
+            node.body = self(node.body)
+        finally:
+            self.loops, self.prelude, self.declared = outer
+        self.declared.add(node.name)
+        # The size counts the calls inlined into the body.
+        if self.funs.get(node.name, (None,))[0] is node:
+            size = len(list(nodes(node.body)))
+            if size > self.size:
+                del self.funs[node.name]
+            else:
+                self.inlined[node.name] = [size, 0]
+        return node
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        node.fun = self(node.fun)
+        node.args = [self(a) for a in node.args]
+        if type(node.fun) is not Var or node.fun.val not in self.funs:
+            return node
+        fun, i = self.funs[node.fun.val]
+        if self.stmt <= i:
+            return node
+        if self.loops and any(type(n) in [Let, Mut, Fun] for n in nodes(fun.body)):
+            return node
+        return self.inline(fun, node.args)
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        # Keys are only rewritten inside, as in the optimizer.
+        pairs = []
+        for k, v in node.mappings.items():
+            self.branch(k)
+            pairs.append((k, self.branch(v)))
+        node.mappings = P_Tree(init_mappings=pairs)
+        return node
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        return node
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        node.v = self(node.v)
+        return node
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        return node
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        node.c = self(node.c)
+        node.l = self(node.l)
+        return node
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        node.m = self(node.m)
+        node.lo = self(node.lo)
+        node.hi = self(node.hi)
+        return node
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        node.m = self(node.m)
+        return node
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        node.elements = P_List(initial=[self(e) for e in node.elements])
+        return node
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        node.tail = self(node.tail)
+        node.head = self(node.head)
+        return node
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return node
@@ -5,14 +5,52 @@
 from swimlang.tokenizer import Tokenizer
 from swimlang.parser import Parser
 from swimlang.evaluator import Evaluator
+from swimlang.stack_evaluator import StackEvaluator
 from swimlang.printer import Printer
+from swimlang.compiler import Compiler
+from swimlang.vm import VM
+from swimlang.closure_compiler import ClosureCompiler
+from swimlang.codegen import Codegen, cache_dir
+from swimlang.optimizer import Optimizer
+from swimlang.cse import CSE
+from swimlang.inliner import Inliner, INLINE_SIZE
+from swimlang.verifier import verify
+import swimlang.ast as nodes
+import swimlang.runtime as rt
+
+ENGINES = ["eval", "stack", "vm", "closure", "python"]
 
 
 class Interpreter(object):
     def __init__(self, src):
         self.src = src
+        # The caches of the functions memoized by the last run
+        self.memos = None
+        # (name, body size, number of calls inlined) for the functions inlined by the last run
+        self.inlined = []
+        # The step counts of the last run, if its steps were limited
+        self.budget = None
+        # The allocation counts of the last run, if its memory was limited
+        self.quota = None
+
+    def track(self, engine):
+        # Keeps the counts of the run of engine.
+        self.memos, self.budget, self.quota = engine.memos, engine.budget, engine.quota
+
+    def interpret(self, verbose=False, engine="eval", memo_size=rt.MEMO_SIZE,
+                  inline_size=INLINE_SIZE, max_steps=None, max_memory=None, verified=False):
+        if engine not in ENGINES:
+            raise ValueError("unknown engine %s" % engine)
+        # In verified mode the node constructors do not check their arguments, neither while
+        # the tree is built nor while the program runs. The tree is checked once instead.
+        nodes.CHECKS = not verified
+        try:
+            return self.run(verbose, engine, memo_size, inline_size, max_steps, max_memory,
+                            verified)
+        finally:
+            nodes.CHECKS = True
 
-    def interpret(self, verbose=False):
+    def run(self, verbose, engine, memo_size, inline_size, max_steps, max_memory, verified):
         tokens = Tokenizer(self.src).tokenize()
         ast = Parser(tokens).parse()
         if verbose:
@@ -21,5 +59,40 @@ class Interpreter(object):
             print("*********************")
             print(Printer()(ast))
             print("*********************\n")
-        res = Evaluator()(ast)
+        inliner = Inliner(inline_size)
+        ast = CSE()(inliner(Optimizer()(ast)))
+        self.inlined = inliner.report()
+        if verified:
+            verify(ast)
+        self.memos = rt.Memos(memo_size)
+        if engine == "stack":
+            evaluator = StackEvaluator(memo_size, max_steps, max_memory)
+            self.track(evaluator)
+            res = evaluator(ast)
+        elif engine == "vm":
+            vm = VM(memo_size, max_steps, max_memory)
+            self.track(vm)
+            res = vm(Compiler()(ast))
+        elif engine == "closure":
+            compiler = ClosureCompiler(memo_size, max_steps, max_memory)
+            self.track(compiler)
+            res = compiler(ast)()
+        elif engine == "python":
+            # Programs the code generator does not support, e.g. those using
+            # memo, and runs with a step budget or a memory quota run on the closure
+            # compiler instead.
+            limited = max_steps is not None or max_memory is not None
+            run = None if limited else Codegen(cache_dir())(ast)
+            if run is None:
+                compiler = ClosureCompiler(memo_size, max_steps, max_memory)
+                self.track(compiler)
+                run = compiler(ast)
+            else:
+                # The generated code neither memoizes nor counts steps or allocations.
+                self.memos, self.budget, self.quota = rt.Memos(memo_size), None, None
+            res = run()
+        else:
+            evaluator = Evaluator(memo_size, max_steps, max_memory)
+            self.track(evaluator)
+            res = evaluator(ast)
         return res
@@ -0,0 +1,360 @@
+##################################################################################
+# AST optimizer
+##################################################################################
+
+# Rewrites a parsed AST before it is run: operators whose operands are
+# literals are folded into a literal, ifs and whiles with a literal condition
+# are reduced to the branch that runs, && || and ! over literals are
+# simplified, and literals whose value a sequence discards are dropped. An
+# operation that would fail at runtime, e.g. (+ 1 "a") or (/ 1 0), is left in
+# place so that the error is still raised when the program runs. Nodes are
+# rewritten in place and the visit methods return the node that replaces
+# their argument.
+
+import json
+from swimlang.ast import *
+from swimlang.visitor import *
+from swimlang.tokenizer import QUOTE
+import swimlang.runtime as rt
+
+NO_VALUE = object()
+
+
+def literal(val):
+    if type(val) is int:
+        return Int(val)
+    if type(val) is bool:
+        return Bool(val)
+    if type(val) is str and QUOTE == '"':
+        return Str(json.dumps(val)[1:-1])
+    return None
+
+
+class Optimizer(Visitor):
+    binops = {
+        Add: lambda a, b: a + b, Sub: lambda a, b: a - b, Mul: lambda a, b: a * b,
+        Div: rt.div, Mod: lambda a, b: a % b, Eq: lambda a, b: a == b,
+        NotEq: lambda a, b: a != b, Lt: lambda a, b: a < b, Lte: lambda a, b: a <= b,
+        Gt: lambda a, b: a > b, Gte: lambda a, b: a >= b
+    }
+
+    def value(self, node):
+        # Returns the value of a literal node, or NO_VALUE.
+        t = type(node)
+        if t is Int or t is Bool:
+            return node.val
+        if t is Str:
+            return NO_VALUE if node.decoded is None else node.decoded
+        if t is Nil:
+            return node
+        return NO_VALUE
+
+    def pure(self, node):
+        # A node is pure if evaluating it has no effect and cannot fail.
+        t = type(node)
+        if t is List:
+            return all(self.pure(e) for e in node.elements)
+        if t is Map:
+            return all(self.pure(k) and self.pure(v) for k, v in node.mappings.items())
+        return self.value(node) is not NO_VALUE
+
+    def visit_binop(self, node):
+        node.first = self(node.first)
+        node.second = self(node.second)
+        a, b = self.value(node.first), self.value(node.second)
+        prims = [int, bool, str]
+        if not (type(a) in prims and type(b) in prims):
+            return node
+        # Repeating a string could make a literal of any size.
+        if type(node) is Mul and (type(a) is str or type(b) is str):
+            return node
+        try:
+            out = literal(self.binops[type(node)](a, b))
+        except (TypeError, ValueError, ZeroDivisionError):
+            return node
+        return node if out is None else out
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+        return node
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+        return node
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+        return node
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        node.first = self(node.first)
+        node.second = self(node.second)
+        first = self.value(node.first)
+        if first is NO_VALUE:
+            return node
+        return node.second if first else node.first
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        node.first = self(node.first)
+        node.second = self(node.second)
+        first = self.value(node.first)
+        if first is NO_VALUE:
+            return node
+        return node.first if first else node.second
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        node.arg = self(node.arg)
+        arg = self.value(node.arg)
+        if arg is NO_VALUE:
+            return node
+        return Bool(not arg)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+        return node
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        node.cond = self(node.cond)
+        node.first = self(node.first)
+        node.second = self(node.second)
+        cond = self.value(node.cond)
+        if cond is NO_VALUE:
+            return node
+        return node.first if cond else node.second
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        node.cond = self(node.cond)
+        node.body = self(node.body)
+        cond = self.value(node.cond)
+        if cond is not NO_VALUE and not cond:
+            return Bool(False)
+        return node
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        node.expr = self(node.expr)
+        return node
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        node.expr = self(node.expr)
+        return node
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        node.expr = self(node.expr)
+        return node
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        return node
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        node.first = self(node.first)
+        node.second = self(node.second)
+        if self.pure(node.first):
+            return node.second
+        return node
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        node.body = self(node.body)
+        return node
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        node.fun = self(node.fun)
+        node.args = [self(a) for a in node.args]
+        return node
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        # Keys are only optimized inside: the literal orders its entries by the
+        # hashes of the key nodes, which replacing a key would change.
+        pairs = []
+        for k, v in node.mappings.items():
+            self(k)
+            pairs.append((k, self(v)))
+        node.mappings = P_Tree(init_mappings=pairs)
+        return node
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        return node
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        node.v = self(node.v)
+        return node
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        node.m = self(node.m)
+        node.k = self(node.k)
+        return node
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        node.c = self(node.c)
+        node.l = self(node.l)
+        return node
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        node.m = self(node.m)
+        node.lo = self(node.lo)
+        node.hi = self(node.hi)
+        return node
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        node.m = self(node.m)
+        return node
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        node.elements = P_List(initial=[self(e) for e in node.elements])
+        return node
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        node.head = self(node.head)
+        node.tail = self(node.tail)
+        return node
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        node.arg = self(node.arg)
+        return node
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
+        return node
@@ -3,12 +3,9 @@
 ##################################################################################
 
 # FixMe: make evaluation iterative not recursive to avoid max recursion depth errors
-# FixMe: add tail recursion
 # FixMe: add messages for parse/eval errors
 # FixMe: should if/while create their own lexical scopes?
-# FixMe: always re-wrap primitives (e.g. int -> Int)?
 # FixMe: add len keyword
-# FixMe: fix issue where each closure gets a copy of its mutable environment
 # FixMe: make most of the keyword operators built-in functions rather than syntax
 # FixMe: add in keyword
 # FixMe: add arrays?
@@ -65,6 +62,9 @@
 # | print
 # | keys
 # | type
+# | memo
+# | vec
+# | ordered
 #
 # BOP -> (binary operator)
 # | &&
@@ -83,10 +83,13 @@
 # | while
 # | push
 # | get
+# | remove
+# | into
 #
 # TOP -> (ternary operator)
 # | if
 # | put
+# | between
 #
 # b -> (boolean atom)
 # | True
@@ -114,7 +117,8 @@ class Parser(object):
     first_NOP = frozenset([TokenType.EXIT])
     
     first_UOP = frozenset([TokenType.NOT, TokenType.HEAD,
-                           TokenType.TAIL, TokenType.KEYS, TokenType.PRINT, TokenType.TYPE])
+                           TokenType.TAIL, TokenType.KEYS, TokenType.PRINT, TokenType.TYPE,
+                           TokenType.MEMO, TokenType.VEC, TokenType.ORDERED])
 
     first_BOP = frozenset([
         TokenType.AND,
@@ -133,15 +137,19 @@ class Parser(object):
         TokenType.SEQ,
         TokenType.WHILE,
         TokenType.PUSH,
-        TokenType.GET])
+        TokenType.GET,
+        TokenType.REMOVE,
+        TokenType.INTO])
 
-    first_TOP = frozenset([TokenType.IF, TokenType.PUT])
+    first_TOP = frozenset([TokenType.IF, TokenType.PUT, TokenType.BETWEEN])
 
     first_E = frozenset([TokenType.LEFT_PAREN]).union(first_T)
 
     def __init__(self, tokens):
         self.tokens = tokens
         self.idx = 0
+        # Equal int literals share one int object.
+        self.ints = {}
 
     def done(self):
         return self.idx >= len(self.tokens)
@@ -242,7 +250,7 @@ class Parser(object):
         l = self.lookahead()
         if l == TokenType.INT:
             n = self.match(TokenType.INT)
-            return Int(n.val)
+            return Int(self.ints.setdefault(n.val, n.val))
         elif l in Parser.first_b:
             b = self.b()
             return Bool(b)
@@ -328,6 +336,15 @@ class Parser(object):
         elif l == TokenType.TYPE:
             self.match(TokenType.TYPE)
             return Type
+        elif l == TokenType.MEMO:
+            self.match(TokenType.MEMO)
+            return Memo
+        elif l == TokenType.VEC:
+            self.match(TokenType.VEC)
+            return Vec
+        elif l == TokenType.ORDERED:
+            self.match(TokenType.ORDERED)
+            return Ordered
         else:
             raise ValueError
 
@@ -381,6 +398,12 @@ class Parser(object):
         elif l == TokenType.GET:
             self.match(TokenType.GET)
             return Get
+        elif l == TokenType.REMOVE:
+            self.match(TokenType.REMOVE)
+            return Remove
+        elif l == TokenType.INTO:
+            self.match(TokenType.INTO)
+            return Into
         else:
             raise ValueError
 
@@ -392,6 +415,9 @@ class Parser(object):
         elif l == TokenType.PUT:
             self.match(TokenType.PUT)
             return Put
+        elif l == TokenType.BETWEEN:
+            self.match(TokenType.BETWEEN)
+            return Between
         else:
             raise ValueError
 
@@ -1,4 +1,36 @@
 
+##################################################################################
+# Transients
+##################################################################################
+
+class Transient(object):
+    # A single-owner builder of a persistent structure: it changes in place the nodes it
+    # created, and copies a node it shares with persistent versions the first time it changes
+    # it. persistent() ends the batch in O(1) and returns the persistent structure, and the
+    # transient cannot be used after that. nodes counts the nodes the transient allocated.
+
+    def __init__(self):
+        # id -> node of the nodes this transient created. Holding them keeps their ids from
+        # being reused by other nodes.
+        self._owned = {}
+        self.nodes = 0
+
+    def _own(self, node):
+        self._owned[id(node)] = node
+        self.nodes += 1
+        return node
+
+    def _owns(self, node):
+        return self._owned.get(id(node)) is node
+
+    def _check(self):
+        if self._owned is None:
+            raise ValueError("transient used after `persistent`")
+
+    def _freeze(self):
+        self._check()
+        self._owned = None
+
 ##################################################################################
 # Persistent List
 ##################################################################################
@@ -30,8 +62,33 @@ class P_List(object):
         def __str__(self):
             return str(self._val)
 
+    class Lazy(Node):
+        # A node whose next node is made from the iterator rest when it is first needed. The
+        # nodes of a lazy list share rest, and each takes one value from it.
+        def __init__(self, val, rest):
+            self._val = val
+            self._rest = rest
+            self._after = None
+
+        @property
+        def _next(self):
+            if self._rest is not None:
+                for val in self._rest:
+                    self._after = P_List.Lazy(val, self._rest)
+                    break
+                self._rest = None
+            return self._after
+
+    @staticmethod
+    def lazy(vals, size):
+        # A list of the size values of the iterator vals, which are taken from it as the list
+        # is walked
+        for val in vals:
+            return P_List(initial=P_List.Lazy(val, vals), size=size)
+        return P_List()
+
     def __init__(self, initial=None, size=None):
-        if type(initial) is P_List.Node:
+        if type(initial) is P_List.Node or type(initial) is P_List.Lazy:
             self._head = initial
             if size is None:
                 raise ValueError
@@ -69,6 +126,9 @@ class P_List(object):
     def push(self, val):
         return P_List(initial=P_List.Node(val, self._head), size=self._size+1)
 
+    def transient(self):
+        return T_List(self)
+
     def __str__(self):
         curr = self._head
         out = ""
@@ -88,143 +148,843 @@ class P_List(object):
     def __len__(self):
         return self._size
 
+
+class T_List(Transient):
+    # A transient P_List. The nodes it shares with the list it was made from are all at its
+    # end, so push never copies, and the first append copies them once.
+
+    def __init__(self, initial):
+        Transient.__init__(self)
+        self._head = initial._head
+        self._size = initial._size
+        # The last node, once every node is owned
+        self._last = None
+
+    def push(self, val):
+        self._check()
+        self._head = self._own(P_List.Node(val, self._head))
+        if self._size == 0:
+            self._last = self._head
+        self._size += 1
+        return self
+
+    def append(self, val):
+        self._check()
+        if self._last is None and self._size > 0:
+            vals = list(P_List.Iterator(self._head))
+            self._head = self._last = self._own(P_List.Node(vals[0], None))
+            for v in vals[1:]:
+                self._last._next = self._own(P_List.Node(v, None))
+                self._last = self._last._next
+        node = self._own(P_List.Node(val, None))
+        if self._last is None:
+            self._head = node
+        else:
+            self._last._next = node
+        self._last = node
+        self._size += 1
+        return self
+
+    def persistent(self):
+        self._freeze()
+        if self._head is None:
+            return P_List()
+        return P_List(initial=self._head, size=self._size)
+
+    def __len__(self):
+        return self._size
+
+##################################################################################
+# Persistent Vector
+##################################################################################
+
+class P_Vector(object):
+    # A bit-partitioned trie of WIDTH-way nodes: the index of an element, read BITS bits at
+    # a time from the top, is its path from the root to its leaf. The last leaf is kept apart
+    # as the tail, so appending mostly copies only the tail. Nodes are python lists and are
+    # never changed once shared, so versions share all nodes off the path they changed.
+    #
+    # The elements of a vector are the slots from _start up to _cnt. tail() moves _start
+    # instead of copying, and push() fills the slot before _start, so both keep the
+    # behavior of P_List in O(log n). Slots before _start are kept alive until the vector is
+    # rebuilt.
+
+    BITS = 5
+    WIDTH = 1 << BITS
+    MASK = WIDTH - 1
+
+    def __init__(self, initial=None):
+        self._start = 0
+        self._cnt = 0
+        self._shift = P_Vector.BITS
+        self._root = []
+        self._tail = []
+        if initial is None:
+            return
+        if not type(initial) is list:
+            raise TypeError
+        n = len(initial)
+        if n == 0:
+            return
+        width = P_Vector.WIDTH
+        tail_off = P_Vector._tail_off(n)
+        level = [initial[i:i+width] for i in range(0, tail_off, width)]
+        while len(level) > width:
+            level = [level[i:i+width] for i in range(0, len(level), width)]
+            self._shift += P_Vector.BITS
+        self._root = level
+        self._tail = initial[tail_off:]
+        self._cnt = n
+
+    @staticmethod
+    def _tail_off(cnt):
+        # The first slot of the tail of a trie of cnt slots
+        if cnt < P_Vector.WIDTH:
+            return 0
+        return ((cnt - 1) >> P_Vector.BITS) << P_Vector.BITS
+
+    def _copy(self, start, cnt, shift, root, tail):
+        out = P_Vector.__new__(P_Vector)
+        out._start = start
+        out._cnt = cnt
+        out._shift = shift
+        out._root = root
+        out._tail = tail
+        return out
+
+    def _index(self, i):
+        # The slot of the element at index i
+        if not type(i) is int:
+            raise TypeError
+        if i < 0 or i >= len(self):
+            raise ValueError("index %d out of range for vector of length %d" % (i, len(self)))
+        return self._start + i
+
+    def _leaf(self, j):
+        # The node that holds slot j
+        if j >= P_Vector._tail_off(self._cnt):
+            return self._tail
+        node = self._root
+        level = self._shift
+        while level > 0:
+            node = node[(j >> level) & P_Vector.MASK]
+            level -= P_Vector.BITS
+        return node
+
+    def nth(self, i):
+        j = self._index(i)
+        return self._leaf(j)[j & P_Vector.MASK]
+
+    def _assoc_slot(self, j, val):
+        if j >= P_Vector._tail_off(self._cnt):
+            tail = list(self._tail)
+            tail[j & P_Vector.MASK] = val
+            return self._copy(self._start, self._cnt, self._shift, self._root, tail)
+        return self._copy(self._start, self._cnt, self._shift,
+                          P_Vector._assoc_node(self._shift, self._root, j, val), self._tail)
+
+    @staticmethod
+    def _assoc_node(level, node, j, val):
+        out = list(node)
+        if level == 0:
+            out[j & P_Vector.MASK] = val
+        else:
+            sub = (j >> level) & P_Vector.MASK
+            out[sub] = P_Vector._assoc_node(level - P_Vector.BITS, node[sub], j, val)
+        return out
+
+    def assoc(self, i, val):
+        # Returns a copy with val at index i. i may be the length, which appends val.
+        if type(i) is int and i == len(self):
+            return self.append(val)
+        return self._assoc_slot(self._index(i), val)
+
+    def append(self, val):
+        cnt = self._cnt
+        if cnt - P_Vector._tail_off(cnt) < P_Vector.WIDTH:
+            return self._copy(self._start, cnt + 1, self._shift, self._root, self._tail + [val])
+        # The tail is full: it becomes a leaf of the trie, which grows a level once its root
+        # is full too.
+        shift = self._shift
+        if (cnt >> P_Vector.BITS) > (1 << shift):
+            root = [self._root, P_Vector._new_path(shift, self._tail)]
+            shift += P_Vector.BITS
+        else:
+            root = P_Vector._push_tail(cnt, shift, self._root, self._tail)
+        return self._copy(self._start, cnt + 1, shift, root, [val])
+
+    @staticmethod
+    def _new_path(level, node):
+        while level > 0:
+            node = [node]
+            level -= P_Vector.BITS
+        return node
+
+    @staticmethod
+    def _push_tail(cnt, level, parent, tail):
+        out = list(parent)
+        sub = ((cnt - 1) >> level) & P_Vector.MASK
+        if level == P_Vector.BITS:
+            child = tail
+        elif sub < len(parent):
+            child = P_Vector._push_tail(cnt, level - P_Vector.BITS, parent[sub], tail)
+        else:
+            child = P_Vector._new_path(level - P_Vector.BITS, tail)
+        if sub < len(out):
+            out[sub] = child
+        else:
+            out.append(child)
+        return out
+
+    def head(self):
+        if len(self) == 0:
+            raise ValueError("`%s` is illegal on empty list" %
+                             self.head.__name__)
+        return self.nth(0)
+
+    def tail(self):
+        if len(self) == 0:
+            raise ValueError("`%s` is illegal on empty list" %
+                             self.tail.__name__)
+        return self._copy(self._start + 1, self._cnt, self._shift, self._root, self._tail)
+
+    def push(self, val):
+        # Returns a copy with val in front, like P_List.push. Without a free slot before
+        # _start, the vector is rebuilt with as many free slots as elements, so a run of pushes
+        # rebuilds it only every time its length doubles.
+        if self._start > 0:
+            out = self._assoc_slot(self._start - 1, val)
+            out._start -= 1
+            return out
+        n = max(len(self), P_Vector.WIDTH)
+        out = P_Vector([None] * n + list(self))
+        out._start = n
+        return out.push(val)
+
+    @staticmethod
+    def _depth(cnt):
+        # The shift of the root of a vector of cnt slots built at once
+        shift = P_Vector.BITS
+        level = P_Vector._tail_off(cnt) >> P_Vector.BITS
+        while level > P_Vector.WIDTH:
+            level = (level + P_Vector.MASK) >> P_Vector.BITS
+            shift += P_Vector.BITS
+        return shift
+
+    @staticmethod
+    def _slot_nodes(j, cnt, shift):
+        # The number of nodes a copy with a new value in slot j allocates: a copy of the tail,
+        # or of every node on the path to j.
+        if j >= P_Vector._tail_off(cnt):
+            return 1
+        return shift // P_Vector.BITS + 1
+
+    @staticmethod
+    def nodes(n):
+        # Returns the number of nodes of a vector of n elements built at once: its root and
+        # tail, its leaves, and the nodes of the levels in between.
+        out = 2
+        level = P_Vector._tail_off(n) >> P_Vector.BITS
+        while level > 0:
+            out += level
+            if level <= P_Vector.WIDTH:
+                break
+            level = (level + P_Vector.MASK) >> P_Vector.BITS
+        return out
+
+    def transient(self):
+        return T_Vector(self)
+
+    def put_nodes(self, i):
+        # Returns the number of nodes assoc(i, val) allocates, or 0 if i is not an index of
+        # the vector or its length. Appending to a full tail may add a level to the trie.
+        if not type(i) is int or i < 0 or i > len(self):
+            return 0
+        if i < len(self):
+            return P_Vector._slot_nodes(self._start + i, self._cnt, self._shift)
+        if self._cnt - P_Vector._tail_off(self._cnt) < P_Vector.WIDTH:
+            return 1
+        return self._shift // P_Vector.BITS + 2
+
+    def push_nodes(self):
+        # Returns the number of nodes push(val) allocates, including the nodes of the vector
+        # it rebuilds if there is no free slot before _start.
+        if self._start > 0:
+            return P_Vector._slot_nodes(self._start - 1, self._cnt, self._shift)
+        n = max(len(self), P_Vector.WIDTH)
+        cnt = n + len(self)
+        return P_Vector.nodes(cnt) + P_Vector._slot_nodes(n - 1, cnt, P_Vector._depth(cnt))
+
+    def __str__(self):
+        return "[" + " ".join([str(v) for v in self]) + "]"
+
+    def __iter__(self):
+        j = self._start
+        cnt = self._cnt
+        while j < cnt:
+            leaf = self._leaf(j)
+            end = min(cnt, (j | P_Vector.MASK) + 1)
+            for k in range(j & P_Vector.MASK, ((end - 1) & P_Vector.MASK) + 1):
+                yield leaf[k]
+            j = end
+
+    def __len__(self):
+        return self._cnt - self._start
+
+
+class T_Vector(Transient):
+    # A transient P_Vector that appends and sets elements in place
+
+    def __init__(self, initial):
+        Transient.__init__(self)
+        self._start = initial._start
+        self._cnt = initial._cnt
+        self._shift = initial._shift
+        self._root = initial._root
+        self._tail = self._own(list(initial._tail))
+
+    # Reads work as on a P_Vector.
+    _index = P_Vector._index
+    _leaf = P_Vector._leaf
+    nth = P_Vector.nth
+    __iter__ = P_Vector.__iter__
+    __len__ = P_Vector.__len__
+
+    def _editable(self, node):
+        return node if self._owns(node) else self._own(list(node))
+
+    def _push_tail(self, level, parent, tail):
+        # Puts the full tail into the trie below parent, which is owned, in place.
+        sub = ((self._cnt - 1) >> level) & P_Vector.MASK
+        if level == P_Vector.BITS:
+            child = tail
+        elif sub < len(parent):
+            child = self._editable(parent[sub])
+            self._push_tail(level - P_Vector.BITS, child, tail)
+        else:
+            child = tail
+            for _ in range((level - P_Vector.BITS) // P_Vector.BITS):
+                child = self._own([child])
+        if sub < len(parent):
+            parent[sub] = child
+        else:
+            parent.append(child)
+
+    def append(self, val):
+        self._check()
+        cnt = self._cnt
+        if cnt - P_Vector._tail_off(cnt) < P_Vector.WIDTH:
+            self._tail.append(val)
+        else:
+            shift = self._shift
+            if (cnt >> P_Vector.BITS) > (1 << shift):
+                path = self._tail
+                for _ in range(shift // P_Vector.BITS):
+                    path = self._own([path])
+                self._root = self._own([self._root, path])
+                self._shift += P_Vector.BITS
+            else:
+                self._root = self._editable(self._root)
+                self._push_tail(shift, self._root, self._tail)
+            self._tail = self._own([val])
+        self._cnt += 1
+        return self
+
+    def assoc(self, i, val):
+        self._check()
+        if type(i) is int and i == len(self):
+            return self.append(val)
+        j = self._index(i)
+        if j >= P_Vector._tail_off(self._cnt):
+            self._tail[j & P_Vector.MASK] = val
+            return self
+        self._root = node = self._editable(self._root)
+        level = self._shift
+        while level > 0:
+            sub = (j >> level) & P_Vector.MASK
+            node[sub] = node = self._editable(node[sub])
+            level -= P_Vector.BITS
+        node[j & P_Vector.MASK] = val
+        return self
+
+    def persistent(self):
+        self._freeze()
+        out = P_Vector()
+        out._start = self._start
+        out._cnt = self._cnt
+        out._shift = self._shift
+        out._root = self._root
+        out._tail = self._tail
+        return out
+
 ##################################################################################
 # Persistent Tree
 ##################################################################################
 
+# The number of bits set in a nonnegative int
+popcount = getattr(int, "bit_count", None) or (lambda n: bin(n).count("1"))
+
+
 class P_Tree(object):
-    # FixMe: change this from a vanilla BST to a RBTree
-    # FixMe: add Entry type to contain key, val
+    # A hash array mapped trie: the hash of a key, read BITS bits at a time from the top, is
+    # its path from the root to the leaf that holds it. A node keeps children only for the
+    # chunks its keys use, found with a bitmap, and skips the chunks all its keys share, so
+    # the depth of a trie of n keys is about log32(n) whatever their hashes. Keys with equal
+    # hashes share a leaf. Reading the hashes from the top keeps the keys in the order of
+    # their hashes. Nodes are never changed once shared, so a put copies only its path.
 
-    class Node(object):
+    BITS = 5
+    MASK = (1 << BITS) - 1
+    # Added to a hash to make it an unsigned HASH_BITS bit int of the same order
+    HASH_BITS = 64
+    OFFSET = 1 << (HASH_BITS - 1)
 
-        def __init__(self, key, val):
-            self._key = key
-            self._val = val
-            self._left = None
-            self._right = None
+    class Leaf(object):
+        # The (key, val) pairs of the keys with hash hkey, in the order they were put
+        __slots__ = ("hkey", "pairs")
 
-        def str_helper(self, indent):
-            curr = "  " * indent + str(self._key) + ": " + str(self._val)
-            if self._left is None:
-                left = "  " * (indent + 1) + "None"
-            else:
-                left = self._left.str_helper(indent + 1)
-            if self._right is None:
-                right = "  " * (indent + 1) + "None"
-            else:
-                right = self._right.str_helper(indent + 1)
-            return curr + "\n" + left + "\n" + right
+        def __init__(self, hkey, pairs):
+            self.hkey = hkey
+            self.pairs = pairs
 
-        def __str__(self):
-            return self.str_helper(0)
+        def get(self, key):
+            for k, v in self.pairs:
+                if k == key:
+                    return v
+            raise KeyError
 
-        def _put_mutable(self, key, val):
-            hkey = hash(key)
-            self_hkey = hash(self._key)
-            if hkey == self_hkey:
-                self._key = key
-                self._val = val
-            elif hkey < self_hkey:
-                if self._left is None:
-                    self._left = P_Tree.Node(key, val)
-                else:
-                    self._left._put_mutable(key, val)
-            else:
-                if self._right is None:
-                    self._right = P_Tree.Node(key, val)
-                else:
-                    self._right._put_mutable(key, val)
-
-        def put(self, tree, key, val):
-            hkey = hash(key)
-            self_hkey = hash(self._key)
-            out = P_Tree.Node(self._key, self._val)
-            if hkey == self_hkey:
-                # FixMe: what about hash collisions? Really need a list here
-                # of keys that have this hash
-                out._key = key
-                out._val = val
-                out._left = self._left
-                out._right = self._right
-            elif hkey < self_hkey:
-                if self._left is None:
-                    out._left = P_Tree.Node(key, val)
-                    tree._size += 1
-                else:
-                    out._left = self._left.put(tree, key, val)
-                out._right = self._right
-            else:
-                if self._right is None:
-                    out._right = P_Tree.Node(key, val)
-                    tree._size += 1
+        def put(self, key, val):
+            # Returns the new leaf and whether key was added.
+            for i, (k, _) in enumerate(self.pairs):
+                if k == key:
+                    return (P_Tree.Leaf(self.hkey, self.pairs[:i] + ((key, val),) +
+                                        self.pairs[i+1:]), False)
+            return P_Tree.Leaf(self.hkey, self.pairs + ((key, val),)), True
+
+    class Node(object):
+        # Branches on the chunk of hash bits at shift. All keys below have the bits above the
+        # chunk equal to prefix.
+        __slots__ = ("shift", "prefix", "bitmap", "children")
+
+        def __init__(self, shift, prefix, bitmap, children):
+            self.shift = shift
+            self.prefix = prefix
+            self.bitmap = bitmap
+            self.children = children
+
+        def str_helper(self, indent):
+            out = "  " * indent + "%d/%x" % (self.shift, self.prefix)
+            for c in self.children:
+                if type(c) is P_Tree.Node:
+                    out += "\n" + c.str_helper(indent + 1)
                 else:
-                    out._right = self._right.put(tree, key, val)
-                out._left = self._left
+                    out += "\n" + "  " * (indent + 1) + ", ".join(
+                        [str(k) + ": " + str(v) for k, v in c.pairs])
             return out
 
-        def get(self, key):
-            hkey = hash(key)
-            self_hkey = hash(self._key)
-            if hkey == self_hkey:
-                return self._val
-            if hkey < self_hkey:
-                if self._left is None:
-                    raise KeyError
-                return self._left.get(key)
-            else:
-                if self._right is None:
-                    raise KeyError
-                return self._right.get(key)
-
-        def ordered_keys(self, acc):
-            # FixMe: make iterative
-            if self._left:
-                self._left.ordered_keys(acc)
-            acc.append(self._key)
-            if self._right:
-                self._right.ordered_keys(acc)
-
-        def ordered_items(self, acc):
-            # FixMe: make iterative
-            if self._left:
-                self._left.ordered_items(acc)
-            acc.append((self._key, self._val))
-            if self._right:
-                self._right.ordered_items(acc)
+        def __str__(self):
+            return self.str_helper(0)
 
     def __init__(self, init_mappings=None):
+        # init_mappings is a dict or a list of (key, val) pairs
         self._root = None
+        self._size = 0
         if init_mappings:
-            for key, val in init_mappings.items():
-                self._put_mutable(key, val)
-            self._size = len(init_mappings)
-        else:
-            self._size = 0
+            if type(init_mappings) is dict:
+                init_mappings = init_mappings.items()
+            out = self.transient()
+            for key, val in init_mappings:
+                out.put(key, val)
+            out = out.persistent()
+            self._root = out._root
+            self._size = out._size
+
+    def transient(self):
+        return T_Tree(self)
 
     def __str__(self):
         return str(self._root)
 
-    def _put_mutable(self, key, val):
-        if self._root is None:
-            self._root = P_Tree.Node(key, val)
+    @staticmethod
+    def _hkey(sub):
+        # A hash of a key below the leaf or node sub, with the bits sub branches on or above
+        if type(sub) is P_Tree.Leaf:
+            return sub.hkey
+        return sub.prefix << (sub.shift + P_Tree.BITS)
+
+    @staticmethod
+    def _join(a, b, hb):
+        # Returns a node with the leaf or node a and the leaf b of hash hb as children, which
+        # branches on the highest chunk in which their hashes differ.
+        ha = P_Tree._hkey(a)
+        shift = ((ha ^ hb).bit_length() - 1) // P_Tree.BITS * P_Tree.BITS
+        ia = (ha >> shift) & P_Tree.MASK
+        ib = (hb >> shift) & P_Tree.MASK
+        children = [a, b] if ia < ib else [b, a]
+        return P_Tree.Node(shift, hb >> (shift + P_Tree.BITS), (1 << ia) | (1 << ib), children)
+
+    @staticmethod
+    def _put(sub, hkey, key, val):
+        # Returns a copy of the leaf or node sub with key mapped to val, and whether key was
+        # added.
+        if sub is None:
+            return P_Tree.Leaf(hkey, ((key, val),)), True
+        if type(sub) is P_Tree.Leaf:
+            if sub.hkey == hkey:
+                return sub.put(key, val)
+            return P_Tree._join(sub, P_Tree.Leaf(hkey, ((key, val),)), hkey), True
+        shift = sub.shift
+        if hkey >> (shift + P_Tree.BITS) != sub.prefix:
+            return P_Tree._join(sub, P_Tree.Leaf(hkey, ((key, val),)), hkey), True
+        bit = 1 << ((hkey >> shift) & P_Tree.MASK)
+        pos = popcount(sub.bitmap & (bit - 1))
+        children = list(sub.children)
+        if sub.bitmap & bit:
+            children[pos], added = P_Tree._put(children[pos], hkey, key, val)
         else:
-            self._root._put_mutable(key, val)
+            children.insert(pos, P_Tree.Leaf(hkey, ((key, val),)))
+            added = True
+        return P_Tree.Node(shift, sub.prefix, sub.bitmap | bit, children), added
 
     def put(self, key, val):
         out = P_Tree()
+        out._root, added = P_Tree._put(self._root, hash(key) + P_Tree.OFFSET, key, val)
+        out._size = self._size + added
+        return out
+
+    def put_nodes(self, key):
+        # Returns the number of nodes put(key, val) allocates: a copy of every node on the path
+        # to key, a new leaf, and a new node if the path ends at a leaf or node whose keys
+        # differ from key in the bits it branches on or above.
+        hkey = hash(key) + P_Tree.OFFSET
+        curr = self._root
+        out = 0
+        while type(curr) is P_Tree.Node:
+            if hkey >> (curr.shift + P_Tree.BITS) != curr.prefix:
+                return out + 2
+            bit = 1 << ((hkey >> curr.shift) & P_Tree.MASK)
+            out += 1
+            if not curr.bitmap & bit:
+                return out + 1
+            curr = curr.children[popcount(curr.bitmap & (bit - 1))]
+        if curr is None or curr.hkey == hkey:
+            return out + 1
+        return out + 2
+
+    @staticmethod
+    def _remove(sub, hkey, key):
+        # Returns a copy of the leaf or node sub without key, or None if nothing is left, and
+        # whether key was removed. A node left with one child is replaced by the child.
+        if type(sub) is P_Tree.Leaf:
+            if sub.hkey != hkey:
+                return sub, False
+            pairs = tuple([(k, v) for k, v in sub.pairs if not k == key])
+            if len(pairs) == len(sub.pairs):
+                return sub, False
+            return (P_Tree.Leaf(hkey, pairs) if pairs else None), True
+        shift = sub.shift
+        if hkey >> (shift + P_Tree.BITS) != sub.prefix:
+            return sub, False
+        bit = 1 << ((hkey >> shift) & P_Tree.MASK)
+        if not sub.bitmap & bit:
+            return sub, False
+        pos = popcount(sub.bitmap & (bit - 1))
+        child, removed = P_Tree._remove(sub.children[pos], hkey, key)
+        if not removed:
+            return sub, False
+        children = list(sub.children)
+        if child is not None:
+            children[pos] = child
+            return P_Tree.Node(shift, sub.prefix, sub.bitmap, children), True
+        del children[pos]
+        if len(children) == 1:
+            return children[0], True
+        return P_Tree.Node(shift, sub.prefix, sub.bitmap & ~bit, children), True
+
+    def remove(self, key):
         if self._root is None:
-            out._root = P_Tree.Node(key, val)
-            out._size = 1
-        else:
-            out._size = self._size
-            out._root = self._root.put(out, key, val)
+            return self
+        root, removed = P_Tree._remove(self._root, hash(key) + P_Tree.OFFSET, key)
+        if not removed:
+            return self
+        out = P_Tree()
+        out._root = root
+        out._size = self._size - 1
         return out
 
+    def remove_nodes(self, key):
+        # Returns the number of nodes remove(key) allocates: a copy of every node on the path
+        # to key but the one replaced by its other child, and a copy of the leaf of key if
+        # other keys have its hash.
+        if key not in self:
+            return 0
+        hkey = hash(key) + P_Tree.OFFSET
+        curr = self._root
+        path = []
+        while type(curr) is P_Tree.Node:
+            path.append(curr)
+            bit = 1 << ((hkey >> curr.shift) & P_Tree.MASK)
+            curr = curr.children[popcount(curr.bitmap & (bit - 1))]
+        if len(curr.pairs) > 1:
+            return len(path) + 1
+        if path and len(path[-1].children) == 2:
+            return len(path) - 1
+        return len(path)
+
     def get(self, key):
+        hkey = hash(key) + P_Tree.OFFSET
+        curr = self._root
+        while type(curr) is P_Tree.Node:
+            if hkey >> (curr.shift + P_Tree.BITS) != curr.prefix:
+                raise KeyError
+            bit = 1 << ((hkey >> curr.shift) & P_Tree.MASK)
+            if not curr.bitmap & bit:
+                raise KeyError
+            curr = curr.children[popcount(curr.bitmap & (bit - 1))]
+        if curr is None or curr.hkey != hkey:
+            raise KeyError
+        return curr.get(key)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _ordered_items(self):
+        # Yields the (key, val) pairs in the order of their hashes. The stack holds an iterator
+        # of the children of each node on the path to the current leaf.
         if self._root is None:
+            return
+        stack = [iter((self._root,))]
+        while stack:
+            sub = next(stack[-1], None)
+            if sub is None:
+                stack.pop()
+            elif type(sub) is P_Tree.Leaf:
+                yield from sub.pairs
+            else:
+                stack.append(iter(sub.children))
+
+    def __iter__(self):
+        for key, _ in self._ordered_items():
+            yield key
+
+    def keys(self):
+        return P_List.lazy(iter(self), self._size)
+
+    def items(self):
+        return P_List.lazy(self._ordered_items(), self._size)
+
+    def __len__(self):
+        return self._size
+
+##################################################################################
+# Persistent Sorted Map
+##################################################################################
+
+class P_SortedMap(object):
+    # A weight-balanced binary search tree ordered by key, as in Adams' "Efficient sets: a
+    # balancing act" with the parameters of Hirai and Yamamoto: neither subtree of a node
+    # has more than DELTA times the nodes of the other, counting an empty tree as one, so
+    # the depth of a tree of n keys is at most about 2.5 log2(n). Keys are compared with <
+    # and must be comparable with each other. Nodes are never changed once shared, so put and
+    # remove copy only the path to their key and the nodes they rotate.
+
+    DELTA = 3
+    RATIO = 2
+
+    class Node(object):
+        __slots__ = ("key", "val", "left", "right", "size")
+
+        def __init__(self, key, val, left, right):
+            self.key = key
+            self.val = val
+            self.left = left
+            self.right = right
+            self.size = P_SortedMap._size(left) + P_SortedMap._size(right) + 1
+
+        def str_helper(self, indent):
+            curr = "  " * indent + str(self.key) + ": " + str(self.val)
+            left = ("  " * (indent + 1) + "None" if self.left is None else
+                    self.left.str_helper(indent + 1))
+            right = ("  " * (indent + 1) + "None" if self.right is None else
+                     self.right.str_helper(indent + 1))
+            return curr + "\n" + left + "\n" + right
+
+        def __str__(self):
+            return self.str_helper(0)
+
+    def __init__(self, init_mappings=None):
+        # init_mappings is a dict or a list of (key, val) pairs
+        self._root = None
+        if init_mappings:
+            if type(init_mappings) is dict:
+                init_mappings = init_mappings.items()
+            out = self.transient()
+            for key, val in init_mappings:
+                out.put(key, val)
+            self._root = out.persistent()._root
+
+    def transient(self):
+        return T_SortedMap(self)
+
+    def __str__(self):
+        return str(self._root)
+
+    @staticmethod
+    def _size(node):
+        return 0 if node is None else node.size
+
+    @staticmethod
+    def _balanced(left, right):
+        sl = P_SortedMap._size(left)
+        sr = P_SortedMap._size(right)
+        return sl + sr <= 1 or (sr <= P_SortedMap.DELTA * sl and sl <= P_SortedMap.DELTA * sr)
+
+    @staticmethod
+    def _balance(key, val, left, right, Node=None):
+        # Returns a node of key and val with the subtrees left and right, rotated once if one
+        # is too heavy. Enough after one put or remove below. New nodes are made with Node.
+        sl = P_SortedMap._size(left)
+        sr = P_SortedMap._size(right)
+        if Node is None:
+            Node = P_SortedMap.Node
+        if sl + sr <= 1:
+            return Node(key, val, left, right)
+        if sr > P_SortedMap.DELTA * sl:
+            rl, rr = right.left, right.right
+            if P_SortedMap._size(rl) < P_SortedMap.RATIO * P_SortedMap._size(rr):
+                return Node(right.key, right.val, Node(key, val, left, rl), rr)
+            return Node(rl.key, rl.val, Node(key, val, left, rl.left),
+                        Node(right.key, right.val, rl.right, rr))
+        if sl > P_SortedMap.DELTA * sr:
+            ll, lr = left.left, left.right
+            if P_SortedMap._size(lr) < P_SortedMap.RATIO * P_SortedMap._size(ll):
+                return Node(left.key, left.val, ll, Node(key, val, lr, right))
+            return Node(lr.key, lr.val, Node(left.key, left.val, ll, lr.left),
+                        Node(key, val, lr.right, right))
+        return Node(key, val, left, right)
+
+    @staticmethod
+    def _put(node, key, val):
+        if node is None:
+            return P_SortedMap.Node(key, val, None, None)
+        if key < node.key:
+            return P_SortedMap._balance(node.key, node.val, P_SortedMap._put(node.left, key, val),
+                                        node.right)
+        if node.key < key:
+            return P_SortedMap._balance(node.key, node.val, node.left,
+                                        P_SortedMap._put(node.right, key, val))
+        return P_SortedMap.Node(key, val, node.left, node.right)
+
+    def put(self, key, val):
+        out = P_SortedMap()
+        out._root = P_SortedMap._put(self._root, key, val)
+        return out
+
+    def put_nodes(self, key):
+        # Returns the number of nodes put(key, val) allocates, not counting the nodes rotations
+        # allocate: a copy of every node on the path to key, and a new node if key is not in
+        # the tree.
+        curr = self._root
+        out = 0
+        while curr is not None:
+            out += 1
+            if key < curr.key:
+                curr = curr.left
+            elif curr.key < key:
+                curr = curr.right
+            else:
+                return out
+        return out + 1
+
+    @staticmethod
+    def _remove_min(node):
+        # Returns the smallest node under node and a copy of node without it.
+        if node.left is None:
+            return node, node.right
+        least, left = P_SortedMap._remove_min(node.left)
+        return least, P_SortedMap._balance(node.key, node.val, left, node.right)
+
+    @staticmethod
+    def _remove_max(node):
+        # Returns the largest node under node and a copy of node without it.
+        if node.right is None:
+            return node, node.left
+        greatest, right = P_SortedMap._remove_max(node.right)
+        return greatest, P_SortedMap._balance(node.key, node.val, node.left, right)
+
+    @staticmethod
+    def _remove(node, key):
+        if node is None:
             raise KeyError
-        return self._root.get(key)
+        if key < node.key:
+            return P_SortedMap._balance(node.key, node.val, P_SortedMap._remove(node.left, key),
+                                        node.right)
+        if node.key < key:
+            return P_SortedMap._balance(node.key, node.val, node.left,
+                                        P_SortedMap._remove(node.right, key))
+        # The node is replaced by the nearest node of its larger subtree.
+        if node.left is None:
+            return node.right
+        if node.right is None:
+            return node.left
+        if node.left.size > node.right.size:
+            greatest, left = P_SortedMap._remove_max(node.left)
+            return P_SortedMap._balance(greatest.key, greatest.val, left, node.right)
+        least, right = P_SortedMap._remove_min(node.right)
+        return P_SortedMap._balance(least.key, least.val, node.left, right)
+
+    def remove(self, key):
+        if key not in self:
+            return self
+        out = P_SortedMap()
+        out._root = P_SortedMap._remove(self._root, key)
+        return out
+
+    def remove_nodes(self, key):
+        # Returns the number of nodes remove(key) allocates, not counting the nodes rotations
+        # allocate: a copy of every node on the path to key and, if key has two children, on
+        # the path to the node that replaces it.
+        curr = self._root
+        out = 0
+        while curr is not None:
+            if key < curr.key:
+                curr = curr.left
+            elif curr.key < key:
+                curr = curr.right
+            else:
+                break
+            out += 1
+        if curr is None:
+            return 0
+        if curr.left is None or curr.right is None:
+            return out
+        if curr.left.size > curr.right.size:
+            curr, step = curr.left, lambda n: n.right
+        else:
+            curr, step = curr.right, lambda n: n.left
+        out += 1
+        while step(curr) is not None:
+            out += 1
+            curr = step(curr)
+        return out
+
+    def get(self, key):
+        curr = self._root
+        while curr is not None:
+            if key < curr.key:
+                curr = curr.left
+            elif curr.key < key:
+                curr = curr.right
+            else:
+                return curr.val
+        raise KeyError
 
     def __getitem__(self, key):
         return self.get(key)
@@ -236,43 +996,165 @@ class P_Tree(object):
             return False
         return True
 
+    def range(self, lo, hi):
+        # Yields the (key, val) pairs with lo <= key < hi in order. Finding the first takes
+        # O(log n) time, and each next one O(1) amortized.
+        stack = []
+        curr = self._root
+        while curr is not None:
+            if curr.key < lo:
+                curr = curr.right
+            else:
+                stack.append(curr)
+                curr = curr.left
+        while stack:
+            curr = stack.pop()
+            if not curr.key < hi:
+                return
+            yield (curr.key, curr.val)
+            curr = curr.right
+            while curr is not None:
+                stack.append(curr)
+                curr = curr.left
+
+    def _ordered_items(self):
+        # Yields the (key, val) pairs in ascending order of key
+        stack = []
+        curr = self._root
+        while stack or curr is not None:
+            while curr is not None:
+                stack.append(curr)
+                curr = curr.left
+            curr = stack.pop()
+            yield (curr.key, curr.val)
+            curr = curr.right
+
     def __iter__(self):
-        # FixMe: use a generator instead
-        return iter(self.keys())
+        for key, _ in self._ordered_items():
+            yield key
 
     def keys(self):
-        ordered_keys = []
-        if self._root is None:
-            return P_List(initial=ordered_keys)
-        self._root.ordered_keys(ordered_keys)
-        return P_List(initial=ordered_keys)
+        return P_List.lazy(iter(self), len(self))
 
     def items(self):
-        ordered_items = []
-        if self._root is None:
-            return P_List(initial=ordered_items)
-        self._root.ordered_items(ordered_items)
-        return P_List(initial=ordered_items)
+        return P_List.lazy(self._ordered_items(), len(self))
+
+    def __len__(self):
+        return P_SortedMap._size(self._root)
+
+
+##################################################################################
+# Transient Maps
+##################################################################################
+
+class T_Tree(Transient):
+    # A transient P_Tree that puts keys in place
+
+    def __init__(self, initial):
+        Transient.__init__(self)
+        self._root = initial._root
+        self._size = initial._size
+
+    # Reads work as on a P_Tree.
+    get = P_Tree.get
+    __getitem__ = P_Tree.__getitem__
+    __contains__ = P_Tree.__contains__
+
+    def _leaf(self, hkey, key, val):
+        return self._own(P_Tree.Leaf(hkey, ((key, val),)))
+
+    def _put(self, sub, hkey, key, val):
+        # Returns the leaf or node sub, changed in place if owned, with key mapped to val, and
+        # whether key was added.
+        if sub is None:
+            return self._leaf(hkey, key, val), True
+        if type(sub) is P_Tree.Leaf:
+            if sub.hkey != hkey:
+                return self._own(P_Tree._join(sub, self._leaf(hkey, key, val), hkey)), True
+            out, added = sub.put(key, val)
+            if not self._owns(sub):
+                return self._own(out), added
+            sub.pairs = out.pairs
+            return sub, added
+        shift = sub.shift
+        if hkey >> (shift + P_Tree.BITS) != sub.prefix:
+            return self._own(P_Tree._join(sub, self._leaf(hkey, key, val), hkey)), True
+        if not self._owns(sub):
+            sub = self._own(P_Tree.Node(shift, sub.prefix, sub.bitmap, list(sub.children)))
+        bit = 1 << ((hkey >> shift) & P_Tree.MASK)
+        pos = popcount(sub.bitmap & (bit - 1))
+        if sub.bitmap & bit:
+            sub.children[pos], added = self._put(sub.children[pos], hkey, key, val)
+            return sub, added
+        sub.children.insert(pos, self._leaf(hkey, key, val))
+        sub.bitmap |= bit
+        return sub, True
+
+    def put(self, key, val):
+        self._check()
+        self._root, added = self._put(self._root, hash(key) + P_Tree.OFFSET, key, val)
+        self._size += added
+        return self
+
+    def persistent(self):
+        self._freeze()
+        out = P_Tree()
+        out._root = self._root
+        out._size = self._size
+        return out
 
     def __len__(self):
         return self._size
 
 
-# FixMe: add to test file
-#t = P_Tree()
-#t1 = t.put(3, "33")
-#t2 = t1.put(1, "11")
-#t3 = t2.put(2, "22")
-#t4 = t3.put(5, "55")
-#t5 = t4.put(4, "44")
-#assert([(k, t[k]) for k in t] == [])
-#assert([(k, t1[k]) for k in t1] == [(3, "33")])
-#assert([(k, t2[k]) for k in t2] == [(1, "11"), (3, "33")])
-#assert([(k, t3[k]) for k in t3] == [(1, "11"), (2, "22"), (3, "33")])
-# assert([(k, t4[k]) for k in t4] == [
-#       (1, "11"), (2, "22"), (3, "33"), (5, "55")])
-# assert([(k, t5[k]) for k in t5] == [
-#    (1, "11"), (2, "22"), (3, "33"), (4, "44"), (5, "55")])
-# Due to sharing where possible, we only need 11 total nodes, not 15, despite being immutable!
-#t = P_Tree({1: "11", 2: "22", 3: "33"})
-# print(t)
+class T_SortedMap(Transient):
+    # A transient P_SortedMap that puts keys in place, rotating like P_SortedMap
+
+    def __init__(self, initial):
+        Transient.__init__(self)
+        self._root = initial._root
+
+    # Reads work as on a P_SortedMap.
+    get = P_SortedMap.get
+    __getitem__ = P_SortedMap.__getitem__
+    __contains__ = P_SortedMap.__contains__
+    __len__ = P_SortedMap.__len__
+
+    def _node(self, key, val, left, right):
+        return self._own(P_SortedMap.Node(key, val, left, right))
+
+    def _rebalance(self, node, left, right):
+        # Returns node with the subtrees left and right, changed in place if owned and
+        # still balanced.
+        if not P_SortedMap._balanced(left, right):
+            return P_SortedMap._balance(node.key, node.val, left, right, self._node)
+        if not self._owns(node):
+            return self._node(node.key, node.val, left, right)
+        node.left = left
+        node.right = right
+        node.size = P_SortedMap._size(left) + P_SortedMap._size(right) + 1
+        return node
+
+    def _put(self, node, key, val):
+        if node is None:
+            return self._node(key, val, None, None)
+        if key < node.key:
+            return self._rebalance(node, self._put(node.left, key, val), node.right)
+        if node.key < key:
+            return self._rebalance(node, node.left, self._put(node.right, key, val))
+        if not self._owns(node):
+            return self._node(key, val, node.left, node.right)
+        node.key = key
+        node.val = val
+        return node
+
+    def put(self, key, val):
+        self._check()
+        self._root = self._put(self._root, key, val)
+        return self
+
+    def persistent(self):
+        self._freeze()
+        out = P_SortedMap()
+        out._root = self._root
+        return out
@@ -204,6 +204,24 @@ class Printer(Visitor):
         return (TokenType.LEFT_PAREN.value + TokenType.PUT.value + " " + self(node.m) + " " + self(node.k) + " " +
                 self(node.v) + TokenType.RIGHT_PAREN.value)
 
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.REMOVE.value + " " + self(node.m) + " " + self(node.k) +
+                TokenType.RIGHT_PAREN.value)
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.INTO.value + " " + self(node.c) + " " + self(node.l) +
+                TokenType.RIGHT_PAREN.value)
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.BETWEEN.value + " " + self(node.m) + " " + self(node.lo) + " " +
+                self(node.hi) + TokenType.RIGHT_PAREN.value)
+
     def visit_keys(self, node):
         if not type(node) is Keys:
             raise TypeError
@@ -214,6 +232,21 @@ class Printer(Visitor):
             raise TypeError
         return (TokenType.LEFT_PAREN.value + TokenType.TYPE.value + " " + self(node.arg) + TokenType.RIGHT_PAREN.value)
 
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.MEMO.value + " " + self(node.arg) + TokenType.RIGHT_PAREN.value)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.VEC.value + " " + self(node.arg) + TokenType.RIGHT_PAREN.value)
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        return (TokenType.LEFT_PAREN.value + TokenType.ORDERED.value + " " + self(node.arg) + TokenType.RIGHT_PAREN.value)
+
     def visit_list(self, node):
         if not type(node) is List:
             raise TypeError
@@ -245,6 +278,29 @@ class Printer(Visitor):
         return (TokenType.LEFT_PAREN.value + TokenType.PRINT.value + " " + self(node.arg) +
                 TokenType.RIGHT_PAREN.value)
 
+    def value(self, v):
+        # Formats a runtime value. Strings inside lists and maps are quoted.
+        t = type(v)
+        if t is str:
+            return "%s%s%s" % (QUOTE, v, QUOTE)
+        if t is int or t is bool:
+            return str(v)
+        if t is List:
+            return (TokenType.LEFT_BRACKET.value + " ".join([self.value(e) for e in v.elements]) +
+                    TokenType.RIGHT_BRACKET.value)
+        if t is Map:
+            if len(v.mappings) == 0:
+                return TokenType.LEFT_BRACE.value + TokenType.RIGHT_BRACE.value
+            indent = self.indent
+            self.indent = indent + "  "
+            mappings = ("\n" + self.indent).join(
+                [("%s%s%s" % (self.value(k), TokenType.COLON.value, self.value(val)))
+                 for (k, val) in v.mappings.items()])
+            self.indent = indent
+            return (TokenType.LEFT_BRACE.value + "\n" + self.indent + "  " + mappings + "\n" + self.indent +
+                    TokenType.RIGHT_BRACE.value)
+        return self(v)
+
     def visit_nil(self, node):
         if not type(node) is Nil:
             raise TypeError
@@ -5,6 +5,9 @@
 from swimlang.tokenizer import Tokenizer
 from swimlang.parser import Parser
 from swimlang.evaluator import Evaluator
+from swimlang.optimizer import Optimizer
+from swimlang.cse import CSE
+from swimlang.inliner import Inliner
 
 import cmd
 import sys
@@ -29,6 +32,8 @@ type . and hit enter to finish an expression
     done = False
     buffer = None
     evaluator = Evaluator()
+    cse = CSE()
+    inliner = Inliner()
 
     def precmd(self, line):
         if self.buffer is None and line in ["EOF"]:
@@ -50,7 +55,7 @@ type . and hit enter to finish an expression
             expr = stripped_buffer[:-1]
             try:
                 tokens = Tokenizer(expr).tokenize()
-                ast = Parser(tokens).parse()
+                ast = self.cse(self.inliner(Optimizer()(Parser(tokens).parse())))
                 res = self.evaluator(ast)
                 print(RETURN + str(res))
             except SystemExit as e:
@@ -0,0 +1,401 @@
+##################################################################################
+# Static scope resolver
+##################################################################################
+
+# Assigns every variable of a function body (or of the top level) a slot in a
+# fixed-size frame. A slot holds a parameter, the function's own name, a local
+# declared with let/mut/fun, or a value captured from the enclosing scope when
+# the closure is created. Only names that the body (or a nested function)
+# may reference before declaring them itself are captured. Every Var, Let,
+# Mut, Set and declared Fun node records the slot of its name in node.slot.
+#
+# A slot that is declared with mut and captured by a nested function is a cell
+# slot: it holds a Cell shared by the frame and every closure that captures
+# it, so a set is seen by all of them. Captured cell slots are cell slots in
+# the capturing function too.
+
+from swimlang.ast import *
+from swimlang.visitor import *
+
+
+class FunScope(object):
+    def __init__(self, fun, parent):
+        if not (type(fun) is Fun or fun is None):
+            raise TypeError
+        if not (type(parent) is FunScope or parent is None):
+            raise TypeError
+        self.fun = fun
+        self.parent = parent
+        self.children = []
+        self.names = []
+        self.slots = {}
+        self.params = []
+        self.self_slot = None
+        self.decls = set()
+        # name -> declaring node types (Let, Mut or Fun), one per site
+        self.decl_sites = {}
+        # names declared inside a while loop of this scope
+        self.loop_decls = set()
+        # names that may be referenced before they are declared in this scope
+        self.refs = set()
+        self.free = set()
+        # (slot in enclosing scope, slot in this scope) pairs
+        self.captures = []
+        # slots holding a Cell rather than a value
+        self.cells = set()
+        if fun is not None:
+            for p in fun.params:
+                self.params.append(self.slot(p))
+            if fun.name is not None:
+                self.self_slot = self.slot(fun.name)
+
+    def slot(self, name):
+        if type(name) is not str:
+            raise TypeError
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+        return self.slots[name]
+
+    def bound(self):
+        out = set(self.names[p] for p in self.params)
+        if self.self_slot is not None:
+            out.add(self.names[self.self_slot])
+        return out
+
+    def resolve_free(self):
+        self.free = self.refs - self.bound()
+
+    def visible(self):
+        out = self.bound() | self.decls
+        out |= set(self.names[s] for (_, s) in self.captures)
+        return out
+
+    def resolve_captures(self, start=0):
+        visible = self.visible()
+        for c in self.children[start:]:
+            for name in sorted(c.free):
+                if name in visible:
+                    c.captures.append((self.slots[name], c.slot(name)))
+        for c in self.children:
+            for (outer, _) in c.captures:
+                if Mut in self.decl_sites.get(self.names[outer], []):
+                    self.cells.add(outer)
+        for c in self.children[start:]:
+            for (outer, inner) in c.captures:
+                if outer in self.cells:
+                    c.cells.add(inner)
+            c.resolve_captures()
+
+    def size(self):
+        return len(self.names)
+
+
+class Resolver(Visitor):
+    # Resolves a program against a new top-level scope, or against top, which
+    # is extended with the names of the program.
+    def __init__(self, top=None):
+        if not (type(top) is FunScope or top is None):
+            raise TypeError
+        self.top = top
+        self.scope = None
+        self.loops = 0
+        # names definitely declared in the current scope at the current point
+        self.declared = set()
+
+    def __call__(self, node):
+        if self.scope is not None:
+            return node.accept(self)
+        self.scope = FunScope(None, None) if self.top is None else self.top
+        start = len(self.scope.children)
+        self.loops = 0
+        self.declared = set()
+        try:
+            node.accept(self)
+            self.scope.resolve_captures(start)
+            return self.scope
+        finally:
+            self.scope = None
+
+    def declare(self, name, kind):
+        self.scope.decls.add(name)
+        self.scope.decl_sites.setdefault(name, []).append(kind)
+        if self.loops:
+            self.scope.loop_decls.add(name)
+        self.declared.add(name)
+        return self.scope.slot(name)
+
+    def reference(self, name):
+        if name not in self.declared:
+            self.scope.refs.add(name)
+        return self.scope.slot(name)
+
+    def branch(self, node):
+        # Declarations in code that may not run do not count as definite.
+        declared = set(self.declared)
+        self(node)
+        self.declared = declared
+
+    def visit_binop(self, node):
+        # A specialization reads the slots of the operands, which may change here.
+        node.quick = None
+        self(node.first)
+        self(node.second)
+
+    def visit_int(self, node):
+        if not type(node) is Int:
+            raise TypeError
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_exit(self, node):
+        if not type(node) is Exit:
+            raise TypeError
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node) is Bool:
+            raise TypeError
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        self(node.first)
+        self.branch(node.second)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        self(node.first)
+        self.branch(node.second)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        self(node.arg)
+
+    def visit_str(self, node):
+        if not type(node) is Str:
+            raise TypeError
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        self(node.cond)
+        declared = set(self.declared)
+        self(node.first)
+        first, self.declared = self.declared, declared
+        self(node.second)
+        self.declared &= first
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        # A counted loop reads the slots of its counter and bound, which may change here.
+        node.quick = None
+        self.loops += 1
+        try:
+            self(node.cond)
+            self.branch(node.body)
+        finally:
+            self.loops -= 1
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        self(node.expr)
+        node.slot = self.declare(node.var.val, Let)
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        self(node.expr)
+        node.slot = self.declare(node.var.val, Mut)
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        node.slot = self.reference(node.var.val)
+        self(node.expr)
+
+    def visit_var(self, node):
+        if not type(node) is Var:
+            raise TypeError
+        node.slot = self.reference(node.val)
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        self.visit_binop(node)
+
+    def visit_fun(self, node):
+        if not type(node) is Fun:
+            raise TypeError
+        parent, loops, declared = self.scope, self.loops, self.declared
+        scope = FunScope(node, parent)
+        parent.children.append(scope)
+        self.scope, self.loops, self.declared = scope, 0, set()
+        try:
+            self(node.body)
+        finally:
+            self.scope, self.loops, self.declared = parent, loops, declared
+        scope.resolve_free()
+        for name in scope.free:
+            self.reference(name)
+        node.scope = scope
+        if node.name is not None:
+            node.slot = self.declare(node.name, Fun)
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        self(node.fun)
+        for a in node.args:
+            self(a)
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        for k, v in node.mappings.items():
+            self(v)
+            self(k)
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        self(node.m)
+        self(node.k)
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        self(node.m)
+        self(node.k)
+        self(node.v)
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        self(node.m)
+        self(node.k)
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        self(node.c)
+        self(node.l)
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        self(node.m)
+        self(node.lo)
+        self(node.hi)
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        self(node.m)
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        for e in node.elements:
+            self(e)
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        self(node.arg)
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        self(node.arg)
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        self(node.tail)
+        self(node.head)
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        self(node.arg)
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        self(node.arg)
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        self(node.arg)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        self(node.arg)
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        self(node.arg)
+
+    def visit_nil(self, node):
+        if not type(node) is Nil:
+            raise TypeError
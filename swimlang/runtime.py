@@ -0,0 +1,621 @@
+##################################################################################
+# Runtime support shared by the compiled execution engines
+##################################################################################
+
+# All engines share one value representation: python ints, bools and strs for
+# primitives, and Fun, List, Map and Nil objects for everything else. The
+# P_List or P_Vector of a List value and the P_Tree or P_SortedMap of a Map
+# value hold values directly, never AST nodes. The helpers below implement the operations whose behavior
+# is more involved than a single python operator.
+
+import collections
+import enum
+import sys
+from swimlang.ast import *
+
+
+@enum.unique
+class Scope(enum.Enum):
+    PARAM = enum.auto()
+    LOCAL = enum.auto()
+    INHERITED = enum.auto()
+
+
+@enum.unique
+class Decl(enum.Enum):
+    LET = enum.auto()
+    MUT = enum.auto()
+    NONE = enum.auto()  # used for set <var> <val>
+
+
+class Binding(object):
+    def __init__(self, scope, decl, val):
+        if type(scope) is not Scope:
+            raise TypeError
+        if type(decl) is not Decl:
+            raise TypeError
+        self.scope = scope
+        self.decl = decl
+        self.val = val
+
+
+class Unbound(object):
+    def __repr__(self):
+        return "UNBOUND"
+
+
+UNBOUND = Unbound()
+
+# Binding kinds stored alongside slot values. A slot without a binding has
+# kind None.
+PARAM = 1
+LET = 2
+MUT = 3
+INHERITED_LET = 4
+INHERITED_MUT = 5
+
+
+class Frame(object):
+    __slots__ = ("scope", "fun", "vals", "kinds", "back")
+
+    def __init__(self, scope, fun, vals, kinds, back):
+        self.scope = scope
+        self.fun = fun
+        self.vals = vals
+        self.kinds = kinds
+        self.back = back
+
+
+class Cell(object):
+    # Holds the value of a mut variable that is captured by a closure.
+    __slots__ = ("val",)
+
+    def __init__(self, val):
+        self.val = val
+
+
+def inherit(kind):
+    if kind is None:
+        return None
+    if kind == MUT or kind == INHERITED_MUT:
+        return INHERITED_MUT
+    return INHERITED_LET
+
+
+def declare(names, vals, kinds, slot, kind, val):
+    current = kinds[slot]
+    if current == LET or current == MUT:
+        raise ValueError(
+            "re-declaration of %s inside local scope" % names[slot])
+    if current == PARAM:
+        raise ValueError("re-declaration of param %s" % names[slot])
+    vals[slot] = val
+    kinds[slot] = kind
+    return val
+
+
+def declare_cell(names, vals, kinds, slot, kind, val):
+    declare(names, vals, kinds, slot, kind, Cell(val))
+    return val
+
+
+def check_set(names, kinds, slot):
+    current = kinds[slot]
+    if current is None:
+        raise ValueError
+    if current == PARAM or current == LET or current == INHERITED_LET:
+        raise ValueError("cannot rebind non-mutable %s" % names[slot])
+
+
+def load_error(names, slot):
+    raise ValueError("unbound variable %s" % names[slot])
+
+
+def load_cell(names, vals, slot):
+    cell = vals[slot]
+    if cell is UNBOUND:
+        load_error(names, slot)
+    return cell.val
+
+
+def new_closure(fun, scope, code, lexical_scope, vals, kinds):
+    out = Fun(None, fun.params, fun.body, lexical_scope)
+    out.env = {fun.name: Binding(Scope.PARAM, Decl.LET, out)}
+    out.scope = scope
+    out.code = code
+    out.args = ()
+    size = scope.size()
+    out.vals = [UNBOUND] * size
+    out.kinds = [None] * size
+    for p in scope.params:
+        out.kinds[p] = PARAM
+    for (outer, inner) in scope.captures:
+        out.vals[inner] = vals[outer]
+        out.kinds[inner] = inherit(kinds[outer])
+    if scope.self_slot is not None:
+        out.vals[scope.self_slot] = out
+        out.kinds[scope.self_slot] = PARAM
+    return out
+
+
+def bind(fun, args):
+    vals = list(fun.vals)
+    params = fun.scope.params
+    bound = fun.args
+    n = len(bound)
+    for i in range(n):
+        vals[params[i]] = bound[i]
+    for i in range(len(args)):
+        vals[params[n + i]] = args[i]
+    return vals
+
+
+def partial(fun, args):
+    # A partial application shares the frame template and code of the function
+    # it applies and only records the arguments supplied so far, which are
+    # bound into a frame once all params are available.
+    out = Fun.__new__(Fun)
+    out.__dict__.update(fun.__dict__)
+    out.params = fun.params[len(args):]
+    out.args = fun.args + tuple(args)
+    return out
+
+
+# Default number of results a memoized function keeps
+MEMO_SIZE = 1024
+MISSING = object()
+
+
+def memo_key(v):
+    # Lists and maps are keyed on their type and contents, other values on themselves. The
+    # type of a list or map includes the structure that holds its contents, so that a call
+    # never returns the result cached for a different kind of value with equal contents. Bools
+    # are kept apart from the ints they compare equal to.
+    t = type(v)
+    if t is int or t is str:
+        return v
+    if t is bool:
+        return (bool, v)
+    if t is List:
+        return (List, type(v.elements), tuple(memo_key(e) for e in v.elements))
+    if t is Map:
+        return (Map, type(v.mappings),
+                frozenset((memo_key(k), memo_key(e)) for k, e in v.mappings.items()))
+    return v
+
+
+class Memo(object):
+    # The results of a memoized function value keyed on its arguments, holding at most size
+    # entries. The least recently used entry is evicted first.
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, fun, args):
+        return tuple(memo_key(v) for v in fun.args) + tuple(memo_key(v) for v in args)
+
+    def get(self, key):
+        entries = self.entries
+        val = entries.get(key, MISSING)
+        if val is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            entries.move_to_end(key)
+        return val
+
+    def put(self, key, val):
+        entries = self.entries
+        entries[key] = val
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return val
+
+
+class Memos(object):
+    # Creates the caches of the functions a program memoizes and reports their statistics.
+    def __init__(self, size=MEMO_SIZE):
+        if not type(size) is int:
+            raise TypeError
+        if size <= 0:
+            raise ValueError("memo size must be positive")
+        self.size = size
+        self.caches = []
+
+    def memoize(self, fun):
+        # Returns a copy of fun with its own cache. Its name is bound to the copy, so that
+        # recursive calls go through the cache too. Each closure value is memoized
+        # separately, so closures of the same fun never share results.
+        if not type(fun) is Fun:
+            raise TypeError
+        out = Fun.__new__(Fun)
+        out.__dict__.update(fun.__dict__)
+        self_slot = fun.scope.self_slot
+        if self_slot is not None:
+            out.vals = list(fun.vals)
+            out.vals[self_slot] = out
+        out.memo = Memo(self.size)
+        self.caches.append(out.memo)
+        return out
+
+    def stats(self):
+        out = collections.OrderedDict()
+        out["functions"] = len(self.caches)
+        for field in ["hits", "misses", "evictions"]:
+            out[field] = sum(getattr(c, field) for c in self.caches)
+        out["entries"] = sum(len(c.entries) for c in self.caches)
+        return out
+
+
+class OutOfSteps(Exception):
+    # Raised when a run exceeds its step budget. stats holds the counts of the run so far.
+    def __init__(self, stats):
+        Exception.__init__(self, "step budget of %d exceeded after %d steps, %d calls and %d "
+                           "loop iterations" % (stats["max_steps"], stats["steps"],
+                                                stats["calls"], stats["iterations"]))
+        self.stats = stats
+
+
+class Budget(object):
+    # Counts the steps of a run and raises OutOfSteps once there are more than max_steps. A
+    # loop iteration costs the number of nodes of the loop's condition and body, and a call
+    # that runs a function body one more than the number of nodes of the body. The count
+    # thus follows the number of nodes evaluated, but is only updated on loop iterations and
+    # calls, and is the same for every engine.
+    def __init__(self, max_steps):
+        if not type(max_steps) is int:
+            raise TypeError
+        self.max_steps = max_steps
+        self.steps = 0
+        self.calls = 0
+        self.iterations = 0
+        # node -> number of nodes
+        self.sizes = {}
+
+    def size(self, node):
+        out = self.sizes.get(node)
+        if out is None:
+            out = self.sizes[node] = size(node)
+        return out
+
+    def loop_cost(self, node):
+        # The cost of an iteration of the while loop node
+        return self.size(node) - 1
+
+    def call_cost(self, body):
+        return self.size(body) + 1
+
+    def loop(self, cost):
+        self.iterations += 1
+        self.steps += cost
+        if self.steps > self.max_steps:
+            raise OutOfSteps(self.stats())
+
+    def call(self, cost):
+        self.calls += 1
+        self.steps += cost
+        if self.steps > self.max_steps:
+            raise OutOfSteps(self.stats())
+
+    def stats(self):
+        out = collections.OrderedDict()
+        for field in ["max_steps", "steps", "calls", "iterations"]:
+            out[field] = getattr(self, field)
+        return out
+
+
+def object_bytes(obj):
+    # The size of an object and of its attribute dict, if it has one
+    out = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        out += sys.getsizeof(obj.__dict__)
+    return out
+
+
+# The sizes charged for a node of a list, of a vector and of a map
+LIST_NODE_BYTES = object_bytes(P_List.Node(None, None))
+VECTOR_NODE_BYTES = object_bytes([None] * P_Vector.WIDTH)
+# A map node is charged as a leaf of one key, with the tuples that hold the key and value.
+MAP_NODE_BYTES = (object_bytes(P_Tree.Leaf(0, ((None, None),))) + sys.getsizeof(((None, None),)) +
+                  sys.getsizeof((None, None)))
+
+# The number of functions an OutOfMemory reports
+TOP_ALLOCATORS = 5
+
+
+def owner(fun):
+    # The name allocations of the function value fun, or of the top level if None, count for.
+    # A closure keeps the name of its declaration in its env.
+    if fun is None:
+        return "<top>"
+    names = [n for n in fun.env if n is not None]
+    return names[0] if names else "<lambda>"
+
+
+class OutOfMemory(Exception):
+    # Raised when a run exceeds its memory quota. stats holds the counts of the run so far,
+    # and top the (function name, bytes) of the functions that allocated the most.
+    def __init__(self, stats, top):
+        Exception.__init__(self, "memory quota of %d bytes exceeded after allocating %d bytes: "
+                           "%d list nodes, %d map nodes and %d bytes of strings" %
+                           (stats["max_memory"], stats["bytes"], stats["list_nodes"],
+                            stats["map_nodes"], stats["string_bytes"]))
+        self.stats = stats
+        self.top = top
+
+
+class Quota(object):
+    # Counts the list and map nodes and the strs that a run allocates, by the function that
+    # allocates them, and raises OutOfMemory once they take more than max_memory bytes. Memory
+    # that becomes garbage is not given back, so the quota limits the allocations of a run
+    # rather than its live data.
+    def __init__(self, max_memory):
+        if not type(max_memory) is int:
+            raise TypeError
+        self.max_memory = max_memory
+        self.bytes = 0
+        self.list_nodes = 0
+        self.map_nodes = 0
+        self.string_bytes = 0
+        # function name -> bytes
+        self.owners = {}
+
+    def charge(self, fun, n):
+        self.bytes += n
+        name = owner(fun)
+        self.owners[name] = self.owners.get(name, 0) + n
+        if self.bytes > self.max_memory:
+            raise OutOfMemory(self.stats(), self.top())
+
+    def list(self, fun, n):
+        self.list_nodes += n
+        self.charge(fun, n * LIST_NODE_BYTES)
+
+    def vector(self, fun, n):
+        # The nodes of vectors count as list nodes.
+        self.list_nodes += n
+        self.charge(fun, n * VECTOR_NODE_BYTES)
+
+    def map(self, fun, n):
+        self.map_nodes += n
+        self.charge(fun, n * MAP_NODE_BYTES)
+
+    def string(self, fun, v):
+        # Charges v if it is a str, the result of an operator that may create one.
+        if type(v) is str:
+            n = sys.getsizeof(v)
+            self.string_bytes += n
+            self.charge(fun, n)
+        return v
+
+    def put(self, fun, m, k):
+        # Charges the nodes (put m k v) allocates. The nodes of ordered maps count as map nodes.
+        if type(m) is Map:
+            self.map(fun, m.mappings.put_nodes(k))
+        elif type(m) is List and type(m.elements) is P_Vector:
+            self.vector(fun, m.elements.put_nodes(k))
+
+    def remove(self, fun, m, k):
+        # Charges the nodes (remove m k) allocates.
+        if type(m) is Map:
+            self.map(fun, m.mappings.remove_nodes(k))
+
+    def into(self, fun, out, n):
+        # Charges the n nodes (into c l) allocated to build out.
+        if type(out) is Map:
+            self.map(fun, n)
+        elif type(out.elements) is P_Vector:
+            self.vector(fun, n)
+        else:
+            self.list(fun, n)
+
+    def ordered(self, fun, m):
+        # Charges the nodes (ordered m) allocates.
+        if type(m) is Map and type(m.mappings) is P_Tree:
+            self.map(fun, len(m.mappings))
+
+    def vec(self, fun, l):
+        # Charges the nodes (vec l) allocates.
+        if type(l) is List and type(l.elements) is P_List:
+            self.vector(fun, P_Vector.nodes(len(l.elements)))
+
+    def push(self, fun, l):
+        # Charges the nodes (push h l) allocates.
+        if type(l) is List and type(l.elements) is P_Vector:
+            self.vector(fun, l.elements.push_nodes())
+        elif type(l) is List:
+            self.list(fun, 1)
+
+    def top(self, n=TOP_ALLOCATORS):
+        owners = [item for item in self.owners.items() if item[1] > 0]
+        return sorted(owners, key=lambda item: (-item[1], item[0]))[:n]
+
+    def stats(self):
+        out = collections.OrderedDict()
+        for field in ["max_memory", "bytes", "list_nodes", "map_nodes", "string_bytes"]:
+            out[field] = getattr(self, field)
+        return out
+
+
+def div(a, b):
+    return int(a / b)
+
+
+def make_list(vals):
+    return List(P_List(initial=vals))
+
+
+def make_map(pairs):
+    return Map(P_Tree(init_mappings=pairs))
+
+
+def make_vector(l):
+    if not type(l) is List:
+        raise TypeError
+    if type(l.elements) is P_Vector:
+        return l
+    return List(P_Vector(initial=list(l.elements)))
+
+
+def nth(l, i):
+    # get on a vector
+    if not type(l.elements) is P_Vector:
+        raise TypeError
+    return l.elements.nth(i)
+
+
+def assoc(l, i, v):
+    # put on a vector
+    if not type(l.elements) is P_Vector:
+        raise TypeError
+    return List(l.elements.assoc(i, v))
+
+
+def decode(node):
+    # The value of the string literal node. An invalid literal raises when it is evaluated,
+    # as in the evaluator, not when it is compiled.
+    return node.decoded if node.decoded is not None else node.decode()
+
+
+def check_collection(m):
+    # Checks the first operand of get and put before their others are evaluated, as the
+    # evaluator does.
+    if not (type(m) is Map or type(m) is List):
+        raise TypeError
+    return m
+
+
+def check_list(l):
+    # Checks the list operand of push before its head is evaluated.
+    if not type(l) is List:
+        raise TypeError
+    return l
+
+
+def check_map(m):
+    # Checks the map operand of remove before its key is evaluated.
+    if not type(m) is Map:
+        raise TypeError
+    return m
+
+
+def check_ordered(m):
+    # Checks the ordered map operand of between before its bounds are evaluated.
+    if not (type(m) is Map and type(m.mappings) is P_SortedMap):
+        raise TypeError
+    return m
+
+
+def get(m, k):
+    if type(m) is List:
+        return nth(m, k)
+    if not type(m) is Map:
+        raise TypeError
+    return m.mappings.get(k)
+
+
+def put(m, k, v):
+    if type(m) is List:
+        return assoc(m, k, v)
+    if not type(m) is Map:
+        raise TypeError
+    return Map(m.mappings.put(k, v))
+
+
+def remove(m, k):
+    if not type(m) is Map:
+        raise TypeError
+    return Map(m.mappings.remove(k))
+
+
+def build_into(c, l):
+    # Returns (into c l) and the number of nodes it allocates. The elements of the list l are
+    # added to a transient of c: a map takes the key and value of each element, which is a list
+    # of two, and a list or vector appends each element at its end.
+    if not type(l) is List:
+        raise TypeError
+    if type(c) is Map:
+        out = c.mappings.transient()
+        for pair in l.elements:
+            if not type(pair) is List:
+                raise TypeError
+            if len(pair.elements) != 2:
+                raise ValueError("into a map takes [key value] pairs")
+            k, v = pair.elements
+            out.put(k, v)
+        return Map(out.persistent()), out.nodes
+    if not type(c) is List:
+        raise TypeError
+    out = c.elements.transient()
+    for v in l.elements:
+        out.append(v)
+    return List(out.persistent()), out.nodes
+
+
+def into(c, l):
+    return build_into(c, l)[0]
+
+
+def make_ordered(m):
+    if not type(m) is Map:
+        raise TypeError
+    if type(m.mappings) is P_SortedMap:
+        return m
+    return Map(P_SortedMap(init_mappings=list(m.mappings.items())))
+
+
+def between(m, lo, hi):
+    # The keys k of the ordered map m with lo <= k < hi
+    if not (type(m) is Map and type(m.mappings) is P_SortedMap):
+        raise TypeError
+    return List(P_List(initial=[k for k, _ in m.mappings.range(lo, hi)]))
+
+
+def keys(m):
+    if not type(m) is Map:
+        raise TypeError
+    return List(m.mappings.keys())
+
+
+def head(l):
+    if not type(l) is List:
+        raise TypeError
+    if len(l.elements) <= 0:
+        raise ValueError
+    return l.elements.head()
+
+
+def tail(l):
+    if not type(l) is List:
+        raise TypeError
+    if len(l.elements) <= 0:
+        raise ValueError
+    return List(l.elements.tail())
+
+
+def push(h, l):
+    if not type(l) is List:
+        raise TypeError
+    return List(l.elements.push(h))
+
+
+def print_value(v):
+    print(v)
+    return Nil.instance()
+
+
+# Primitive values report the class of their literal.
+TYPES = {int: Int, bool: Bool, str: Str}
+
+
+def type_of(v):
+    t = type(v)
+    return TYPES.get(t, t)
+
+
+def exit():
+    sys.exit(0)
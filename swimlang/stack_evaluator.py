@@ -0,0 +1,387 @@
+##################################################################################
+# Explicit-stack evaluator
+##################################################################################
+
+# Evaluates programs with the Evaluator's semantics without recursing in python.
+# Every visit method of a node with children is a generator that yields the
+# child nodes it needs evaluated and receives their values back. The driver in
+# run keeps the pending generators on a list, so the depth of swim
+# recursion, tail or not, is limited by memory rather than the python stack.
+
+import types
+from swimlang.ast import *
+from swimlang.evaluator import Evaluator, TailCall
+from swimlang.runtime import Frame, LET, MUT
+import swimlang.runtime as rt
+
+
+class StackEvaluator(Evaluator):
+    def __call__(self, node):
+        self.enter(node)
+        try:
+            return self.run(node)
+        finally:
+            self.frame = None
+
+    def run(self, node):
+        work = []
+        val = node.accept(self)
+        while True:
+            if type(val) is types.GeneratorType:
+                work.append(val)
+                val = None
+            elif not work:
+                return val
+            try:
+                val = work[-1].send(val)
+                if issubclass(type(val), Node):
+                    val = val.accept(self)
+                    continue
+                raise AssertionError("generator yielded non-node %s" % str(val))
+            except StopIteration as e:
+                work.pop()
+                val = e.value
+
+    def visit_binop(self, node, op):
+        first = yield node.first
+        second = yield node.second
+        return op(first, second)
+
+    def visit_str_binop(self, node, op):
+        # A binop whose result may be a new str
+        out = yield from self.visit_binop(node, op)
+        if self.quota is not None:
+            self.quota.string(self.frame.fun, out)
+        return out
+
+    def visit_add(self, node):
+        if not type(node) is Add:
+            raise TypeError
+        return self.visit_str_binop(node, lambda a, b: a + b)
+
+    def visit_sub(self, node):
+        if not type(node) is Sub:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a - b)
+
+    def visit_mul(self, node):
+        if not type(node) is Mul:
+            raise TypeError
+        return self.visit_str_binop(node, lambda a, b: a * b)
+
+    def visit_div(self, node):
+        if not type(node) is Div:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: int(a / b))
+
+    def visit_mod(self, node):
+        if not type(node) is Mod:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a % b)
+
+    def visit_eq(self, node):
+        if not type(node) is Eq:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a == b)
+
+    def visit_not_eq(self, node):
+        if not type(node) is NotEq:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a != b)
+
+    def visit_lt(self, node):
+        if not type(node) is Lt:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a < b)
+
+    def visit_lte(self, node):
+        if not type(node) is Lte:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a <= b)
+
+    def visit_gt(self, node):
+        if not type(node) is Gt:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a > b)
+
+    def visit_gte(self, node):
+        if not type(node) is Gte:
+            raise TypeError
+        return self.visit_binop(node, lambda a, b: a >= b)
+
+    def visit_and(self, node):
+        if not type(node) is And:
+            raise TypeError
+        return (yield node.first) and (yield node.second)
+
+    def visit_or(self, node):
+        if not type(node) is Or:
+            raise TypeError
+        return (yield node.first) or (yield node.second)
+
+    def visit_not(self, node):
+        if not type(node) is Not:
+            raise TypeError
+        return not (yield node.arg)
+
+    def visit_if(self, node):
+        if not type(node) is If:
+            raise TypeError
+        if (yield node.cond):
+            return (yield node.first)
+        return (yield node.second)
+
+    def visit_while(self, node):
+        if not type(node) is While:
+            raise TypeError
+        out = False
+        budget = self.budget
+        while (yield node.cond):
+            out = yield node.body
+            if budget is not None:
+                budget.loop(budget.loop_cost(node))
+        return out
+
+    def visit_let(self, node):
+        if not type(node) is Let:
+            raise TypeError
+        return self.declare(node.slot, LET, (yield node.expr))
+
+    def visit_mut(self, node):
+        if not type(node) is Mut:
+            raise TypeError
+        return self.declare(node.slot, MUT, (yield node.expr))
+
+    def visit_set(self, node):
+        if not type(node) is Set:
+            raise TypeError
+        if self.frame.kinds[node.slot] is None:
+            raise ValueError
+        val = yield node.expr
+        return self.rebind(node, val)
+
+    def visit_seq(self, node):
+        if not type(node) is Seq:
+            raise TypeError
+        while type(node) is Seq:
+            yield node.first
+            node = node.second
+        return (yield node)
+
+    def visit_call(self, node):
+        if not type(node) is Call:
+            raise TypeError
+        fun = yield node.fun
+        return (yield from self.call(node, fun))
+
+    def call(self, node, fun):
+        if not type(fun) is Fun:
+            # Non-functions are callable in that they take no arguments and return themselves.
+            if len(node.args) == 0:
+                return fun
+            # Non-functions cannot take arguments.
+            raise TypeError
+        if len(fun.params) < len(node.args):
+            # Too many arguments supplied
+            raise ValueError
+        args = []
+        for a in node.args:
+            args.append((yield a))
+        if len(fun.params) > len(args):
+            # Not all params available - return a closure
+            return rt.partial(fun, args)
+        memo = fun.memo
+        if memo is not None:
+            key = memo.key(fun, args)
+            out = memo.get(key)
+            if out is not rt.MISSING:
+                return out
+        # All params available - evaluate the function
+        back = self.frame
+        frame = Frame(fun.scope, fun, rt.bind(fun, args), list(fun.kinds), back)
+        budget = self.budget
+        while True:
+            if budget is not None:
+                budget.call(budget.call_cost(fun.body))
+            self.frame = frame
+            out = yield from self.eval_body(fun.body)
+            if not type(out) is TailCall:
+                self.frame = back
+                if memo is not None:
+                    memo.put(key, out)
+                return out
+            fun = out.fun
+            frame = Frame(fun.scope, fun, out.vals, list(fun.kinds), back)
+
+    def eval_body(self, node):
+        while True:
+            if type(node) is Seq:
+                yield node.first
+                node = node.second
+            elif type(node) is If:
+                node = node.first if (yield node.cond) else node.second
+            else:
+                break
+        if not type(node) is Call:
+            return (yield node)
+        fun = yield node.fun
+        if not type(fun) is Fun or len(fun.params) != len(node.args) or fun.memo is not None:
+            return (yield from self.call(node, fun))
+        args = []
+        for a in node.args:
+            args.append((yield a))
+        return TailCall(fun, rt.bind(fun, args))
+
+    def visit_map(self, node):
+        if not type(node) is Map:
+            raise TypeError
+        pairs = []
+        for k, v in node.mappings.items():
+            # Same order as the Evaluator, which evaluates the value first.
+            v = yield v
+            pairs.append(((yield k), v))
+        out = rt.make_map(pairs)
+        if self.quota is not None:
+            self.quota.map(self.frame.fun, len(out.mappings))
+        return out
+
+    def visit_get(self, node):
+        if not type(node) is Get:
+            raise TypeError
+        m = yield node.m
+        if type(m) is List:
+            return rt.nth(m, (yield node.k))
+        if not type(m) is Map:
+            raise TypeError
+        return m.mappings.get((yield node.k))
+
+    def visit_put(self, node):
+        if not type(node) is Put:
+            raise TypeError
+        m = yield node.m
+        if not (type(m) is Map or type(m) is List):
+            raise TypeError
+        k = yield node.k
+        v = yield node.v
+        if self.quota is not None:
+            self.quota.put(self.frame.fun, m, k)
+        if type(m) is List:
+            return rt.assoc(m, k, v)
+        return Map(m.mappings.put(k, v))
+
+    def visit_remove(self, node):
+        if not type(node) is Remove:
+            raise TypeError
+        m = yield node.m
+        if not type(m) is Map:
+            raise TypeError
+        k = yield node.k
+        if self.quota is not None:
+            self.quota.remove(self.frame.fun, m, k)
+        return Map(m.mappings.remove(k))
+
+    def visit_into(self, node):
+        if not type(node) is Into:
+            raise TypeError
+        c = yield node.c
+        out, nodes = rt.build_into(c, (yield node.l))
+        if self.quota is not None:
+            self.quota.into(self.frame.fun, out, nodes)
+        return out
+
+    def visit_between(self, node):
+        if not type(node) is Between:
+            raise TypeError
+        m = yield node.m
+        if not (type(m) is Map and type(m.mappings) is P_SortedMap):
+            raise TypeError
+        lo = yield node.lo
+        out = rt.between(m, lo, (yield node.hi))
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(out.elements))
+        return out
+
+    def visit_keys(self, node):
+        if not type(node) is Keys:
+            raise TypeError
+        m = yield node.m
+        if not type(m) is Map:
+            raise TypeError
+        keys = List(m.mappings.keys())
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(keys.elements))
+        return keys
+
+    def visit_list(self, node):
+        if not type(node) is List:
+            raise TypeError
+        elements = []
+        for e in node.elements:
+            elements.append((yield e))
+        if self.quota is not None:
+            self.quota.list(self.frame.fun, len(elements))
+        return rt.make_list(elements)
+
+    def visit_head(self, node):
+        if not type(node) is Head:
+            raise TypeError
+        l = yield node.arg
+        if not type(l) is List:
+            raise TypeError
+        if len(l.elements) <= 0:
+            raise ValueError
+        return l.elements.head()
+
+    def visit_tail(self, node):
+        if not type(node) is Tail:
+            raise TypeError
+        l = yield node.arg
+        if not type(l) is List:
+            raise TypeError
+        if len(l.elements) <= 0:
+            raise ValueError
+        return List(l.elements.tail())
+
+    def visit_push(self, node):
+        if not type(node) is Push:
+            raise TypeError
+        l = yield node.tail
+        if not type(l) is List:
+            raise TypeError
+        h = yield node.head
+        if self.quota is not None:
+            self.quota.push(self.frame.fun, l)
+        return List(l.elements.push(h))
+
+    def visit_print(self, node):
+        if not type(node) is Print:
+            raise TypeError
+        print((yield node.arg))
+        return Nil.instance()
+
+    def visit_type(self, node):
+        if not type(node) is Type:
+            raise TypeError
+        return rt.type_of((yield node.arg))
+
+    def visit_memo(self, node):
+        if not type(node) is Memo:
+            raise TypeError
+        return self.memos.memoize((yield node.arg))
+
+    def visit_ordered(self, node):
+        if not type(node) is Ordered:
+            raise TypeError
+        m = yield node.arg
+        if self.quota is not None:
+            self.quota.ordered(self.frame.fun, m)
+        return rt.make_ordered(m)
+
+    def visit_vec(self, node):
+        if not type(node) is Vec:
+            raise TypeError
+        l = yield node.arg
+        if self.quota is not None:
+            self.quota.vec(self.frame.fun, l)
+        return rt.make_vector(l)
+
@@ -1,26 +1,68 @@
 #!/usr/bin/python3
 
-from swimlang.interpreter import Interpreter
+from swimlang.interpreter import Interpreter, ENGINES
 from swimlang.repl import Repl
+from swimlang.runtime import MEMO_SIZE, OutOfSteps, OutOfMemory
+from swimlang.inliner import INLINE_SIZE
+from swimlang.util import deep_call
 
 import argparse
 import sys
 
-sys.setrecursionlimit(10**6)  # FixMe: remove and evaluate iteratively
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         dest="filename", help="path to swimlang file", type=str, nargs='?')
     parser.add_argument("-v", "--verbose", dest="verbose",
                         help="run in verbose mode", action='store_true')
+    parser.add_argument("--engine", dest="engine", help="execution engine",
+                        choices=ENGINES, default="eval")
+    parser.add_argument("--memo-size", dest="memo_size", type=int, default=MEMO_SIZE,
+                        help="number of results each memoized function keeps")
+    parser.add_argument("--memo-stats", dest="memo_stats", action='store_true',
+                        help="print memo cache statistics to stderr after the run")
+    parser.add_argument("--inline-size", dest="inline_size", type=int, default=INLINE_SIZE,
+                        help="largest function body, in AST nodes, to inline (0 disables)")
+    parser.add_argument("--inline-report", dest="inline_report", action='store_true',
+                        help="print the inlined functions to stderr after the run")
+    parser.add_argument("--max-steps", dest="max_steps", type=int, default=None,
+                        help="stop the program after this many evaluation steps")
+    parser.add_argument("--max-memory", dest="max_memory", type=int, default=None,
+                        help="stop the program after it allocates this many bytes of lists, "
+                        "maps and strings")
+    parser.add_argument("-O", dest="verified", action='store_true',
+                        help="check the program once, then build and run it without the checks "
+                        "of the node constructors")
     args = parser.parse_args()
     if args.filename:
         with open(args.filename) as f:
             src = f.read()
-            print(Interpreter(src).interpret(verbose=args.verbose))
+            interpreter = Interpreter(src)
+            try:
+                print(deep_call(lambda: interpreter.interpret(
+                    verbose=args.verbose, engine=args.engine, memo_size=args.memo_size,
+                    inline_size=args.inline_size, max_steps=args.max_steps,
+                    max_memory=args.max_memory, verified=args.verified)))
+            except RecursionError:
+                print("swim: maximum recursion depth exceeded", file=sys.stderr)
+                sys.exit(1)
+            except OutOfSteps as e:
+                print("swim: %s" % e, file=sys.stderr)
+                sys.exit(1)
+            except OutOfMemory as e:
+                print("swim: %s" % e, file=sys.stderr)
+                for name, size in e.top:
+                    print("memory: %s bytes=%d" % (name, size), file=sys.stderr)
+                sys.exit(1)
+            if args.memo_stats:
+                stats = interpreter.memos.stats()
+                print("memo: " + " ".join("%s=%d" % (k, v) for k, v in stats.items()),
+                      file=sys.stderr)
+            if args.inline_report:
+                for name, size, calls in interpreter.inlined:
+                    print("inline: %s size=%d calls=%d" % (name, size, calls), file=sys.stderr)
     else:
         try:
-            Repl().cmdloop()
+            deep_call(Repl().cmdloop)
         except KeyboardInterrupt:
             pass
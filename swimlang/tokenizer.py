@@ -48,6 +48,12 @@ class TokenType(enum.Enum):
     KEYS = "keys"
     TYPE = "type"
     PRINT = "print"
+    MEMO = "memo"
+    VEC = "vec"
+    ORDERED = "ordered"
+    REMOVE = "remove"
+    BETWEEN = "between"
+    INTO = "into"
     TRUE = "True"
     FALSE = "False"
     NIL = "Nil"
@@ -87,7 +93,13 @@ KEYWORDS = [
     TokenType.PUT.value,
     TokenType.KEYS.value,
     TokenType.PRINT.value,
-    TokenType.TYPE.value
+    TokenType.TYPE.value,
+    TokenType.MEMO.value,
+    TokenType.VEC.value,
+    TokenType.ORDERED.value,
+    TokenType.REMOVE.value,
+    TokenType.BETWEEN.value,
+    TokenType.INTO.value
 ]
 
 
@@ -2,6 +2,10 @@
 # Utility functions
 ##################################################################################
 
+import sys
+import threading
+
+
 def alpha(val):
     if val is None or val == '':
         return False
@@ -46,3 +50,38 @@ def isspace(val):
     if val is None:
         return False
     return val.isspace()
+
+
+# The parser, the passes and the engines that evaluate swim calls with python calls recurse
+# once or more per level of nesting. deep_call runs them with a recursion limit that allows
+# deep programs, on a thread whose stack is large enough for that many python frames, so that
+# a program that recurses too deeply raises RecursionError instead of crashing the process.
+RECURSION_LIMIT = 10**6
+STACK_SIZE = 512 * 2**20
+
+
+def deep_call(fun, *args):
+    # Returns fun(*args), or raises its exception, called on a thread with a large stack.
+    out = []
+    error = []
+
+    def run():
+        try:
+            out.append(fun(*args))
+        except BaseException as e:
+            error.append(e)
+    limit = sys.getrecursionlimit()
+    size = threading.stack_size(STACK_SIZE)
+    try:
+        sys.setrecursionlimit(RECURSION_LIMIT)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+    finally:
+        threading.stack_size(size)
+    try:
+        thread.join()
+    finally:
+        sys.setrecursionlimit(limit)
+    if error:
+        raise error[0]
+    return out[0]
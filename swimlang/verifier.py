@@ -0,0 +1,220 @@
+##################################################################################
+# AST verifier
+##################################################################################
+
+# Checks once that a tree is well formed: every node is of one of the node
+# types and has the fields its constructor checks, which catches trees whose
+# fields were changed after they were built.
+
+from swimlang.ast import *
+from swimlang.util import valid_var
+from swimlang.visitor import *
+
+NODE_TYPES = frozenset([Exit, Int, Add, Sub, Mul, Div, Mod, Eq, NotEq, Lt, Lte, Gt, Gte, Bool,
+                        And, Or, Not, Str, If, While, Let, Mut, Set, Var, Seq, Fun, Call, Map,
+                        Get, Put, Remove, Into, Between, Keys, Type, List, Head, Tail, Push, Print, Memo,
+                        Vec, Ordered, Nil])
+
+
+def verify(node):
+    # Verifies node and its descendants without recursing. Raises TypeError or ValueError
+    # like the node constructors, and returns node.
+    verifier = Verifier()
+    verifier.node(node)
+    todo = verifier.todo
+    while todo:
+        todo.pop().accept(verifier)
+    return node
+
+
+class Verifier(Visitor):
+    # Checks the fields of a node, and adds its children to todo. Its visit methods do not
+    # check the type of their node, which node checks before the node is visited.
+    def __init__(self):
+        self.todo = []
+
+    def node(self, val):
+        if type(val) not in NODE_TYPES:
+            raise TypeError
+        self.todo.append(val)
+
+    def visit_binop(self, node):
+        self.node(node.first)
+        self.node(node.second)
+
+    def visit_int(self, node):
+        if not type(node.val) is int:
+            raise TypeError
+
+    def visit_add(self, node):
+        self.visit_binop(node)
+
+    def visit_sub(self, node):
+        self.visit_binop(node)
+
+    def visit_mul(self, node):
+        self.visit_binop(node)
+
+    def visit_div(self, node):
+        self.visit_binop(node)
+
+    def visit_mod(self, node):
+        self.visit_binop(node)
+
+    def visit_eq(self, node):
+        self.visit_binop(node)
+
+    def visit_exit(self, node):
+        pass
+
+    def visit_not_eq(self, node):
+        self.visit_binop(node)
+
+    def visit_lt(self, node):
+        self.visit_binop(node)
+
+    def visit_lte(self, node):
+        self.visit_binop(node)
+
+    def visit_gt(self, node):
+        self.visit_binop(node)
+
+    def visit_gte(self, node):
+        self.visit_binop(node)
+
+    def visit_bool(self, node):
+        if not type(node.val) is bool:
+            raise TypeError
+
+    def visit_and(self, node):
+        self.visit_binop(node)
+
+    def visit_or(self, node):
+        self.visit_binop(node)
+
+    def visit_not(self, node):
+        self.node(node.arg)
+
+    def visit_str(self, node):
+        if not type(node.val) is str:
+            raise TypeError
+
+    def visit_if(self, node):
+        self.node(node.cond)
+        self.node(node.first)
+        self.node(node.second)
+
+    def visit_while(self, node):
+        self.node(node.cond)
+        self.node(node.body)
+
+    def visit_declaration(self, node):
+        if not type(node.var) is Var:
+            raise TypeError
+        self.visit_var(node.var)
+        self.node(node.expr)
+
+    def visit_let(self, node):
+        self.visit_declaration(node)
+
+    def visit_mut(self, node):
+        self.visit_declaration(node)
+
+    def visit_set(self, node):
+        self.visit_declaration(node)
+
+    def visit_var(self, node):
+        if not type(node.val) is str:
+            raise TypeError
+        if not valid_var(node.val):
+            raise TypeError
+
+    def visit_seq(self, node):
+        self.visit_binop(node)
+
+    def visit_fun(self, node):
+        if not (type(node.name) is str or node.name is None):
+            raise TypeError
+        if not type(node.params) is list:
+            raise TypeError
+        for p in node.params:
+            if not type(p) is str:
+                raise TypeError
+            if p == node.name:
+                raise ValueError
+        self.node(node.body)
+        if not (type(node.lexical_scope) is Fun or node.lexical_scope is None):
+            raise TypeError
+
+    def visit_call(self, node):
+        self.node(node.fun)
+        if not type(node.args) is list:
+            raise TypeError
+        for a in node.args:
+            self.node(a)
+
+    def visit_map(self, node):
+        if not type(node.mappings) is P_Tree:
+            raise TypeError
+        for k, v in node.mappings.items():
+            self.node(k)
+            self.node(v)
+
+    def visit_get(self, node):
+        self.node(node.m)
+        self.node(node.k)
+
+    def visit_put(self, node):
+        self.node(node.m)
+        self.node(node.k)
+        self.node(node.v)
+
+    def visit_remove(self, node):
+        self.node(node.m)
+        self.node(node.k)
+
+    def visit_into(self, node):
+        self.node(node.c)
+        self.node(node.l)
+
+    def visit_between(self, node):
+        self.node(node.m)
+        self.node(node.lo)
+        self.node(node.hi)
+
+    def visit_keys(self, node):
+        self.node(node.m)
+
+    def visit_type(self, node):
+        self.node(node.arg)
+
+    def visit_list(self, node):
+        if not type(node.elements) is P_List:
+            raise TypeError
+        for e in node.elements:
+            self.node(e)
+
+    def visit_head(self, node):
+        self.node(node.arg)
+
+    def visit_tail(self, node):
+        self.node(node.arg)
+
+    def visit_push(self, node):
+        self.node(node.head)
+        self.node(node.tail)
+
+    def visit_print(self, node):
+        self.node(node.arg)
+
+    def visit_memo(self, node):
+        self.node(node.arg)
+
+    def visit_vec(self, node):
+        self.node(node.arg)
+
+    def visit_ordered(self, node):
+        self.node(node.arg)
+
+    def visit_nil(self, node):
+        pass
@@ -87,6 +87,15 @@ class Visitor(object):
     def visit_put(self, node):
         raise NotImplementedError
 
+    def visit_remove(self, node):
+        raise NotImplementedError
+
+    def visit_into(self, node):
+        raise NotImplementedError
+
+    def visit_between(self, node):
+        raise NotImplementedError
+
     def visit_keys(self, node):
         raise NotImplementedError
 
@@ -108,5 +117,14 @@ class Visitor(object):
     def visit_type(self, ndoe):
         raise NotImplementedError
 
+    def visit_memo(self, node):
+        raise NotImplementedError
+
+    def visit_vec(self, node):
+        raise NotImplementedError
+
+    def visit_ordered(self, node):
+        raise NotImplementedError
+
     def visit_nil(self, node):
         raise NotImplementedError
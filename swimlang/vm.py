@@ -0,0 +1,287 @@
+##################################################################################
+# Stack virtual machine
+##################################################################################
+
+# Runs Code objects produced by the Compiler. Swim calls push a new Frame onto
+# the frame chain instead of recursing in python, so call depth is limited by
+# memory rather than by the python stack.
+
+from swimlang.ast import *
+from swimlang.compiler import *
+from swimlang.runtime import UNBOUND
+import swimlang.runtime as rt
+
+
+class Frame(rt.Frame):
+    __slots__ = ("code", "pc")
+
+    def __init__(self, code, fun, vals, kinds, back):
+        self.scope = code.scope
+        self.fun = fun
+        self.vals = vals
+        self.kinds = kinds
+        self.back = back
+        self.code = code
+        self.pc = 0
+
+
+class MemoFrame(Frame):
+    # The frame of a call of a memoized function, whose result is stored under key on return.
+    __slots__ = ("key",)
+
+    def __init__(self, code, fun, vals, kinds, back, key):
+        Frame.__init__(self, code, fun, vals, kinds, back)
+        self.key = key
+
+
+class VM(object):
+    def __init__(self, memo_size=rt.MEMO_SIZE, max_steps=None, max_memory=None):
+        self.memos = rt.Memos(memo_size)
+        self.budget = None if max_steps is None else rt.Budget(max_steps)
+        self.quota = None if max_memory is None else rt.Quota(max_memory)
+
+    def __call__(self, code):
+        if not type(code) is Code:
+            raise TypeError
+        size = code.scope.size()
+        frame = Frame(code, None, [UNBOUND] * size, [None] * size, None)
+        return self.run(frame)
+
+    def call(self, frame, fun, args):
+        if not type(fun) is Fun:
+            # Non-functions are callable in that they take no arguments and return themselves.
+            if len(args) == 0:
+                return fun
+            # Non-functions cannot take arguments.
+            raise TypeError
+        nparams = len(fun.params)
+        if nparams < len(args):
+            # Too many arguments supplied
+            raise ValueError
+        if nparams > len(args):
+            # Not all params available - return a closure
+            return rt.partial(fun, args)
+        memo = fun.memo
+        if memo is not None:
+            key = memo.key(fun, args)
+            out = memo.get(key)
+            if out is not rt.MISSING:
+                return out
+        if self.budget is not None:
+            self.budget.call(fun.code.cost)
+        if memo is not None:
+            return MemoFrame(fun.code, fun, rt.bind(fun, args), list(fun.kinds), frame, key)
+        return Frame(fun.code, fun, rt.bind(fun, args), list(fun.kinds), frame)
+
+    def run(self, frame):
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        code = frame.code
+        ops = code.ops
+        consts = code.consts
+        vals = frame.vals
+        budget = self.budget
+        quota = self.quota
+        pc = 0
+        while True:
+            op = ops[pc]
+            arg = ops[pc + 1]
+            pc += 2
+            if op == LOAD:
+                v = vals[arg]
+                if v is UNBOUND:
+                    rt.load_error(code.names, arg)
+                push(v)
+            elif op == CONST:
+                push(consts[arg])
+            elif op == POP:
+                pop()
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                pc = arg
+            elif op == LOOP:
+                if budget is not None:
+                    budget.loop(code.costs[pc - 2])
+                pc = arg
+            elif op == CALL:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                out = self.call(frame, pop(), args)
+                if type(out) is Frame or type(out) is MemoFrame:
+                    frame.pc = pc
+                    frame = out
+                    code = frame.code
+                    ops = code.ops
+                    consts = code.consts
+                    vals = frame.vals
+                    pc = 0
+                else:
+                    push(out)
+            elif op == RETURN:
+                if type(frame) is MemoFrame:
+                    frame.fun.memo.put(frame.key, stack[-1])
+                frame = frame.back
+                if frame is None:
+                    return pop()
+                code = frame.code
+                ops = code.ops
+                consts = code.consts
+                vals = frame.vals
+                pc = frame.pc
+            elif op == ADD:
+                b = pop()
+                push(pop() + b)
+                if quota is not None:
+                    quota.string(frame.fun, stack[-1])
+            elif op == SUB:
+                b = pop()
+                push(pop() - b)
+            elif op == MUL:
+                b = pop()
+                push(pop() * b)
+                if quota is not None:
+                    quota.string(frame.fun, stack[-1])
+            elif op == DIV:
+                b = pop()
+                push(rt.div(pop(), b))
+            elif op == MOD:
+                b = pop()
+                push(pop() % b)
+            elif op == EQ:
+                b = pop()
+                push(pop() == b)
+            elif op == NOT_EQ:
+                b = pop()
+                push(pop() != b)
+            elif op == LT:
+                b = pop()
+                push(pop() < b)
+            elif op == LTE:
+                b = pop()
+                push(pop() <= b)
+            elif op == GT:
+                b = pop()
+                push(pop() > b)
+            elif op == GTE:
+                b = pop()
+                push(pop() >= b)
+            elif op == NOT:
+                push(not pop())
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if not stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    pc = arg
+                else:
+                    pop()
+            elif op == LET:
+                rt.declare(code.names, vals, frame.kinds, arg, rt.LET, stack[-1])
+            elif op == MUT:
+                rt.declare(code.names, vals, frame.kinds, arg, rt.MUT, stack[-1])
+            elif op == SET:
+                rt.check_set(code.names, frame.kinds, arg)
+                vals[arg] = stack[-1]
+            elif op == LOAD_CELL:
+                push(rt.load_cell(code.names, vals, arg))
+            elif op == LET_CELL:
+                rt.declare_cell(code.names, vals, frame.kinds, arg, rt.LET, stack[-1])
+            elif op == MUT_CELL:
+                rt.declare_cell(code.names, vals, frame.kinds, arg, rt.MUT, stack[-1])
+            elif op == SET_CELL:
+                rt.check_set(code.names, frame.kinds, arg)
+                vals[arg].val = stack[-1]
+            elif op == CLOSURE:
+                fun, fcode = consts[arg]
+                push(rt.new_closure(fun, fcode.scope, fcode,
+                                    frame.fun, vals, frame.kinds))
+            elif op == HEAD:
+                push(rt.head(pop()))
+            elif op == TAIL:
+                push(rt.tail(pop()))
+            elif op == PUSH:
+                h = pop()
+                if quota is not None:
+                    quota.push(frame.fun, stack[-1])
+                push(rt.push(h, pop()))
+            elif op == CHECK:
+                consts[arg](stack[-1])
+            elif op == GET:
+                k = pop()
+                push(rt.get(pop(), k))
+            elif op == PUT:
+                v = pop()
+                k = pop()
+                if quota is not None:
+                    quota.put(frame.fun, stack[-1], k)
+                push(rt.put(pop(), k, v))
+            elif op == REMOVE:
+                k = pop()
+                if quota is not None:
+                    quota.remove(frame.fun, stack[-1], k)
+                push(rt.remove(pop(), k))
+            elif op == INTO:
+                l = pop()
+                out, nodes = rt.build_into(pop(), l)
+                if quota is not None:
+                    quota.into(frame.fun, out, nodes)
+                push(out)
+            elif op == BETWEEN:
+                hi = pop()
+                lo = pop()
+                push(rt.between(pop(), lo, hi))
+                if quota is not None:
+                    quota.list(frame.fun, len(stack[-1].elements))
+            elif op == KEYS:
+                push(rt.keys(pop()))
+                if quota is not None:
+                    quota.list(frame.fun, len(stack[-1].elements))
+            elif op == LIST:
+                if arg:
+                    elements = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    elements = []
+                push(rt.make_list(elements))
+                if quota is not None:
+                    quota.list(frame.fun, len(elements))
+            elif op == MAP:
+                if arg:
+                    flat = stack[-2 * arg:]
+                    del stack[-2 * arg:]
+                else:
+                    flat = []
+                push(rt.make_map(zip(flat[1::2], flat[0::2])))
+                if quota is not None:
+                    quota.map(frame.fun, len(stack[-1].mappings))
+            elif op == PRINT:
+                push(rt.print_value(pop()))
+            elif op == TYPE:
+                push(rt.type_of(pop()))
+            elif op == MEMO:
+                push(self.memos.memoize(pop()))
+            elif op == ORDERED:
+                if quota is not None:
+                    quota.ordered(frame.fun, stack[-1])
+                push(rt.make_ordered(pop()))
+            elif op == VEC:
+                if quota is not None:
+                    quota.vec(frame.fun, stack[-1])
+                push(rt.make_vector(pop()))
+            elif op == EXIT:
+                rt.exit()
+            elif op == DECLARED:
+                if frame.kinds[arg] is None:
+                    raise ValueError
+            elif op == DECODE:
+                stack[-1] = rt.decode(stack[-1])
+            else:
+                raise AssertionError("unknown opcode %s" % str(op))
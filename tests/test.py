@@ -73,3 +73,517 @@ node4 = Seq(node1, node3)
 for v in visitors():
     print(v(node4))
 print("**********")
+
+# Test compiled engines
+from swimlang.compiler import Compiler
+from swimlang.vm import VM
+from swimlang.closure_compiler import ClosureCompiler
+from swimlang.codegen import Codegen
+srcs = [src,
+        "(fun fact n: (if (<= n 1) 1 (* n (fact (- n 1))))); (fact 10)",
+        "(fun add a b: (+ a b)); (let inc (add 1)); (inc 41)",
+        "(fun outer: (mut x 1); (fun inner: (set x (+ x 10))); (inner); x); (outer)",
+        "(let m (put {} \"k\" [1 2])); (head (tail (get m \"k\")))",
+        "(mut i 0); (mut s 0); (while (< i 10) (set s (+ s i)); (set i (+ i 1))); s"]
+for s in srcs:
+    node = Parser(Tokenizer(s).tokenize()).parse()
+    expected = Evaluator()(node)
+    actual = VM()(Compiler()(node))
+    print(actual)
+    assert actual == expected
+    assert ClosureCompiler()(node)() == expected
+    run = Codegen()(node)
+    assert run is None or run() == expected
+assert Codegen()(Parser(Tokenizer(srcs[1]).tokenize()).parse()) is not None
+print("**********")
+
+# Test compiled engines evaluate operands in the order of the evaluator
+from swimlang.stack_evaluator import StackEvaluator
+import contextlib
+import io
+ordered_srcs = ["{(print 1): (print 2)}", "(get 14 (print 1))", "(put 1 (print 1) 2)", "(push (print 1) 1)",
+                "(get (print 1) (while (print 2) 0))", "(remove 1 (print 1))",
+                "(between {1: 1} (print 1) (print 2))", "(set zz (print 1))"]
+for s in ordered_srcs:
+    node = Parser(Tokenizer(s).tokenize()).parse()
+    outs = []
+    for run in [Evaluator(), StackEvaluator(), lambda node: VM()(Compiler()(node)),
+                lambda node: ClosureCompiler()(node)(), lambda node: Codegen()(node)()]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            try:
+                run(node)
+            except (TypeError, ValueError) as e:
+                print(type(e).__name__)
+        outs.append(out.getvalue())
+    assert len(set(outs)) == 1, s
+print(outs[0])
+print("**********")
+
+# Test tail calls
+src = "(fun count n a: (if (== n 0) a (count (- n 1) (+ a 1)))); (count 20000 0)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+print(Evaluator()(node))
+assert Evaluator()(node) == 20000
+print("**********")
+
+# Test explicit-stack evaluator
+from swimlang.stack_evaluator import StackEvaluator
+for s in srcs:
+    node = Parser(Tokenizer(s).tokenize()).parse()
+    assert StackEvaluator()(node) == Evaluator()(node)
+src = "(fun len n: (if (== n 0) 0 (+ 1 (len (- n 1))))); (len 20000)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+print(StackEvaluator()(node))
+assert StackEvaluator()(node) == 20000
+print("**********")
+
+# Test top-level scope persisting across programs
+evaluator = Evaluator()
+for s, expected in [("(let x 5)", 5), ("(fun f y: (+ x y))", None), ("(f 2)", 7)]:
+    res = evaluator(Parser(Tokenizer(s).tokenize()).parse())
+    assert expected is None or res == expected
+print(res)
+print("**********")
+
+# Test closures capture only free variables
+from swimlang.resolver import Resolver
+src = "(let a 1); (let b 2); (let c 3); (fun f x: (let b 5); (+ a (+ b x))); (f 1)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+scope = Resolver()(node)
+print(sorted(scope.children[0].free))
+assert scope.children[0].free == {"a"}
+assert Evaluator()(node) == 7
+print("**********")
+
+# Test closures share mut variables
+src = """(fun counter: (mut n 0); (fun inc: (set n (+ n 1)); n));
+(let c (counter)); (c); (c); (c)"""
+node = Parser(Tokenizer(src).tokenize()).parse()
+print(Evaluator()(node))
+assert Evaluator()(node) == 3
+assert StackEvaluator()(node) == 3
+assert VM()(Compiler()(node)) == 3
+assert ClosureCompiler()(node)() == 3
+assert Codegen()(node)() == 3
+print("**********")
+
+# Test repeated partial application
+src = "(fun add3 a b c: (+ a (* b c))); (let f (add3 1)); (let g (f 2)); [(g 3) (g 4) ((f 5) 6)]"
+node = Parser(Tokenizer(src).tokenize()).parse()
+expected = str(Evaluator()(node))
+print(expected)
+assert str(VM()(Compiler()(node))) == expected
+assert str(ClosureCompiler()(node)()) == expected
+assert str(Codegen()(node)()) == expected
+print("**********")
+
+# Test lists and maps hold values rather than nodes
+src = "(let l [1 \"a\" True [2]]); (put {} \"k\" l)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+m = Evaluator()(node)
+print(m)
+l = m.mappings.get("k")
+assert list(l.elements)[:3] == [1, "a", True]
+assert str(l) == str(ClosureCompiler()(node)().mappings.get("k"))
+print("**********")
+
+# Test optimizer
+from swimlang.optimizer import Optimizer
+src = "(if (&& (== \"a\" \"a\") (! False)) (* 2 3) (print 1)); (+ 1 \"a\")"
+node = Optimizer()(Parser(Tokenizer(src).tokenize()).parse())
+print(Printer()(node))
+assert type(node) is Add
+node = Optimizer()(Parser(Tokenizer("(mut x 1); 7; (+ x (* 2 3))").tokenize()).parse())
+assert type(node.second) is Add and node.second.second.val == 6
+assert Evaluator()(node) == 7
+print("**********")
+
+# Test string literals are decoded once at parse time
+src = "(let a \"x\\ty\"); (let b \"x\\ty\"); (if False \"bad\\q\" [a b 300 300])"
+node = Parser(Tokenizer(src).tokenize()).parse()
+l = list(Evaluator()(node).elements)
+print(l)
+assert l[0] == "x\ty" and l[0] is l[1] and l[2] is l[3]
+for s in ["(let x False); (if x \"bad\\q\" 1)", "(fun f: \"bad\\q\"); 1"]:
+    node = Parser(Tokenizer(s).tokenize()).parse()
+    assert VM()(Compiler()(node)) == ClosureCompiler()(node)() == 1
+    assert Codegen()(node) is None
+node = Parser(Tokenizer("\"bad\\q\"").tokenize()).parse()
+for run in [lambda node: VM()(Compiler()(node)), lambda node: ClosureCompiler()(node)()]:
+    try:
+        run(node)
+        assert False
+    except ValueError:
+        pass
+print("**********")
+
+# Test arithmetic nodes specialize on their operand types and deoptimize
+src = "(fun f a b: (+ a b)); [(f 1 2) (f 3 4) (f \"a\" \"b\") (f 5 6)]"
+node = Parser(Tokenizer(src).tokenize()).parse()
+res = Evaluator()(node)
+print(res)
+assert str(res) == "[3 7 \"ab\" 11]"
+assert node.first.body.quick is False
+print("**********")
+
+# Test memo caches results per closure value with LRU eviction
+src = """(fun adder k: (memo (fun g x: (+ x k))));
+(let a (adder 1)); (let b (adder 100));
+(fun fib n: (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))));
+[(a 1) (b 1) (a 1) ((memo fib) 30)]"""
+node = Parser(Tokenizer(src).tokenize()).parse()
+evaluator = Evaluator(memo_size=4)
+res = evaluator(node)
+print(res)
+assert str(res) == "[2 101 2 832040]"
+stats = evaluator.memos.stats()
+assert stats["functions"] == 3 and stats["hits"] == 29 and stats["entries"] == 6
+assert str(VM(memo_size=4)(Compiler()(node))) == str(res)
+assert str(ClosureCompiler(memo_size=4)(node)()) == str(res)
+import swimlang.runtime as rt
+keys = [rt.memo_key(v) for v in [1, True, "1", rt.make_list([1]), rt.make_list([True]),
+                                  rt.make_map([(1, 1)]), rt.make_list([rt.make_list([1])])]]
+assert len(set(keys)) == len(keys)
+src = "(fun f x: x); (let g (memo f)); [(g [1]) (g {1: [1]}) (head (get (g {1: [1]}) 1))]"
+node = Parser(Tokenizer(src).tokenize()).parse()
+assert str(Evaluator()(node)) == str(VM()(Compiler()(node))) == str(ClosureCompiler()(node)())
+src = "(fun f x: x); (let g (memo f)); (g [1 2]); (get (g (vec [1 2])) 1)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+assert Evaluator()(node) == VM()(Compiler()(node)) == ClosureCompiler()(node)() == 2
+src = "(fun f x: x); (let g (memo f)); (g {1: 2}); (between (g (ordered {1: 2})) 0 5)"
+node = Parser(Tokenizer(src).tokenize()).parse()
+assert str(Evaluator()(node)) == str(VM()(Compiler()(node))) == str(ClosureCompiler()(node)()) == "[1]"
+print("**********")
+
+# Test common subexpressions and loop invariants are evaluated once
+from swimlang.cse import CSE
+src = """(let m {"a": 3}); (let a 4); (mut i 0); (mut s 0);
+(while (< i 5) (set s (+ s (* (get m "a") a))); (set i (+ i 1)));
+[s (+ (* a a) 1) (* a a)]"""
+node = Parser(Tokenizer(src).tokenize()).parse()
+expected = str(Evaluator()(node))
+node = CSE()(Optimizer()(Parser(Tokenizer(src).tokenize()).parse()))
+print(Printer()(node))
+assert str(Evaluator()(node)) == expected == "[60 17 16]"
+assert Printer()(node).count("(let _cse") == 2
+print("**********")
+
+# Test small non-recursive functions are inlined at their call sites
+from swimlang.inliner import Inliner
+src = """(fun sq x: (* x x)); (fun fact n: (if (<= n 1) 1 (* n (fact (- n 1)))));
+(mut i 0); (mut s 0); (while (< i 4) (set s (+ s (sq i))); (set i (+ i 1))); [s (sq 5) (fact 4)]"""
+expected = str(Evaluator()(Parser(Tokenizer(src).tokenize()).parse()))
+inliner = Inliner()
+node = inliner(Parser(Tokenizer(src).tokenize()).parse())
+print(inliner.report())
+assert str(Evaluator()(node)) == expected == "[14 25 24]"
+assert inliner.report() == [("sq", 3, 2)]
+from swimlang.interpreter import Interpreter
+for s, name in [("(fun f x: (let x 2); x); (f 1)", "x"), ("(fun f x: (set x 2); x); (f 1)", "x"),
+                ("(fun f x: (let y x); (set y 2); y); (f 1)", "y"),
+                ("(fun f x: (mut i 0); (while (< i 2) (let z i); (set i (+ i 1))); x); (f 1)", "z")]:
+    try:
+        Interpreter(s).interpret()
+        assert False
+    except ValueError as e:
+        assert name in str(e).split(), e
+print("**********")
+
+# Test the code cache tells apart the trees the same source inlines to
+import os
+import tempfile
+src = """(fun mk x: (fun g y: (+ x y)); g); (let a (mk 1)); (fun h z w: (* z w));
+[(a 2) ((h 3) 4) (h 2 5)]"""
+for sizes in [(0, 40), (40, 0)]:
+    with tempfile.TemporaryDirectory() as d:
+        for size in sizes:
+            node = Inliner(size)(Optimizer()(Parser(Tokenizer(src).tokenize()).parse()))
+            value = Codegen(d)(node)()
+            print(size, value)
+            assert str(value) == "[3 12 10]"
+        assert len(os.listdir(d)) == 2
+# Storing a program drops the entries of other versions and the least recently used ones
+import swimlang.codegen as codegen
+with tempfile.TemporaryDirectory() as d:
+    stale = os.path.join(d, "0-0-stale.swimc")
+    open(stale, "wb").close()
+    size = codegen.CACHE_SIZE
+    codegen.CACHE_SIZE = 2
+    try:
+        for i in range(3):
+            node = Optimizer()(Parser(Tokenizer("(+ %d 1)" % i).tokenize()).parse())
+            assert Codegen(d)(node)() == i + 1
+            os.utime(Codegen(d).cache_path(node), (i, i))
+        assert len(os.listdir(d)) == 2 and not os.path.exists(stale)
+        assert not os.path.exists(Codegen(d).cache_path(
+            Optimizer()(Parser(Tokenizer("(+ 0 1)").tokenize()).parse())))
+    finally:
+        codegen.CACHE_SIZE = size
+print("**********")
+
+# Test counted loops run on a native counter and fall back when the counter is rebound
+from swimlang.effects import nodes
+src = """(mut i 0); (mut s 0); (while (< i 10) (set s (+ s i)); (set i (+ i 1)));
+(mut j 0); (fun bump: (set j (+ j 5))); (while (< j 20) (bump); (set j (+ j 1)));
+(mut k 0); (mut n 4); (while (< k n) (set k (+ k 1)); (if (== k 2) (set n True) 0));
+[s j k]"""
+node = Parser(Tokenizer(src).tokenize()).parse()
+res = Evaluator()(node)
+print(res)
+loops = [n for n in nodes(node) if type(n) is While]
+assert [bool(n.quick) for n in loops] == [True, True, True]
+assert str(res) == str(StackEvaluator()(node)) == "[45 24 2]"
+print("**********")
+
+# Test the step budget stops runaway programs after the same number of steps on every engine
+from swimlang.runtime import OutOfSteps
+src = """(fun f n: (if (< n 1) 0 (+ 1 (f (- n 1))))); (mut i 0); (while True (set i (+ i (f 3))))"""
+stats = []
+for run in [lambda node: Evaluator(max_steps=500)(node),
+            lambda node: StackEvaluator(max_steps=500)(node),
+            lambda node: VM(max_steps=500)(Compiler()(node)),
+            lambda node: ClosureCompiler(max_steps=500)(node)()]:
+    try:
+        run(Parser(Tokenizer(src).tokenize()).parse())
+        assert False
+    except OutOfSteps as e:
+        stats.append(dict(e.stats))
+print(stats[0])
+assert all(s == stats[0] for s in stats) and stats[0]["steps"] > 500
+evaluator = Evaluator(max_steps=500)
+assert str(evaluator(Parser(Tokenizer("(fun f n: (* n 2)); [(f 1) (f 2)]").tokenize()).parse())) == "[2 4]"
+assert evaluator.budget.calls == 2 and evaluator.budget.steps < 500
+interpreter = Interpreter("(fun f n: (* n 2)); [(f 1) (f 2)]")
+interpreter.interpret(engine="closure", max_steps=500, max_memory=10**6)
+assert interpreter.budget is not None and interpreter.quota is not None
+assert str(interpreter.interpret(engine="python")) == "[2 4]"
+assert interpreter.budget is None and interpreter.quota is None and interpreter.memos.caches == []
+print("**********")
+
+# Test the memory quota stops a run after the same allocations on every engine
+from swimlang.runtime import OutOfMemory
+import swimlang.runtime as rt
+src = """(fun grow l n: (if (== n 0) l (grow (push n l) (- n 1))));
+(mut m {}); (mut i 0); (mut s ""); (mut l []);
+(while True (set m (put m i s)); (set s (+ s "x")); (set l (grow [] 3)); (set i (+ i 1)))"""
+reports = []
+for run in [lambda node: Evaluator(max_memory=20000)(node),
+            lambda node: StackEvaluator(max_memory=20000)(node),
+            lambda node: VM(max_memory=20000)(Compiler()(node)),
+            lambda node: ClosureCompiler(max_memory=20000)(node)()]:
+    try:
+        run(Parser(Tokenizer(src).tokenize()).parse())
+        assert False
+    except OutOfMemory as e:
+        reports.append((dict(e.stats), e.top))
+print(reports[0])
+assert all(r == reports[0] for r in reports)
+stats, top = reports[0]
+assert stats["bytes"] > 20000 and stats["list_nodes"] > 0 and stats["map_nodes"] > 0
+assert stats["string_bytes"] > 0 and [name for name, _ in top] == ["grow", "<top>"]
+assert rt.P_Tree({1: 1, 64: 2}).put_nodes(64) == 2 and rt.P_Tree({1: 1, 64: 2}).put_nodes(2) == 3
+print("**********")
+
+# Test verified mode checks the tree once and builds and runs it without the constructor checks
+from swimlang.verifier import verify
+from swimlang.interpreter import Interpreter
+src = """(fun f x: (if (< x 3) (+ x 1) [x])); (let m (put {"a": 1} "b" 2)); [(f 1) (f 5) (keys m)]"""
+node = Parser(Tokenizer(src).tokenize()).parse()
+assert verify(node) is node
+expected = str(Evaluator()(node))
+for engine in ["eval", "stack", "vm", "closure"]:
+    assert str(Interpreter(src).interpret(engine=engine, verified=True)) == expected
+import swimlang.ast
+assert swimlang.ast.CHECKS
+bad = Add(Int(1), Int(2))
+bad.second = 2
+for tree in [bad, Seq(Int(1), Let(Var("x"), List([Int(1), bad]))), Print(Node())]:
+    try:
+        verify(tree)
+        assert False
+    except TypeError:
+        pass
+print(expected)
+print("**********")
+
+# Test vectors index and update by position and keep the behavior of lists
+from swimlang.pdstruct import P_Vector
+v = P_Vector()
+versions = []
+for i in range(2000):
+    v = v.append(i)
+    versions.append(v)
+assert list(versions[40]) == list(range(41)) and len(v) == 2000
+assert all(v.nth(i) == i for i in range(2000))
+w = v.assoc(1500, "x")
+assert w.nth(1500) == "x" and v.nth(1500) == 1500 and w.assoc(2000, 1).nth(2000) == 1
+t = v.tail().tail()
+assert t.head() == 2 and len(t) == 1998 and t.push("y").head() == "y" and t.nth(0) == 2
+p = P_Vector()
+for i in range(100):
+    p = p.push(i)
+assert list(p) == list(P_List(list(range(99, -1, -1))))
+assert P_Vector.nodes(2000) == 66 and P_Vector(list(range(2000)))._shift == 10
+src = """(let v (vec [1 2 3]));
+(mut w v); (mut i 3); (while (< i 100) (set w (put w i i)); (set i (+ i 1)));
+[v (get w 99) (put v 0 "a") (head (tail w)) (push 0 v) (== (type v) (type []))]"""
+for engine in ["eval", "stack", "vm", "closure", "python"]:
+    out = Interpreter(src).interpret(engine=engine)
+    assert str(out) == """[[1 2 3] 99 ["a" 2 3] 2 [0 1 2 3] True]""", engine
+for src in ["(get (vec [1 2]) 2)", "(put (vec []) 1 0)", "(get [1 2] 0)", "(vec 1)"]:
+    try:
+        Interpreter(src).interpret()
+        assert False
+    except (TypeError, ValueError):
+        pass
+print(out)
+print("**********")
+
+# Test maps keep their keys in the order of their hashes, share nodes between versions and
+# keep keys with equal hashes apart
+t = P_Tree()
+t1 = t.put(3, "33")
+t2 = t1.put(1, "11")
+t3 = t2.put(2, "22")
+t4 = t3.put(5, "55")
+t5 = t4.put(4, "44")
+assert([(k, t[k]) for k in t] == [])
+assert([(k, t1[k]) for k in t1] == [(3, "33")])
+assert([(k, t2[k]) for k in t2] == [(1, "11"), (3, "33")])
+assert([(k, t3[k]) for k in t3] == [(1, "11"), (2, "22"), (3, "33")])
+assert([(k, t4[k]) for k in t4] == [(1, "11"), (2, "22"), (3, "33"), (5, "55")])
+assert([(k, t5[k]) for k in t5] == [(1, "11"), (2, "22"), (3, "33"), (4, "44"), (5, "55")])
+t = P_Tree({i: i for i in range(-100, 20000)})
+assert list(t) == list(range(-100, 20000)) and t[-100] == -100 and t.put(-5, 0)[-5] == 0
+assert t[-5] == -5 and len(t.put(-5, 0)) == len(t) == 20100 and 20000 not in t
+
+
+def depth(node):
+    if type(node) is P_Tree.Leaf:
+        return 0
+    return 1 + max(depth(c) for c in node.children)
+
+
+assert depth(t._root) <= 4
+t = P_Tree({-1: "a", -2: "b", 1: True, 2.0: 2})
+assert len(t) == 4 and t[-1] == "a" and t[-2] == "b" and t[1] is True and t[True] is True
+t = t.put(True, False)
+assert len(t) == 4 and t[1] is False and list(t.items())[2] == (True, False)
+src = """(mut m {}); (mut i 0); (while (< i 1000) (set m (put m i (* i i))); (set i (+ i 1)));
+[(get m 999) (head (keys m)) (get (put {-1: "a"} -2 "b") -1)]"""
+for engine in ["eval", "stack", "vm", "closure", "python"]:
+    assert str(Interpreter(src).interpret(engine=engine)) == """[998001 0 "a"]""", engine
+print(list(t.items()))
+print("**********")
+
+# Test ordered maps keep their keys sorted and balanced, and list the keys in a range lazily
+from swimlang.pdstruct import P_SortedMap
+t = P_SortedMap()
+for i in range(1000):
+    t = t.put((i * 7919) % 1000, i)
+assert list(t) == list(range(1000)) and t[7919 % 1000] == 1 and len(t) == 1000
+u = t
+for i in range(0, 1000, 2):
+    u = u.remove(i)
+assert list(u) == list(range(1, 1000, 2)) and len(t) == 1000 and 0 in t and 0 not in u
+assert u.remove(0) is u and len(u.put(1, 1)) == 500
+
+
+def height(node):
+    return 0 if node is None else 1 + max(height(node.left), height(node.right))
+
+
+assert height(t._root) <= 15 and height(u._root) <= 13
+rest = t.range(10, 10**9)
+assert next(rest) == (10, t[10]) and next(rest)[0] == 11
+assert [k for k, _ in t.range(995, 2000)] == [995, 996, 997, 998, 999]
+assert [k for k, _ in P_SortedMap({"ab": 1, "b": 2, "abc": 3, "a": 4}).range("ab", "ac")] == ["ab", "abc"]
+assert list(P_Tree({1: 1, 2: 2, 3: 3}).remove(2)) == [1, 3] and len(P_Tree({1: 1}).remove(1)) == 0
+src = """(mut m (ordered {})); (mut i 0);
+(while (< i 100) (set m (put m (% (* i 37) 101) i)); (set i (+ i 1)));
+[(between m 10 20) (keys (remove (ordered {"b": 1 "a": 2}) "c")) (keys (remove {1: 1 2: 2} 1))]"""
+for engine in ["eval", "stack", "vm", "closure", "python"]:
+    out = Interpreter(src).interpret(engine=engine)
+    assert str(out) == """[[10 11 12 13 14 15 16 17 18 19] ["a" "b"] [2]]""", engine
+for src in ["(between {1: 1} 0 2)", "(put (ordered {1: 1}) \"a\" 2)", "(remove [1] 0)", "(ordered 1)"]:
+    try:
+        Interpreter(src).interpret()
+        assert False
+    except TypeError:
+        pass
+print(out)
+print("**********")
+
+# Test transients build the same structures as persistent updates, change only nodes they
+# own in place, and leave the structures they were made from unchanged
+v = P_Vector(list(range(100)))
+t = v.transient()
+for i in range(100, 2000):
+    t.append(i)
+t.assoc(5, "x")
+w = t.persistent()
+assert list(w) == list(range(5)) + ["x"] + list(range(6, 2000)) and list(v) == list(range(100))
+try:
+    t.append(0)
+    assert False
+except ValueError:
+    pass
+m = P_Tree({i: i for i in range(100)})
+t = m.transient()
+for i in range(50, 1000):
+    t.put(i, -i)
+assert t.nodes < 1000 and len(t) == 1000
+n = t.persistent()
+assert list(n.items()) == [(i, i if i < 50 else -i) for i in range(1000)] and m[60] == 60
+s = P_SortedMap({i: i for i in range(100)}).transient()
+for i in range(1000, 0, -3):
+    s.put(i, i)
+assert list(s.persistent()) == sorted(set(range(100)) | set(range(1000, 0, -3)))
+l = P_List([1, 2])
+assert list(l.transient().append(3).push(0).persistent()) == [0, 1, 2, 3] and list(l) == [1, 2]
+src = """(let l [1 2]); (let m (into {1: 0} [[1 1] [2 2]]));
+[(into l l) l (into (vec l) [3]) (keys m) (get m 1) (keys (into (ordered {}) [[2 0] [1 0]]))]"""
+for engine in ["eval", "stack", "vm", "closure", "python"]:
+    out = Interpreter(src).interpret(engine=engine)
+    assert str(out) == """[[1 2 1 2] [1 2] [1 2 3] [1 2] 1 [1 2]]""", engine
+for src in ["(into {} [1])", "(into {} [[1 2 3]])", "(into 1 [])", "(into [] {1: 1})"]:
+    try:
+        Interpreter(src).interpret()
+        assert False
+    except (TypeError, ValueError):
+        pass
+print(out)
+print("**********")
+
+# Test map keys and items are lazy lists that walk the map without recursing
+t = P_Tree({i: -i for i in range(50000)})
+k = t.keys()
+assert k.head() == 0 and k._head._rest is not None and len(k) == 50000
+rest = k.tail().tail()
+assert rest.head() == 2 and list(k)[-1] == 49999 and list(rest) == list(range(2, 50000))
+assert list(t.items())[:2] == [(0, 0), (1, -1)] and str(P_Tree({2: 1, 1: 1}).keys()) == "[1 2]"
+assert len(P_Tree().keys()) == 0 and str(P_Tree().items()) == "[]"
+s = P_SortedMap({"b": 1, "a": 2, "c": 3})
+assert list(s) == ["a", "b", "c"] and list(s.items())[0] == ("a", 2) and len(s.keys()) == 3
+src = """(let m {3: 0 1: 0 2: 0}); (let k (keys m)); [(head (tail k)) k (push 0 (tail k))]"""
+for engine in ["eval", "stack", "vm", "closure", "python"]:
+    out = Interpreter(src).interpret(engine=engine)
+    assert str(out) == """[2 [1 2 3] [0 2 3]]""", engine
+print(out)
+print("**********")
+
+# deep programs run on a large stack and fail cleanly when they recurse too deeply
+from swimlang.util import deep_call
+import sys
+src = "(fun len n: (if (== n 0) 0 (+ 1 (len (- n 1))))); (len %d)"
+out = deep_call(Interpreter(src % 20000).interpret)
+assert out == 20000, out
+try:
+    deep_call(Interpreter(src % 200000).interpret)
+    assert False
+except RecursionError:
+    pass
+assert sys.getrecursionlimit() < 10**6
+print(out)
+print("**********")